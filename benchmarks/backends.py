@@ -0,0 +1,202 @@
+"""Inference backend comparison: speed and accuracy of the vehicle model on each runtime.
+
+Loads yolo11n through inference.load_vehicle_model on PyTorch, ONNX Runtime and OpenVINO,
+in FP32 and INT8 (exporting and caching the artifacts on first use), runs each over frames
+sampled from a gate video with the detectors' classes, confidence threshold and frame width,
+and prints JSON with, per variant:
+
+    latency   p50/p95/p99 per call and frames per second at --batch-size
+    accuracy  agreement with the PyTorch FP32 boxes: recall and precision of boxes matched
+              at IoU >= --iou with the same class, mean IoU and mean confidence change of the
+              matched boxes
+
+and the fastest variant whose recall and precision both reach --min-agreement, i.e. what to
+put in INFERENCE_BACKEND / INFERENCE_INT8 on the machine the script ran on. Only backends
+whose runtime is installed are tried unless --variants names them.
+
+Usage:
+    python benchmarks/backends.py --video gate.mp4 [--frames 200] [--batch-size 1]
+    python benchmarks/backends.py --video gate.mp4 --variants pytorch onnx-int8 openvino-int8
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import cv2
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from end_to_end import summarize  # noqa: E402
+from inference import PYTORCH, available_backends, load_vehicle_model  # noqa: E402
+from tracker import iou  # noqa: E402
+
+# As in the detectors
+VEHICLE_CLASSES = [2, 3, 5, 7]
+CONFIDENCE = 0.5
+TARGET_WIDTH = 1280
+REFERENCE = PYTORCH
+
+
+def variant_names(backends):
+    names = []
+    for backend in backends:
+        names.append(backend)
+        if backend != PYTORCH:
+            names.append(f"{backend}-int8")
+    return names
+
+
+def parse_variant(name):
+    backend, _, precision = name.partition('-')
+    return backend, precision == 'int8'
+
+
+def sample_frames(path, count, stride):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open {path}")
+    frames = []
+    index = 0
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % stride == 0:
+            height, width = frame.shape[:2]
+            if width > TARGET_WIDTH:
+                frame = cv2.resize(frame, (TARGET_WIDTH, int(height * TARGET_WIDTH / width)))
+            frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def detect(model, frames, imgsz):
+    results = model(frames, classes=VEHICLE_CLASSES, conf=CONFIDENCE, imgsz=imgsz, verbose=False)
+    return [[(tuple(map(int, box.xyxy[0])), int(box.cls[0]), float(box.conf[0])) for box in result.boxes]
+            for result in results]
+
+
+def run_variant(name, frames, args):
+    backend, int8 = parse_variant(name)
+    start = time.perf_counter()
+    model = load_vehicle_model(backend=backend, int8=int8, imgsz=args.imgsz)
+    load_s = time.perf_counter() - start
+    for _ in range(3):
+        detect(model, frames[:args.batch_size], args.imgsz)
+
+    calls = []
+    boxes = []
+    for i in range(0, len(frames), args.batch_size):
+        batch = frames[i:i + args.batch_size]
+        start = time.perf_counter()
+        boxes.extend(detect(model, batch, args.imgsz))
+        calls.append(time.perf_counter() - start)
+    total = sum(calls)
+    latency = dict(summarize(calls), fps=round(len(frames) / total, 2) if total else None)
+    return {'load_s': round(load_s, 2), 'latency': latency}, boxes
+
+
+def agreement(reference, candidate, threshold):
+    """Greedy one-to-one matching per frame, most confident reference boxes first"""
+    matched = ref_total = cand_total = 0
+    ious = []
+    conf_deltas = []
+    for ref_boxes, cand_boxes in zip(reference, candidate):
+        ref_total += len(ref_boxes)
+        cand_total += len(cand_boxes)
+        unmatched = list(cand_boxes)
+        for bbox, cls, conf in sorted(ref_boxes, key=lambda box: -box[2]):
+            best, best_iou = None, threshold
+            for other in unmatched:
+                overlap = iou(bbox, other[0])
+                if other[1] == cls and overlap >= best_iou:
+                    best, best_iou = other, overlap
+            if best is None:
+                continue
+            unmatched.remove(best)
+            matched += 1
+            ious.append(best_iou)
+            conf_deltas.append(best[2] - conf)
+    return {
+        'recall': round(matched / ref_total, 4) if ref_total else None,
+        'precision': round(matched / cand_total, 4) if cand_total else None,
+        'mean_iou': round(sum(ious) / len(ious), 4) if ious else None,
+        'mean_confidence_delta': round(sum(conf_deltas) / len(conf_deltas), 4) if conf_deltas else None,
+        'reference_boxes': ref_total,
+        'boxes': cand_total,
+    }
+
+
+def recommend(report, min_agreement):
+    candidates = []
+    for name, result in report['variants'].items():
+        if 'error' in result:
+            continue
+        accuracy = result.get('accuracy')
+        if name != REFERENCE and (accuracy is None or (accuracy['recall'] or 0) < min_agreement or
+                                  (accuracy['precision'] or 0) < min_agreement):
+            continue
+        candidates.append((result['latency']['fps'] or 0, name))
+    if not candidates:
+        return None
+    name = max(candidates)[1]
+    backend, int8 = parse_variant(name)
+    return {'variant': name, 'env': {'INFERENCE_BACKEND': backend, 'INFERENCE_INT8': '1' if int8 else '0'}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video', default='Martin.mp4', help='Gate video with real vehicles')
+    parser.add_argument('--frames', type=int, default=200, help='Frames to sample')
+    parser.add_argument('--stride', type=int, default=5, help='Take every Nth frame of the video')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--variants', nargs='+', help='e.g. pytorch onnx onnx-int8 openvino openvino-int8 '
+                                                      '(default: all with an installed runtime)')
+    parser.add_argument('--iou', type=float, default=0.5, help='IoU for a box to count as the same vehicle')
+    parser.add_argument('--min-agreement', type=float, default=0.95,
+                        help='Recall and precision against PyTorch FP32 a variant needs to be recommended')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    frames = sample_frames(args.video, args.frames, args.stride)
+    if not frames:
+        raise SystemExit(f"No frames read from {args.video}")
+    variants = args.variants or variant_names(available_backends())
+    # The reference runs first so every other variant can be scored against it
+    variants = sorted(variants, key=lambda name: name != REFERENCE)
+
+    report = {'video': args.video, 'frames': len(frames), 'batch_size': args.batch_size, 'imgsz': args.imgsz,
+              'variants': {}}
+    reference = None
+    for name in variants:
+        logging.info(f"Benchmarking {name}")
+        try:
+            result, boxes = run_variant(name, frames, args)
+        except Exception as e:
+            logging.error(f"{name} failed: {e}")
+            report['variants'][name] = {'error': str(e)}
+            continue
+        if name == REFERENCE:
+            reference = boxes
+        elif reference is not None:
+            result['accuracy'] = agreement(reference, boxes, args.iou)
+        report['variants'][name] = result
+    report['recommended'] = recommend(report, args.min_agreement)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
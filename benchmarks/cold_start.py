@@ -0,0 +1,185 @@
+"""Cold-start benchmark: time from launching a detector process to its first plate read.
+
+Each run starts a fresh interpreter that imports local.py, builds the detector, optionally
+warms it up, signals readiness and then processes a gate video until the first plate is
+read. Two configurations are compared:
+
+    before  ultralytics, openalpr and mysql.connector imported up front (as the detectors
+            used to at module level) and no warm-up, so the first frame initialises the model
+    after   lazy imports and the warm-up pass local.py now does before reading frames
+
+The JSON report has, per configuration, the median over --runs of: import, model load and
+warm-up time, time to readiness, latency of the first and second frame, and time to the
+first plate read, all measured from process launch.
+
+By default the stub backends of end_to_end.py are used, with --stub-first-call-ms standing
+in for the one-off initialisation a real model does on its first inference; with stubs
+the "before" imports are skipped if the packages are not installed. --real uses yolo11n.pt
+and OpenALPR (and needs a video with real plates).
+
+Usage:
+    python benchmarks/cold_start.py [--runs 3] [--stub-first-call-ms 1500]
+    python benchmarks/cold_start.py --real --video gate.mp4
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+MODES = ('before', 'after')
+HEAVY_MODULES = ('ultralytics', 'openalpr', 'mysql.connector')
+
+
+def child(args):
+    """One cold start, reporting monotonic timestamps (comparable with the parent's on Linux)"""
+    timeline = {}
+    eager = {}
+    if args.child == 'before':
+        for name in HEAVY_MODULES:
+            start = time.monotonic()
+            try:
+                __import__(name)
+                eager[name] = round(time.monotonic() - start, 3)
+            except ImportError:
+                eager[name] = None
+    import local
+    from end_to_end import StageTimer, build_detector
+    timeline['imported'] = time.monotonic()
+    logging.getLogger().setLevel(logging.WARNING)
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    os.environ['SPOOL_PATH'] = ''
+    options = argparse.Namespace(real=args.real, stub_yolo_ms=args.stub_yolo_ms, stub_ocr_ms=args.stub_ocr_ms,
+                                 stub_first_call_ms=args.stub_first_call_ms, batch_size=1, frame_skip=1,
+                                 motion_gate=False, ocr_workers=0)
+    detector = build_detector(options, os.getcwd(), StageTimer())
+    timeline['built'] = time.monotonic()
+    if args.child == 'after':
+        detector.warm_up()
+    timeline['warmed'] = time.monotonic()
+
+    cap = detector.open_video(args.video)
+    if cap is None:
+        raise SystemExit(f"Cannot open {args.video}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    detector.mark_ready()
+    timeline['ready'] = time.monotonic()
+
+    frame_ms = []
+    frames = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            start = time.monotonic()
+            _, plates = detector.process_frame(frame, frames, fps)
+            frame_ms.append((time.monotonic() - start) * 1000)
+            frames += 1
+            if plates:
+                timeline['first_plate'] = time.monotonic()
+                break
+    finally:
+        cap.release()
+        detector.close()
+    print(json.dumps({'timeline': timeline, 'frame_ms': frame_ms[:2], 'frames': frames,
+                      'eager_imports_s': eager, 'heavy_modules_after_import': loaded}))
+
+
+def launch(args, mode, workdir):
+    command = [sys.executable, os.path.abspath(__file__), '--child', mode, '--video', args.video,
+               '--stub-yolo-ms', str(args.stub_yolo_ms), '--stub-ocr-ms', str(args.stub_ocr_ms),
+               '--stub-first-call-ms', str(args.stub_first_call_ms)]
+    if args.real:
+        command.append('--real')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_ROOT, BENCH_DIR, os.environ.get('PYTHONPATH', '')]))
+    launched = time.monotonic()
+    result = subprocess.run(command, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{result.stderr[-2000:]}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    timeline = {key: value - launched for key, value in report['timeline'].items()}
+    frame_ms = report['frame_ms'] + [None, None]
+    return {
+        'import_s': timeline['imported'],
+        'load_s': timeline['built'] - timeline['imported'],
+        'warmup_s': timeline['warmed'] - timeline['built'],
+        'ready_s': timeline['ready'],
+        'first_frame_ms': frame_ms[0],
+        'second_frame_ms': frame_ms[1],
+        'first_plate_s': timeline.get('first_plate'),
+        'frames_to_first_plate': report['frames'] if 'first_plate' in timeline else None,
+        'eager_imports_s': report['eager_imports_s'],
+        'heavy_modules_after_import': report['heavy_modules_after_import'],
+    }
+
+
+def median_of(runs, key):
+    values = [run[key] for run in runs if run[key] is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video', help='Gate video to read the first plate from (default: synthetic)')
+    parser.add_argument('--runs', type=int, default=3, help='Cold starts per configuration')
+    parser.add_argument('--real', action='store_true', help='Use YOLO and OpenALPR instead of stubs')
+    parser.add_argument('--stub-yolo-ms', type=float, default=20.0, help='Stub detection cost per frame')
+    parser.add_argument('--stub-ocr-ms', type=float, default=30.0, help='Stub OCR cost per crop')
+    parser.add_argument('--stub-first-call-ms', type=float, default=1500.0,
+                        help='One-off stub cost on the first detection call')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    from end_to_end import render_video
+    workdir = tempfile.mkdtemp(prefix='anpr-coldstart-')
+    if args.video:
+        args.video = os.path.abspath(args.video)
+    else:
+        args.video = os.path.join(workdir, 'synthetic.avi')
+        render_video(args.video, 120, 30, 1280, 720, 2, 24)
+
+    runs = {mode: [] for mode in MODES}
+    for _ in range(args.runs):
+        # Interleaved so drifting disk caches or clocks hit both configurations alike
+        for mode in MODES:
+            runs[mode].append(launch(args, mode, workdir))
+
+    keys = ('import_s', 'load_s', 'warmup_s', 'ready_s', 'first_frame_ms', 'second_frame_ms', 'first_plate_s',
+            'frames_to_first_plate')
+    report = {
+        'mode': 'real' if args.real else 'stub',
+        'video': args.video,
+        'runs': args.runs,
+        'config': {'stub_yolo_ms': args.stub_yolo_ms, 'stub_ocr_ms': args.stub_ocr_ms,
+                   'stub_first_call_ms': args.stub_first_call_ms} if not args.real else {},
+    }
+    for mode in MODES:
+        report[mode] = {key: median_of(runs[mode], key) for key in keys}
+        report[mode]['eager_imports_s'] = runs[mode][-1]['eager_imports_s']
+        report[mode]['heavy_modules_after_import'] = runs[mode][-1]['heavy_modules_after_import']
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
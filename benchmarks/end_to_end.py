@@ -0,0 +1,428 @@
+"""Pipeline benchmark: a synthetic gate video through local.py's VehicleAndPlateDetector.
+
+Renders a deterministic video of vehicles with plates driving through the frame, runs the
+detector over it and prints JSON with end-to-end and per-stage FPS, p50/p95/p99 latency
+(end to end = from a frame being decoded to it leaving the pipeline) and peak RSS.
+
+By default YOLO and OpenALPR are replaced by stand-ins: the "detector" finds the synthetic
+vehicles by colour and the "OCR" reads each plate back from the colour code, so the run
+measures the pipeline itself on a CPU-only box. --stub-yolo-ms / --stub-ocr-ms add a fixed
+cost per frame / per crop to approximate real backends. Detections are written to a SQLite
+file in the run's scratch directory instead of MariaDB, through the same DetectionWriter
+(and spool, unless --no-spool). --real loads yolo11n.pt, OpenALPR and the configured DB instead.
+
+Usage:
+    python benchmarks/end_to_end.py [--frames 900] [--vehicles 12] [--batch-size 4] [--pipelined]
+    python benchmarks/end_to_end.py --real --video gate.mp4
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Vehicles are drawn in a saturated red whose blue and green levels encode their index,
+# so the stubs can find them and know which plate they carry
+MARKER_RED = 230
+LEVEL_STEP = 10
+LEVELS = 12
+
+
+def vehicle_colour(index):
+    return (24 + LEVEL_STEP * (index % LEVELS), 24 + LEVEL_STEP * (index // LEVELS % LEVELS), MARKER_RED)
+
+
+def vehicle_index(blue, green):
+    return round((blue - 24) / LEVEL_STEP) + LEVELS * round((green - 24) / LEVEL_STEP)
+
+
+def plate_text(index):
+    letters = 'ABCDEFGHJKLMNPRSTVWXYZ'
+    return (letters[index % 22] + letters[index // 22 % 22] + letters[index // 484 % 22] +
+            f"{(1000 + index * 37) % 10000:04d}")
+
+
+def vehicle_mask(image):
+    image = image.astype(np.int16)
+    return ((image[:, :, 2] - np.maximum(image[:, :, 0], image[:, :, 1])) > 60).astype(np.uint8)
+
+
+def render_video(path, frames, fps, width, height, vehicles, speed, seed=0):
+    """Vehicles enter at the top one after another, spread over three lanes, and leave at the bottom"""
+    rng = np.random.default_rng(seed)
+    background = np.full((height, width, 3), 90, np.uint8)
+    background += rng.integers(0, 20, (height, width, 1), dtype=np.uint8)
+    for x in range(width // 4, width, width // 4):
+        cv2.line(background, (x, 0), (x, height), (200, 200, 200), 3)
+
+    car_w, car_h = width // 6, height // 3
+    travel = height + car_h
+    spacing = max(1, (frames - travel // speed) // max(1, vehicles))
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Cannot write synthetic video to {path}")
+    for frame_number in range(frames):
+        frame = background.copy()
+        for index in range(vehicles):
+            y = (frame_number - index * spacing) * speed - car_h
+            if y < -car_h or y > height:
+                continue
+            x = width // 8 + (index % 3) * width // 4
+            cv2.rectangle(frame, (x, y), (x + car_w, y + car_h), vehicle_colour(index), -1)
+            px, py = x + car_w // 6, y + car_h - car_h // 4
+            cv2.rectangle(frame, (px, py), (px + car_w * 2 // 3, py + car_h // 6), (255, 255, 255), -1)
+            cv2.putText(frame, plate_text(index), (px + 6, py + car_h // 8), cv2.FONT_HERSHEY_SIMPLEX,
+                        car_w / 320, (0, 0, 0), 2)
+        writer.write(frame)
+    writer.release()
+    return [plate_text(index) for index in range(vehicles)]
+
+
+class _Box:
+    def __init__(self, x1, y1, x2, y2):
+        self.xyxy = [(x1, y1, x2, y2)]
+        self.cls = [2]  # COCO car
+        self.conf = [0.9]
+
+
+class _Result:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubYOLO:
+    """Finds the synthetic vehicles by their marker colour; costs delay_ms per frame, plus
+    first_call_ms once to stand in for a real backend's lazy initialisation"""
+
+    def __init__(self, weights=None, delay_ms=0.0, min_area=400, first_call_ms=0.0):
+        self.delay = delay_ms / 1000.0
+        self.min_area = min_area
+        self.first_call = first_call_ms / 1000.0
+
+    def __call__(self, frames, classes=None, conf=0.5, imgsz=640, **kwargs):
+        if isinstance(frames, np.ndarray):
+            frames = [frames]
+        if self.first_call:
+            time.sleep(self.first_call)
+            self.first_call = 0.0
+        if self.delay:
+            time.sleep(self.delay * len(frames))
+        results = []
+        for frame in frames:
+            contours, _ = cv2.findContours(vehicle_mask(frame), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            boxes = []
+            for contour in contours:
+                x, y, w, h = cv2.boundingRect(contour)
+                if w * h >= self.min_area:
+                    boxes.append(_Box(x, y, x + w, y + h))
+            results.append(_Result(boxes))
+        return results
+
+
+class StubAlpr:
+    """Reads a vehicle crop's plate back from its colour code; costs delay_ms per crop"""
+
+    def __init__(self, country=None, config=None, runtime_data=None, delay_ms=0.0):
+        self.delay = delay_ms / 1000.0
+
+    def is_loaded(self):
+        return True
+
+    def unload(self):
+        pass
+
+    def recognize_array(self, jpeg_bytes):
+        crop = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+        return self.recognize_ndarray(crop)
+
+    def recognize_ndarray(self, crop):
+        if self.delay:
+            time.sleep(self.delay)
+        mask = vehicle_mask(crop).astype(bool)
+        if mask.sum() < 50:
+            return {'results': []}
+        blue, green = np.median(crop[mask][:, 0]), np.median(crop[mask][:, 1])
+        h, w = crop.shape[:2]
+        corners = [{'x': w // 6, 'y': h * 3 // 4}, {'x': w * 5 // 6, 'y': h * 3 // 4},
+                   {'x': w * 5 // 6, 'y': h * 11 // 12}, {'x': w // 6, 'y': h * 11 // 12}]
+        return {'results': [{'plate': plate_text(vehicle_index(blue, green)), 'confidence': 92.0,
+                             'coordinates': corners}]}
+
+
+def sqlite_connect(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS vehicle_type (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE);"
+        "CREATE TABLE IF NOT EXISTS parking_entry (id INTEGER PRIMARY KEY AUTOINCREMENT, license_plate TEXT,"
+        " timestamp TEXT, is_entry BOOLEAN, vehicle_type_id INTEGER, confidence REAL);")
+    conn.close()
+    return lambda: sqlite3.connect(path)
+
+
+class StageTimer:
+    """Collects call durations per stage name; thread-safe for the pipelined runner"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def report(self):
+        return {stage: summarize(samples) for stage, samples in sorted(self.samples.items())}
+
+
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    total = sum(ordered)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))] * 1000, 3)
+
+    return {
+        'count': len(ordered),
+        'total_s': round(total, 4),
+        'fps': round(len(ordered) / total, 2) if total else None,  # Calls per second of stage time
+        'p50_ms': pct(50),
+        'p95_ms': pct(95),
+        'p99_ms': pct(99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+class TimedCapture:
+    """FrameSource proxy that times decode and remembers when each frame came out"""
+
+    def __init__(self, cap, timer):
+        self.cap = cap
+        self.timer = timer
+        self.decoded_at = {}
+        self.frames_read = 0
+        self._grab_seconds = 0.0
+
+    def grab(self):
+        start = time.perf_counter()
+        ok = self.cap.grab()
+        if ok:
+            self._grab_seconds = time.perf_counter() - start
+            self.frames_read += 1
+        return ok
+
+    def retrieve(self):
+        start = time.perf_counter()
+        ret, frame = self.cap.retrieve()
+        now = time.perf_counter()
+        if ret:
+            self.timer.record('decode', self._grab_seconds + now - start)
+            self.decoded_at[self.frames_read - 1] = now
+        return ret, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def __getattr__(self, name):
+        return getattr(self.cap, name)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def build_detector(args, workdir, timer):
+    import local
+    from db_writer import DetectionWriter
+    from spool import SpoolReplayer
+
+    if not args.real:
+        local.load_vehicle_model = lambda *a, **kw: StubYOLO(delay_ms=args.stub_yolo_ms,
+                                                             first_call_ms=args.stub_first_call_ms)
+        local.load_alpr = lambda *a: StubAlpr(*a, delay_ms=args.stub_ocr_ms)
+    detector = local.VehicleAndPlateDetector()
+    detector.headless = True
+    detector.batch_size = args.batch_size
+    detector.frame_skip = args.frame_skip
+    if args.motion_gate:
+        detector.enable_motion_gate()
+    if args.ocr_workers:
+        if not args.real:
+            raise SystemExit("--ocr-workers needs --real: worker processes load OpenALPR themselves")
+        detector.enable_ocr_pool(args.ocr_workers)
+
+    if not args.real:
+        # Same writer and spool code, SQLite underneath; the replayer built in __init__ points
+        # at the MariaDB writer, so swap both
+        if detector.spool_replayer is not None:
+            detector.spool_replayer.stop(drain_timeout=0)
+        detector.db_writer = DetectionWriter(sqlite_connect(os.path.join(workdir, 'bench.db')),
+                                             batch_size=detector.db_writer.batch_size,
+                                             flush_interval=detector.db_writer.flush_interval,
+                                             paramstyle='?', metrics=detector.metrics,
+                                             spool=detector.db_writer.spool)
+        detector.metrics.add_collector('db_writer', detector.db_writer.stats)
+    detector.db_writer.write_batch = timer.wrap('db_write', detector.db_writer.write_batch)
+    if detector.spool is not None:
+        if detector.spool_replayer is not None and detector.spool_replayer.is_alive():
+            detector.spool_replayer.stop(drain_timeout=0)
+        detector.spool_replayer = SpoolReplayer(detector.spool, detector.db_writer.write_batch,
+                                                batch_size=detector.db_writer.batch_size)
+        detector.spool_replayer.start()
+
+    detector.detect_vehicles_batch = timer.wrap('detect', detector.detect_vehicles_batch)
+    detector.tracker.update = timer.wrap('track', detector.tracker.update)
+    detector.read_plates = timer.wrap('plates', detector.read_plates)
+    detector.recognize_crops = timer.wrap('ocr', detector.recognize_crops)
+    detector.record_detection = timer.wrap('persist', detector.record_detection)
+    return detector
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='anpr-bench-')
+    video = args.video
+    expected = None
+    if not video:
+        video = os.path.join(workdir, 'synthetic.avi')
+        start = time.perf_counter()
+        expected = render_video(video, args.frames, args.fps, args.width, args.height, args.vehicles, args.speed)
+        logging.info(f"Rendered {args.frames} frames in {time.perf_counter() - start:.1f}s")
+
+    # The detector writes its log, CSVs and spool relative to the working directory
+    os.chdir(workdir)
+    if args.no_spool:
+        os.environ['SPOOL_PATH'] = ''
+        os.environ['FAILED_SPOOL_PATH'] = ''
+    else:
+        os.environ.setdefault('SPOOL_PATH', os.path.join(workdir, 'spool.db'))
+    timer = StageTimer()
+    detector = build_detector(args, workdir, timer)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    captures = []
+    open_video = detector.open_video
+
+    def timed_open_video(path, *args, **kwargs):
+        cap = open_video(path, *args, **kwargs)
+        if cap is not None:
+            cap = TimedCapture(cap, timer)
+            captures.append(cap)
+        return cap
+
+    latencies = []
+    emit_frame = detector.emit_frame
+
+    def timed_emit_frame(frame, vehicles, plates, frame_number, out=None, **kwargs):
+        decoded_at = captures[0].decoded_at.pop(frame_number, None) if captures else None
+        if decoded_at is not None:
+            latencies.append(time.perf_counter() - decoded_at)
+        return emit_frame(frame, vehicles, plates, frame_number, out, **kwargs)
+
+    detector.open_video = timed_open_video
+    detector.emit_frame = timed_emit_frame
+
+    start = time.perf_counter()
+    try:
+        if args.pipelined:
+            detector.process_video_pipelined(video)
+        else:
+            detector.process_video(video)
+        elapsed = time.perf_counter() - start
+    finally:
+        detector.close()
+
+    report = {
+        'mode': 'real' if args.real else 'stub',
+        'runner': 'pipelined' if args.pipelined else 'sequential',
+        'video': args.video or 'synthetic',
+        'config': {
+            'frames': captures[0].frames_read if captures else 0,
+            'batch_size': args.batch_size,
+            'frame_skip': args.frame_skip,
+            'motion_gate': args.motion_gate,
+            'spool': not args.no_spool,
+            'stub_yolo_ms': None if args.real else args.stub_yolo_ms,
+            'stub_ocr_ms': None if args.real else args.stub_ocr_ms,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'end_to_end': dict(summarize(latencies), fps=round(len(latencies) / elapsed, 2) if elapsed else None),
+        'stages': timer.report(),
+        'peak_rss_mb': peak_rss_mb(),
+        'db_writer': detector.db_writer.stats(),
+        'plates': detector.plate_index.stats(),
+        'metrics': detector.metrics.summary(),
+    }
+    if expected is not None and not args.real:
+        conn = sqlite3.connect(os.path.join(workdir, 'bench.db'))
+        recorded = {row[0] for row in conn.execute("SELECT DISTINCT license_plate FROM parking_entry")}
+        conn.close()
+        report['plates'].update({'expected': len(expected), 'recorded': len(recorded),
+                                 'missed': sorted(set(expected) - recorded)})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video', help='Benchmark this file instead of a synthetic video')
+    parser.add_argument('--frames', type=int, default=900)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--vehicles', type=int, default=12)
+    parser.add_argument('--speed', type=int, default=12, help='Synthetic vehicle speed in pixels per frame')
+    parser.add_argument('--real', action='store_true', help='Use YOLO, OpenALPR and MariaDB instead of stubs')
+    parser.add_argument('--stub-yolo-ms', type=float, default=0.0, help='Stub detection cost per frame')
+    parser.add_argument('--stub-ocr-ms', type=float, default=0.0, help='Stub OCR cost per crop')
+    parser.add_argument('--stub-first-call-ms', type=float, default=0.0,
+                        help='One-off stub detection cost on the first call (model initialisation)')
+    parser.add_argument('--pipelined', action='store_true', help='Benchmark process_video_pipelined')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--frame-skip', type=int, default=1)
+    parser.add_argument('--motion-gate', action='store_true')
+    parser.add_argument('--ocr-workers', type=int, default=0)
+    parser.add_argument('--no-spool', action='store_true', help='Write straight to the DB writer')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    parser.add_argument('--verbose', action='store_true', help="Keep the detector's INFO logging")
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    if args.video:
+        args.video = os.path.abspath(args.video)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Concurrency check for the Pi server's in-memory occupancy count (server/app/state.py).
+
+Starts the server app on a throwaway SQLite database and has --threads clients post
+entries and exits at the same time, through both /api/detections (batches) and
+/api/detection (one at a time). Meanwhile another thread changes the occupancy row
+directly, as a manual correction would, so batches hit OccupancyConflict and go through
+the reload-and-retry path in commit_detections(). Once the clients are done and the
+outside changes have stopped, one last detection is posted so any change made after the
+last batch has been picked up.
+
+Then it checks that the count held in memory equals the one stored in
+parking_occupancy, that it equals the outside changes plus every entry minus every exit
+the server accepted, and that parking_entry holds exactly the accepted rows. Exits never
+outnumber the entries before them, so the count is never clamped at zero. Prints a JSON
+report and exits with status 1 if any check fails.
+
+Usage:
+    python benchmarks/occupancy_concurrency.py [--threads 8] [--requests 50] [--batch-size 10]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'server')
+sys.path.insert(0, SERVER_DIR)
+
+VEHICLE_TYPES = ['car', 'truck', 'motorcycle', 'bus']
+
+
+def make_detections(rng, count):
+    """count detections, entries first, so the batch never takes the count below where it started"""
+    exits = rng.randint(0, count // 2)
+    now = datetime.now()
+    return [{
+        'license_plate': ''.join(rng.choice('ABCDEFGHJKLMNPRSTUVWXYZ0123456789') for _ in range(7)),
+        'vehicle_type': rng.choice(VEHICLE_TYPES),
+        'text_confidence': round(rng.uniform(0.5, 1.0), 3),
+        'date': now.strftime('%Y-%m-%d'),
+        'time': now.strftime('%H:%M:%S'),
+        'is_entry': i < count - exits,
+    } for i in range(count)]
+
+
+def client(app, rng, requests, batch_size, accepted, errors, lock):
+    http = app.test_client()
+    for i in range(requests):
+        if i % 4 == 3:
+            # Single entry and exit, like older detectors
+            batches = [make_detections(rng, 1) for _ in range(2)]
+            batches[1][0]['is_entry'] = False
+            responses = [(batch, http.post('/api/detection', json=batch[0])) for batch in batches]
+        else:
+            batch = make_detections(rng, batch_size)
+            responses = [(batch, http.post('/api/detections', json=batch))]
+        for batch, response in responses:
+            with lock:
+                if response.status_code == 200:
+                    accepted.extend(detection['is_entry'] for detection in batch)
+                else:
+                    errors.append(response.get_json())
+
+
+def meddle(db, app, stop, delta, interval, changes):
+    """Change the occupancy row behind the server's back"""
+    from sqlalchemy import text
+    with app.app_context():
+        while not stop.wait(interval):
+            with db.engine.begin() as conn:
+                conn.execute(text("UPDATE parking_occupancy SET occupied_spaces = occupied_spaces + :delta"),
+                             {'delta': delta})
+            changes.append(delta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per client')
+    parser.add_argument('--batch-size', type=int, default=10, help='Detections per /api/detections batch')
+    parser.add_argument('--meddle-interval', type=float, default=0.2,
+                        help='Seconds between outside changes to the occupancy row')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='anpr-occupancy-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'parking.db')
+    # server.py logs to pi_server.log in the working directory
+    os.chdir(workdir)
+    import server
+    logging.getLogger().setLevel(logging.WARNING)
+
+    from sqlalchemy import text
+    app, db, occupancy = server.app, server.db, server.occupancy
+    start_count = occupancy.occupied_spaces
+
+    accepted, errors, changes = [], [], []
+    lock = threading.Lock()
+    stop = threading.Event()
+    meddler = threading.Thread(target=meddle, args=(db, app, stop, 5, args.meddle_interval, changes))
+    clients = [threading.Thread(target=client, args=(app, random.Random(args.seed + i), args.requests,
+                                                     args.batch_size, accepted, errors, lock))
+               for i in range(args.threads)]
+    started = time.perf_counter()
+    meddler.start()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    meddler.join()
+    client(app, random.Random(args.seed - 1), 1, 1, accepted, errors, lock)
+
+    with app.app_context():
+        stored = db.session.execute(
+            text("SELECT occupied_spaces FROM parking_occupancy WHERE id = :id"), {'id': occupancy.row_id}).scalar()
+        entries = db.session.execute(text("SELECT COUNT(*) FROM parking_entry")).scalar()
+    in_memory = occupancy.occupied_spaces
+
+    expected = start_count + sum(changes) + sum(1 if is_entry else -1 for is_entry in accepted)
+    checks = {
+        'in_memory_equals_stored': in_memory == stored,
+        'stored_equals_expected': stored == expected,
+        'entries_equal_accepted': entries == len(accepted),
+        'conflicts_retried': occupancy.conflicts > 0,
+    }
+    report = {
+        'threads': args.threads,
+        'accepted_rows': len(accepted),
+        'failed_requests': len(errors),
+        'outside_changes': len(changes),
+        'conflicts': occupancy.conflicts,
+        'in_memory': in_memory,
+        'stored': stored,
+        'expected': expected,
+        'rows_per_s': round(len(accepted) / elapsed, 1),
+        'checks': checks,
+    }
+    print(json.dumps(report, indent=2))
+    if errors:
+        print(json.dumps(errors[:5], indent=2))
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Micro-benchmark: JPEG round trip vs raw BGR pixels as OpenALPR input.
+
+Times the per-crop input preparation of both paths (cv2.imencode + tobytes vs a
+contiguous copy of the frame slice) and, when OpenALPR is installed, the full
+recognize_array vs recognize_ndarray call.
+
+Usage:
+    python benchmarks/ocr_input.py [--image car.jpg] [--iterations 200]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ocr import encode_crop_jpeg  # noqa: E402
+
+
+def synthetic_frame(width=1280, height=720):
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    cv2.rectangle(frame, (400, 250), (880, 600), (40, 40, 40), -1)
+    cv2.rectangle(frame, (560, 480), (720, 530), (255, 255, 255), -1)
+    cv2.putText(frame, 'ABC1234', (568, 518), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2)
+    return frame
+
+
+def time_call(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'mean_ms': round(statistics.mean(samples), 4),
+        'p50_ms': round(samples[len(samples) // 2], 4),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', help='Frame to crop from (default: synthetic 1280x720)')
+    parser.add_argument('--crop', type=int, nargs=4, default=[400, 250, 880, 600], metavar=('X1', 'Y1', 'X2', 'Y2'))
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    frame = cv2.imread(args.image) if args.image else synthetic_frame()
+    x1, y1, x2, y2 = args.crop
+    crop = frame[y1:y2, x1:x2]
+
+    report = {
+        'crop_shape': list(crop.shape),
+        'iterations': args.iterations,
+        'prepare': {
+            'jpeg': time_call(lambda: encode_crop_jpeg(crop), args.iterations),
+            'raw': time_call(lambda: np.ascontiguousarray(crop), args.iterations),
+        },
+    }
+
+    try:
+        from openalpr import Alpr
+        alpr = Alpr("us", "/etc/openalpr/openalpr.conf", "/usr/local/share/openalpr/runtime_data")
+    except Exception as e:
+        alpr = None
+        report['recognize'] = f'skipped: OpenALPR unavailable ({e})'
+    if alpr is not None and alpr.is_loaded():
+        report['recognize'] = {
+            'jpeg': time_call(lambda: alpr.recognize_array(encode_crop_jpeg(crop)), args.iterations),
+            'raw': time_call(lambda: alpr.recognize_ndarray(np.ascontiguousarray(crop)), args.iterations),
+        }
+        alpr.unload()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
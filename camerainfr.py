@@ -1,16 +1,28 @@
+import argparse
+from startup import ReadinessSignal
 import cv2
 import numpy as np
-from ultralytics import YOLO
-import pandas as pd
 import os
 import logging
 from pathlib import Path
 import time
 from datetime import datetime, timedelta
 import pytz
-import mysql.connector
-from openalpr import Alpr
 from dotenv import load_dotenv
+from db_writer import DetectionWriter, HttpDetectionWriter, make_mysql_connect
+from spool import DetectionSpool, SpoolReplayer
+from tracker import VehicleTracker
+from line_crossing import CountingLine, parse_line, LEFT, RIGHT
+from dedup import PlateDedupIndex
+from ocr import AlprPool, PlateReader, load_alpr
+from inference import load_vehicle_model, BACKENDS, AUTO
+from motion_gate import MotionGate, offset_vehicles, parse_polygon
+from frame_skip import AdaptiveFrameSkip
+from status import StatusReporter
+from metrics import DetectorMetrics, MetricsServer
+from pipeline import StagedPipeline, DROP_OLDEST, BLOCK
+from multicam import MultiCameraRunner, load_cameras
+from capture import FrameSource, AUTO as CAPTURE_AUTO, GSTREAMER, OPENCV
 
 # Load environment variables from .env
 load_dotenv()
@@ -35,31 +47,122 @@ DB_CONFIG = {
 }
 
 class VehicleAndPlateDetector:
-    def __init__(self):
-        # Initialize YOLO model for vehicle detection
-        self.vehicle_model = YOLO('yolo11n.pt')
+    def __init__(self, backend=None, int8=None):
+        # Initialize YOLO model for vehicle detection on INFERENCE_BACKEND (pytorch, onnx,
+        # openvino or auto for the fastest available), as an INT8 export if INFERENCE_INT8=1
+        self.inference_backend = backend or os.getenv('INFERENCE_BACKEND', AUTO)
+        self.inference_int8 = int8 if int8 is not None else os.getenv('INFERENCE_INT8') == '1'
+        self.vehicle_model = load_vehicle_model(backend=self.inference_backend, int8=self.inference_int8)
 
         # Initialize OpenALPR
-        self.alpr = Alpr("us", "/etc/openalpr/openalpr.conf", "/usr/local/share/openalpr/runtime_data")
+        self.alpr = load_alpr()
         if not self.alpr.is_loaded():
             logging.error("Error loading OpenALPR")
             raise RuntimeError("OpenALPR failed to load")
 
+        # Pass crops to OpenALPR as raw BGR pixels instead of re-encoding them as JPEG
+        self.plate_reader = PlateReader(self.alpr, raw_pixels=True)
+        # Optional pool of OpenALPR worker processes (see enable_ocr_pool)
+        self.ocr_pool = None
+
         # Vehicle classes in COCO dataset
         self.vehicle_classes = [2, 3, 5, 7]
         self.vehicle_names = {2: 'car', 3: 'motorcycle', 5: 'bus', 7: 'truck'}
 
         # Performance parameters
         self.target_width = 1280
+        # Capture: the camera is mounted upside down, so frames are flipped on both axes (a cv2.flip
+        # code, None for none) and optionally scaled down to capture_width, in the decoder if possible
+        self.capture_flip = -1
+        self.capture_width = None
+        self.capture_backend = CAPTURE_AUTO
         self.frame_skip = 1
         self.min_plate_confidence = 0.7
         self.duplicate_window = 30  # Seconds to consider as duplicate plate
+        # Plates persisted within duplicate_window, matched exactly or within one OCR misread
+        self.plate_index = PlateDedupIndex(window=self.duplicate_window)
+
+        # Adaptive frame skip: hold processing to target_fps source frames per second
+        # (the source's own fps when None), optionally by lowering YOLO's input size too
+        self.inference_size = 640
+        self.adaptive_frame_skip = False
+        self.adapt_resolution = False
+        self.target_fps = None
+
+        # detector_status pushed to the Pi server's Socket.IO endpoint, if configured
+        self.status_reporter = StatusReporter(os.getenv('PI_SERVER_URL'))
+
+        # Set once the models are warmed up and capture is about to start (see warm_up and
+        # mark_ready); READY_FILE, if set, is where the readiness file is written
+        self.readiness = ReadinessSignal(os.getenv('READY_FILE'))
+        self.warmup_seconds = None
+
+        # Per-stage timings and counters, pushed with detector_status and, when METRICS_PORT
+        # is set, served in Prometheus text format on METRICS_HOST (localhost by default)
+        self.metrics = DetectorMetrics()
+        self.status_reporter.add_source('metrics', self.metrics.summary)
+        self.metrics.add_collector('startup', lambda: {'ready': int(self.readiness.is_set()),
+                                                       'warmup_seconds': self.warmup_seconds})
+        self.metrics_server = None
+        if os.getenv('METRICS_PORT'):
+            self.enable_metrics_server(int(os.getenv('METRICS_PORT')), os.getenv('METRICS_HOST', '127.0.0.1'))
+
+        # Headless mode: no window, and frames are only annotated for an output video
+        # or a debug snapshot every snapshot_interval processed frames (0 disables)
+        self.headless = False
+        self.snapshot_interval = 0
+        self.snapshot_dir = Path(os.getenv('SNAPSHOT_DIR', 'output/snapshots'))
+
+        # Optional motion/ROI gate in front of YOLO (see enable_motion_gate)
+        self.motion_gate = None
+
+        # Pipelined mode: frames buffered between stages, and what to do when full
+        self.pipeline_queue_size = 8
+        self.pipeline_drop_policy = DROP_OLDEST  # or BLOCK
+
+        # Detections are posted in batches, off the detection thread, to the Pi server's
+        # /api/detections (DETECTIONS_URL; defaults to PI_SERVER_URL's), which also keeps the
+        # occupancy and pushes them to the dashboards. With no server URL they are inserted
+        # into MariaDB directly.
+        pi_server_url = os.getenv('PI_SERVER_URL')
+        detections_url = os.getenv('DETECTIONS_URL',
+                                   f"{pi_server_url.rstrip('/')}/api/detections" if pi_server_url else '')
+        writer_options = {
+            'batch_size': int(os.getenv('DB_BATCH_SIZE', 50)),
+            'flush_interval': float(os.getenv('DB_FLUSH_INTERVAL', 1.0)),
+            'metrics': self.metrics,
+        }
+        if detections_url:
+            self.db_writer = HttpDetectionWriter(detections_url, **writer_options)
+        else:
+            self.db_writer = DetectionWriter(make_mysql_connect(DB_CONFIG), **writer_options)
+        self.metrics.add_collector('db_writer', self.db_writer.stats)
+
+        # Unless disabled with an empty SPOOL_PATH, detections land in a local spool first
+        # and are replayed to the server in order, surviving outages of the Pi. Without it they
+        # go straight to the writer, and only batches it fails to write are spooled, at
+        # FAILED_SPOOL_PATH (empty: not at all)
+        self.spool = None
+        self.spool_replayer = None
+        spool_path = os.getenv('SPOOL_PATH', 'spool/detections.db')
+        self.spool_first = bool(spool_path)
+        if not self.spool_first:
+            spool_path = os.getenv('FAILED_SPOOL_PATH', 'spool/failed.db')
+        if spool_path:
+            self.spool = DetectionSpool(spool_path, max_rows=int(os.getenv('SPOOL_MAX_ROWS', 200000)))
+            if not self.spool_first:
+                self.db_writer.spool = self.spool
+            self.spool_replayer = SpoolReplayer(self.spool, self.db_writer.write_batch,
+                                                batch_size=self.db_writer.batch_size,
+                                                max_attempts=int(os.getenv('SPOOL_MAX_ATTEMPTS', 5)))
+            self.spool_replayer.start()
+            self.metrics.add_collector('spool', self.spool_replayer.stats)
 
         # Timezone setup
         self.cdt_timezone = pytz.timezone('America/Chicago')
 
-        # Plate tracking
-        self.plate_tracker = {}
+        # Vehicle tracking: one OCR schedule and one plate result per tracked vehicle
+        self.tracker = VehicleTracker()
 
     def get_current_cdt_datetime(self):
         now_utc = datetime.now(pytz.utc)
@@ -73,138 +176,488 @@ class VehicleAndPlateDetector:
         return relative_size > 0.03
 
     def insert_detection_to_db(self, detection):
-        try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            # Ensure vehicle type exists
-            cursor.execute("SELECT id FROM vehicle_type WHERE name=%s", (detection['vehicle_type'],))
-            result = cursor.fetchone()
-            if result:
-                vehicle_type_id = result[0]
-            else:
-                cursor.execute("INSERT INTO vehicle_type (name) VALUES (%s)", (detection['vehicle_type'],))
-                conn.commit()
-                vehicle_type_id = cursor.lastrowid
-            # Insert parking entry
-            cursor.execute(
-                "INSERT INTO parking_entry (license_plate, timestamp, is_entry, vehicle_type_id, confidence) VALUES (%s, %s, %s, %s, %s)",
-                (
-                    detection['license_plate'],
-                    f"{detection['date']} {detection['time']}",
-                    True,  # or your logic for entry/exit
-                    vehicle_type_id,
-                    detection['text_confidence']
-                )
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            logging.info(f"Inserted detection into DB: {detection}")
-        except Exception as e:
-            logging.error(f"Error inserting detection into DB: {e}")
+        if self.spool_first:
+            self.spool.append(detection)
+        else:
+            # Queued for the background writer; pooled connection, multi-row INSERTs
+            self.db_writer.submit(detection)
 
-    def process_frame(self, frame, frame_number, fps):
-        vehicle_results = self.vehicle_model(frame, classes=self.vehicle_classes, conf=0.5)
-        vis_frame = frame.copy()
-        timestamp = frame_number / fps
-        vehicle_counts = {name: 0 for name in self.vehicle_names.values()}
+    def detect_vehicles(self, frame):
+        return self.detect_vehicles_batch([frame], [self.motion_gate])[0]
 
-        for result in vehicle_results:
-            boxes = result.boxes
-            for box in boxes:
+    def detect_vehicles_batch(self, frames, motion_gates):
+        """Run YOLO once over several frames (e.g. one per camera), each with its own motion gate or None"""
+        batch_vehicles = [[] for _ in frames]
+        # Skip YOLO entirely when nothing moves in the lane, and only look inside its ROI
+        to_detect = []  # (index in batch, frame or ROI crop, x offset, y offset)
+        for i, (frame, gate) in enumerate(zip(frames, motion_gates)):
+            if gate is None:
+                to_detect.append((i, frame, 0, 0))
+                continue
+            start = time.perf_counter()
+            box = gate.check(frame)
+            self.metrics.observe('motion_gate', time.perf_counter() - start)
+            if box is None:
+                self.metrics.count('frames_gated')
+            else:
+                x1, y1, x2, y2 = box
+                to_detect.append((i, frame[y1:y2, x1:x2], x1, y1))
+        if not to_detect:
+            return batch_vehicles
+
+        # One Results object per input frame, returned in input order
+        start = time.perf_counter()
+        vehicle_results = self.vehicle_model([crop for _, crop, _, _ in to_detect],
+                                             classes=self.vehicle_classes, conf=0.5,
+                                             imgsz=self.inference_size)
+        self.metrics.observe('yolo', time.perf_counter() - start)
+        for (i, _, x_offset, y_offset), result in zip(to_detect, vehicle_results):
+            vehicles = []
+            for box in result.boxes:
                 x1, y1, x2, y2 = map(int, box.xyxy[0])
-                confidence = float(box.conf[0])
                 class_id = int(box.cls[0])
-                vehicle_name = self.vehicle_names.get(class_id, 'unknown')
-                vehicle_counts[vehicle_name] += 1
-
-                cv2.rectangle(vis_frame, (x1, y1), (x2, y2), (0, 255, 0), 1)
-                cv2.putText(vis_frame, f'{vehicle_name}: {confidence:.2f}', (x1, y1-10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-
-                if self.is_optimal_for_plate_detection((x1, y1, x2-x1, y2-y1), frame.shape):
-                    try:
-                        vehicle_region = frame[y1:y2, x1:x2]
-                        ret, jpeg_bytes = cv2.imencode('.jpg', vehicle_region)
-                        if not ret:
-                            continue
-                        results = self.alpr.recognize_array(jpeg_bytes.tobytes())
-                        for plate in results['results']:
-                            plate_text = plate['plate']
-                            text_confidence = plate['confidence'] / 100.0
-                            if (text_confidence >= self.min_plate_confidence and
-                                4 <= len(plate_text) <= 8 and
-                                any(c.isalpha() for c in plate_text) and
-                                any(c.isdigit() for c in plate_text)):
-                                # Draw plate polygon/rectangle
-                                coords = plate['coordinates']
-                                if len(coords) == 4:
-                                    pts = np.array([[x1 + c['x'], y1 + c['y']] for c in coords], np.int32)
-                                    pts = pts.reshape((-1, 1, 2))
-                                    cv2.polylines(vis_frame, [pts], isClosed=True, color=(0, 0, 255), thickness=2)
-                                    # Put plate text above the box
-                                    min_y = min([y1 + c['y'] for c in coords])
-                                    min_x = min([x1 + c['x'] for c in coords])
-                                    cv2.putText(vis_frame, f'{plate_text}', (min_x, min_y - 10),
-                                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                                current_date, current_time = self.get_current_cdt_datetime()
-                                detection = {
-                                    'date': current_date,
-                                    'time': current_time,
-                                    'license_plate': plate_text,
-                                    'text_confidence': round(text_confidence, 2),
-                                    'vehicle_type': vehicle_name,
-                                    'vehicle_confidence': round(confidence, 2),
-                                    'frame_number': frame_number,
-                                    'timestamp': round(timestamp, 2)
-                                }
-                                self.insert_detection_to_db(detection)
-                                logging.info(f"Detected plate: {plate_text} (confidence: {text_confidence:.2f})")
-                    except Exception as e:
-                        logging.warning(f"Plate detection error: {str(e)}")
-                        continue
+                vehicles.append({
+                    'bbox': (x1, y1, x2, y2),
+                    'confidence': float(box.conf[0]),
+                    'vehicle_type': self.vehicle_names.get(class_id, 'unknown'),
+                })
+            batch_vehicles[i] = offset_vehicles(vehicles, x_offset, y_offset)
+        return batch_vehicles
+
+    def recognize_crops(self, crops):
+        """OCR vehicle crops, in parallel when the OCR pool is enabled; results keep crop order"""
+        if self.ocr_pool is not None:
+            return self.ocr_pool.recognize_many(crops)
+        results = []
+        for crop in crops:
+            try:
+                results.append(self.plate_reader.recognize(crop))
+            except Exception as e:
+                logging.warning(f"Plate detection error: {str(e)}")
+                results.append({'results': []})
+        return results
+
+    def read_plates(self, frame, vehicles, frame_number, fps, tracker=None):
+        tracker = tracker or self.tracker
+        timestamp = frame_number / fps
+        candidates = []
+        for vehicle in vehicles:
+            x1, y1, x2, y2 = vehicle['bbox']
+            if not self.is_optimal_for_plate_detection((x1, y1, x2-x1, y2-y1), frame.shape):
+                continue
+            # Only a few OCR samples per tracked vehicle, none once its plate is locked in
+            if not tracker.schedule_ocr(vehicle['track_id'], frame_number):
+                continue
+            candidates.append(vehicle)
 
+        if not candidates:
+            return []
+        start = time.perf_counter()
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in (vehicle['bbox'] for vehicle in candidates)]
+        crops_done = time.perf_counter()
+        # OCR time includes preparing the crops for OpenALPR (contiguous copy or JPEG encode)
+        ocr_results = self.recognize_crops(crops)
+        self.metrics.observe('crop', crops_done - start)
+        self.metrics.observe('ocr', time.perf_counter() - crops_done)
+        self.metrics.count('ocr_crops', len(crops))
+        plates = []
+        for vehicle, results in zip(candidates, ocr_results):
+            x1, y1, x2, y2 = vehicle['bbox']
+            try:
+                for plate in results['results']:
+                    plate_text = plate['plate']
+                    text_confidence = plate['confidence'] / 100.0
+                    if (text_confidence >= self.min_plate_confidence and
+                        4 <= len(plate_text) <= 8 and
+                        any(c.isalpha() for c in plate_text) and
+                        any(c.isdigit() for c in plate_text)):
+                        current_date, current_time = self.get_current_cdt_datetime()
+                        detection = {
+                            'date': current_date,
+                            'time': current_time,
+                            'license_plate': plate_text,
+                            'text_confidence': round(text_confidence, 2),
+                            'vehicle_type': vehicle['vehicle_type'],
+                            'vehicle_confidence': round(vehicle['confidence'], 2),
+                            'frame_number': frame_number,
+                            'timestamp': round(timestamp, 2),
+                            'track_id': vehicle['track_id']
+                        }
+                        # Plate corners in full-frame coordinates, for drawing
+                        points = [(x1 + c['x'], y1 + c['y']) for c in plate['coordinates']]
+                        plates.append({'detection': detection, 'points': points})
+            except Exception as e:
+                logging.warning(f"Plate detection error: {str(e)}")
+                continue
+        return plates
+
+    def save_detection(self, detection, plate_index=None):
+        # The same vehicle seen again (re-acquired track, misread character) is not a new record
+        start = time.perf_counter()
+        is_new = (plate_index or self.plate_index).observe(detection)
+        self.metrics.observe('dedup', time.perf_counter() - start)
+        if not is_new:
+            self.metrics.count('plates_duplicate')
+            logging.debug(f"Duplicate plate {detection['license_plate']} (track {detection['track_id']})")
+            return
+        self.metrics.count('plates_emitted')
+        self.insert_detection_to_db(detection)
+        camera = f"camera {detection['camera']}, " if 'camera' in detection else ''
+        direction = {True: 'entry ', False: 'exit '}.get(detection.get('is_entry'), '')
+        logging.info(f"Detected {direction}plate: {detection['license_plate']} (confidence: {detection['text_confidence']:.2f}, "
+                     f"{camera}track {detection['track_id']})")
+
+    def draw_detections(self, frame, vehicles, plates):
+        vis_frame = frame.copy()
+        for vehicle in vehicles:
+            x1, y1, x2, y2 = vehicle['bbox']
+            cv2.rectangle(vis_frame, (x1, y1), (x2, y2), (0, 255, 0), 1)
+            cv2.putText(vis_frame, f"{vehicle['vehicle_type']} #{vehicle['track_id']}: {vehicle['confidence']:.2f}", (x1, y1-10),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        for plate in plates:
+            # Draw plate polygon/rectangle
+            points = plate['points']
+            if len(points) == 4:
+                pts = np.array(points, np.int32).reshape((-1, 1, 2))
+                cv2.polylines(vis_frame, [pts], isClosed=True, color=(0, 0, 255), thickness=2)
+                # Put plate text above the box
+                min_x = min(x for x, _ in points)
+                min_y = min(y for _, y in points)
+                cv2.putText(vis_frame, plate['detection']['license_plate'], (min_x, min_y - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         return vis_frame
 
+    def wants_annotation(self, frame_number, writing_video=False):
+        """Only draw when something will look at the result"""
+        return (not self.headless or writing_video or
+                bool(self.snapshot_interval and frame_number % self.snapshot_interval == 0))
+
+    def emit_frame(self, frame, vehicles, plates, frame_number, out=None, camera=None):
+        """Annotate the frame for its consumers (window, output video, debug snapshots).
+        camera names the window and snapshots when several cameras are shown.
+        Returns False if the user asked to quit."""
+        if not self.wants_annotation(frame_number, out is not None):
+            return True
+        vis_frame = self.draw_detections(frame, vehicles, plates)
+        if out is not None:
+            out.write(vis_frame)
+        if self.snapshot_interval and frame_number % self.snapshot_interval == 0:
+            self.snapshot_dir.mkdir(exist_ok=True, parents=True)
+            prefix = f'{camera}_' if camera else ''
+            cv2.imwrite(str(self.snapshot_dir / f'{prefix}frame_{frame_number:08d}.jpg'), vis_frame)
+        if not self.headless:
+            title = 'Vehicle and License Plate Detection'
+            cv2.imshow(f'{title} - {camera}' if camera else title, vis_frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                return False
+        return True
+
+    def close_windows(self):
+        if not self.headless:
+            cv2.destroyAllWindows()
+
+    def process_frame(self, frame, frame_number, fps):
+        vehicles = self.detect_vehicles(frame)
+        ended = self.tracker.update(vehicles, frame_number)
+        plates = self.read_plates(frame, vehicles, frame_number, fps)
+        for detection in self.tracker.collect(plates, ended):
+            self.save_detection(detection)
+        return vehicles, plates
+
+    def flush_tracks(self):
+        # Vehicles still in view never ended their track; keep their best reads
+        for detection in self.tracker.flush():
+            self.save_detection(detection)
+
+    def open_source(self, source, buffers=2):
+        """FrameSource for `source` with the camera's flip and capture width applied while decoding"""
+        cap = FrameSource(source, target_width=self.capture_width, flip=self.capture_flip, buffers=buffers,
+                          backend=self.capture_backend, metrics=self.metrics)
+        if not cap.open():
+            return None
+        self.metrics.add_collector('capture', cap.stats)
+        return cap
+
     def run(self, video_path=0):
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            logging.error(f"Failed to open video/camera: {video_path}")
+        cap = self.open_source(video_path)
+        if cap is None:
             return
 
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        fps = cap.fps
         frame_count = 0
+        controller = self.create_frame_skip_controller(fps)
         logging.info(f"Starting video/camera processing.")
 
         try:
             while cap.isOpened():
+                if frame_count % self.frame_skip != 0:
+                    # Skipped frames are taken off the stream but never converted or flipped
+                    if not cap.grab():
+                        break
+                    self.metrics.count('frames_read')
+                    self.metrics.count('frames_skipped')
+                else:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    self.metrics.count('frames_read')
+                    # Time from here on is processing; the read above may have waited on the camera
+                    start = time.perf_counter()
+                    vehicles, plates = self.process_frame(frame, frame_count, fps)
+                    keep_going = self.emit_frame(frame, vehicles, plates, frame_count)
+                    self.frame_processed(controller, busy=time.perf_counter() - start)
+                    if not keep_going:
+                        break
+
+                frame_count += 1
+        except Exception as e:
+            logging.error(f"Processing error: {str(e)}")
+        finally:
+            self.flush_tracks()
+            cap.release()
+            self.close_windows()
+            logging.info(f"Processing completed. Processed {frame_count} frames, capture {cap.stats()}")
+            if self.motion_gate is not None:
+                logging.info(f"Motion gate: {self.motion_gate.stats()}")
+
+    def run_pipelined(self, video_path=0):
+        """Like run(), but capture, detection, OCR and DB writes each get their own worker
+        so a slow OCR call or DB insert no longer stalls the camera buffer"""
+        # Enough capture buffers for every frame the pipeline can hold
+        cap = self.open_source(video_path, buffers=StagedPipeline.max_in_flight(self.pipeline_queue_size))
+        if cap is None:
+            return
+
+        fps = cap.fps
+        frame_count = 0
+        controller = self.create_frame_skip_controller(fps)
+        logging.info(f"Starting pipelined video/camera processing "
+                     f"(queue size {self.pipeline_queue_size}, policy {self.pipeline_drop_policy}).")
+
+        def read_frame():
+            nonlocal frame_count
+            while cap.isOpened():
+                frame_number = frame_count
+                if frame_number % self.frame_skip != 0:
+                    if not cap.grab():
+                        return None
+                    frame_count += 1
+                    self.metrics.count('frames_read')
+                    self.metrics.count('frames_skipped')
+                    continue
                 ret, frame = cap.read()
                 if not ret:
-                    break
+                    return None
+                frame_count += 1
+                self.metrics.count('frames_read')
+                return frame_number, frame
+            return None
 
-                # Flip the frame horizontally and vertically
-                frame = cv2.flip(frame, -1)
+        def detect(item):
+            frame_number, frame = item
+            vehicles = self.detect_vehicles(frame)
+            ended = self.tracker.update(vehicles, frame_number)
+            return frame_number, frame, vehicles, ended
 
-                if frame_count % self.frame_skip == 0:
-                    processed_frame = self.process_frame(frame, frame_count, fps)
-                    cv2.imshow('Vehicle and License Plate Detection', processed_frame)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        break
+        def recognize(item):
+            frame_number, frame, vehicles, ended = item
+            return frame_number, frame, vehicles, ended, self.read_plates(frame, vehicles, frame_number, fps)
 
-                frame_count += 1
+        busy = 0.0
+
+        def persist(item):
+            nonlocal busy
+            _, _, _, ended, plates = item
+            for detection in self.tracker.collect(plates, ended):
+                self.save_detection(detection)
+            # Stages overlap, so a frame costs what the busiest one spends on it
+            previous, busy = busy, pipeline.busy_time()
+            self.frame_processed(controller, busy=busy - previous)
+            return item
+
+        pipeline = StagedPipeline(read_frame, detect, recognize, persist,
+                                  queue_size=self.pipeline_queue_size,
+                                  drop_policy=self.pipeline_drop_policy)
+        self.metrics.add_collector('pipeline', lambda: {f"{name}_{key}": value
+                                                        for name, stats in pipeline.stats().items()
+                                                        for key, value in stats.items()})
+        pipeline.start()
+        try:
+            for frame_number, frame, vehicles, _, plates in pipeline.results():
+                if not self.emit_frame(frame, vehicles, plates, frame_number):
+                    pipeline.stop()
         except Exception as e:
             logging.error(f"Processing error: {str(e)}")
         finally:
+            pipeline.close()
+            self.flush_tracks()
             cap.release()
-            cv2.destroyAllWindows()
+            self.close_windows()
             logging.info(f"Processing completed. Processed {frame_count} frames")
+            if self.motion_gate is not None:
+                logging.info(f"Motion gate: {self.motion_gate.stats()}")
+
+    def warm_up(self, batch=1, runs=2):
+        """Push blank frames through YOLO and OpenALPR before capture starts. The first calls
+        build the predictor, initialise CUDA/cuDNN and grow allocators; done here, that time
+        is not taken out of the first vehicles at the gate"""
+        start = time.perf_counter()
+        frame = np.zeros((self.target_width * 9 // 16, self.target_width, 3), dtype=np.uint8)
+        for _ in range(runs):
+            self.vehicle_model([frame] * batch, classes=self.vehicle_classes, conf=0.5, imgsz=self.inference_size)
+        crop = frame[:frame.shape[0] // 2, :frame.shape[1] // 4]
+        self.recognize_crops([crop] * (self.ocr_pool.size if self.ocr_pool is not None else 1))
+        self.warmup_seconds = time.perf_counter() - start
+        logging.info(f"Warm-up done in {self.warmup_seconds:.2f}s (batch {batch}, imgsz {self.inference_size})")
+
+    def mark_ready(self):
+        self.readiness.set(warmup_seconds=self.warmup_seconds)
+        self.status_reporter.update(ready=True)
+
+    def create_frame_skip_controller(self, fps):
+        controller = AdaptiveFrameSkip(fps, target_fps=self.target_fps, adaptive=self.adaptive_frame_skip,
+                                       adapt_resolution=self.adapt_resolution)
+        controller.frame_skip = self.frame_skip
+        self.status_reporter.update(running=True)
+        self.status_reporter.start()
+        # Every runner gets here once its source is open, right before reading frames
+        self.mark_ready()
+        return controller
+
+    def frame_processed(self, controller, frames=1, busy=None):
+        self.metrics.count('frames_processed', frames)
+        if controller.frame_processed(frames, busy):
+            self.frame_skip = controller.frame_skip
+            self.inference_size = controller.inference_size
+        self.status_reporter.update(**controller.status())
+
+    def enable_ocr_pool(self, size):
+        """OCR crops in `size` OpenALPR worker processes instead of self.alpr alone"""
+        self.ocr_pool = AlprPool(size, raw_pixels=self.plate_reader.raw_pixels)
+        self.metrics.add_collector('ocr_pool', self.ocr_pool.stats)
+
+    def enable_motion_gate(self, roi=None):
+        """Skip detection on frames where nothing moves inside the lane's ROI polygon
+        (points in processed-frame pixels), and crop to the ROI before running YOLO"""
+        self.motion_gate = MotionGate(roi=roi)
+        self.metrics.add_collector('motion_gate', self.motion_gate.stats)
+
+    def enable_metrics_server(self, port, host='127.0.0.1'):
+        self.metrics_server = MetricsServer(self.metrics, port, host, ready=self.readiness.is_set)
+        self.metrics_server.start()
+
+    def enable_counting_line(self, line, entry_side=RIGHT):
+        """Record a vehicle only when it crosses `line` (two points in processed-frame pixels),
+        as an entry if it moves onto entry_side and an exit otherwise"""
+        self.tracker = VehicleTracker(line=CountingLine(*line, entry_side=entry_side))
+
+    def close(self):
+        """Flush detections still waiting for the database"""
+        if hasattr(self, 'readiness'):
+            self.readiness.clear()
+        if hasattr(self, 'plate_index'):
+            logging.info(f"Plate dedup: {self.plate_index.stats()}")
+        if hasattr(self, 'status_reporter'):
+            self.status_reporter.update(running=False, fps=0)
+            self.status_reporter.stop()
+        # The writer first: a batch it fails to write on the way out still goes to the spool
+        if hasattr(self, 'db_writer'):
+            self.db_writer.close()
+        if getattr(self, 'spool_replayer', None):
+            self.spool_replayer.stop()
+            self.spool.close()
+        if getattr(self, 'ocr_pool', None):
+            self.ocr_pool.close()
+            self.ocr_pool = None
+        if getattr(self, 'metrics_server', None):
+            self.metrics_server.stop()
 
     def __del__(self):
         if hasattr(self, 'alpr') and self.alpr:
             self.alpr.unload()
 
 if __name__ == "__main__":
-    detector = VehicleAndPlateDetector()
-    detector.run(0)  # Use 0 for webcam, or provide video file path
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Real-time vehicle and license plate detection')
+    parser.add_argument('source', nargs='?', default='0', help='Camera index or video file path')
+    parser.add_argument('--cameras', help='JSON list of cameras (name, source, role entry/exit, roi, flip) '
+                                          'to run from one process and one model; overrides source')
+    parser.add_argument('--motion-gate', action='store_true',
+                        help='Skip YOLO on frames without motion inside the ROI')
+    parser.add_argument('--roi', type=parse_polygon,
+                        help='Lane polygon as "x1,y1;x2,y2;x3,y3;..." in processed-frame pixels')
+    parser.add_argument('--line', type=parse_line,
+                        help='Counting line as "x1,y1;x2,y2"; entry/exit comes from the direction vehicles cross it')
+    parser.add_argument('--entry-side', choices=[LEFT, RIGHT], default=RIGHT,
+                        help='Side of the line (facing from its first point to its second) that is inside the lot')
+    parser.add_argument('--adaptive-skip', action='store_true',
+                        help='Raise/lower frame skip to keep up with the source (or --target-fps)')
+    parser.add_argument('--adapt-resolution', action='store_true',
+                        help='Let the adaptive controller also lower YOLO inference size')
+    parser.add_argument('--target-fps', type=float, help='Source frames per second to keep up with')
+    parser.add_argument('--headless', action='store_true',
+                        help='No preview window; only annotate frames that are written somewhere')
+    parser.add_argument('--snapshot-every', type=int, default=0,
+                        help='Save an annotated debug snapshot every N processed frames')
+    parser.add_argument('--ocr-workers', type=int, default=0,
+                        help='OCR crops in this many OpenALPR worker processes (0: in-process)')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Serve Prometheus metrics on this local port (also METRICS_PORT)')
+    parser.add_argument('--backend', choices=BACKENDS + (AUTO,),
+                        help='Vehicle model runtime (also INFERENCE_BACKEND; default auto)')
+    parser.add_argument('--int8', action='store_true',
+                        help='Use an INT8 export with onnx/openvino (also INFERENCE_INT8=1)')
+    parser.add_argument('--ready-file', help='Write this file once ready to process frames (also READY_FILE)')
+    parser.add_argument('--no-warmup', action='store_true',
+                        help='Skip the warm-up pass; the first frames then pay for model initialisation')
+    parser.add_argument('--capture-width', type=int,
+                        help='Scale frames wider than this down while decoding (default: native resolution)')
+    parser.add_argument('--capture-backend', choices=[CAPTURE_AUTO, GSTREAMER, OPENCV], default=CAPTURE_AUTO,
+                        help='Decode through a GStreamer pipeline that flips/scales, or OpenCV plus one fused pass')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='Run capture, detection, OCR and DB writes as separate workers')
+    parser.add_argument('--queue-size', type=int, default=8, help='Frames buffered between pipeline stages')
+    parser.add_argument('--drop-policy', choices=[DROP_OLDEST, BLOCK], default=DROP_OLDEST,
+                        help='What the pipeline does when detection falls behind capture')
+    args = parser.parse_args()
+    if args.cameras and args.line:
+        # Each lane builds its own tracker from the cameras file
+        parser.error('--line applies to a single camera; with --cameras give each lane a "line" '
+                     '(and "entry_side") in the cameras file')
+
+    source = int(args.source) if args.source.isdigit() else args.source  # 0 for webcam, or a video file path
+    detector = VehicleAndPlateDetector(backend=args.backend, int8=args.int8 or None)
+    if args.motion_gate or args.roi:
+        detector.enable_motion_gate(args.roi)
+    if args.line:
+        detector.enable_counting_line(args.line, args.entry_side)
+    detector.adaptive_frame_skip = args.adaptive_skip or args.adapt_resolution
+    detector.adapt_resolution = args.adapt_resolution
+    detector.target_fps = args.target_fps
+    detector.headless = args.headless
+    detector.snapshot_interval = args.snapshot_every
+    if args.ocr_workers > 0:
+        detector.enable_ocr_pool(args.ocr_workers)
+    detector.pipeline_queue_size = args.queue_size
+    if args.metrics_port and detector.metrics_server is None:
+        detector.enable_metrics_server(args.metrics_port)
+    detector.pipeline_drop_policy = args.drop_policy
+    detector.capture_width = args.capture_width
+    detector.capture_backend = args.capture_backend
+    if args.ready_file:
+        detector.readiness.path = Path(args.ready_file)
+    try:
+        cameras = None
+        if args.cameras:
+            cameras = load_cameras(args.cameras, motion_gate=args.motion_gate,
+                                   duplicate_window=detector.duplicate_window)
+        if not args.no_warmup:
+            # Multi-camera cycles send one frame per camera to YOLO in a single call
+            detector.warm_up(batch=len(cameras) if cameras else 1)
+        if cameras:
+            MultiCameraRunner(detector, cameras).run()
+        elif args.pipelined:
+            detector.run_pipelined(source)
+        else:
+            detector.run(source)
+    finally:
+        detector.close()
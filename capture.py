@@ -0,0 +1,261 @@
+import functools
+import logging
+import os
+import shutil
+import subprocess
+import time
+
+import cv2
+
+AUTO = 'auto'
+GSTREAMER = 'gstreamer'
+OPENCV = 'opencv'
+
+# cv2.flip codes as GStreamer videoflip methods and Jetson nvvidconv flip-methods
+VIDEOFLIP_METHODS = {-1: 'rotate-180', 0: 'vertical-flip', 1: 'horizontal-flip'}
+NVVIDCONV_FLIP_METHODS = {-1: 2, 0: 6, 1: 4}
+
+
+@functools.lru_cache(maxsize=None)
+def has_gstreamer():
+    """Whether this OpenCV build can open GStreamer pipelines"""
+    for line in cv2.getBuildInformation().splitlines():
+        if line.strip().startswith('GStreamer:'):
+            return 'YES' in line
+    return False
+
+
+@functools.lru_cache(maxsize=None)
+def has_gstreamer_element(name):
+    inspect = shutil.which('gst-inspect-1.0')
+    if inspect is None:
+        return False
+    return subprocess.run([inspect, name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+
+
+def is_pipeline(source):
+    return isinstance(source, str) and '!' in source
+
+
+def is_stream(source):
+    return isinstance(source, str) and source.split('://')[0].lower() in ('rtsp', 'rtsps', 'http', 'https')
+
+
+def scaled_size(width, height, target_width):
+    """Output size for a width x height source; only ever scales down, like the detectors always have"""
+    if not target_width or width <= target_width:
+        return width, height
+    return target_width, int(height * target_width / width)
+
+
+def gstreamer_pipeline(source, size=None, flip=None):
+    """Decode pipeline for a camera index, file or stream URL that flips and scales before
+    handing BGR frames to OpenCV. On a Jetson nvvidconv does both in hardware; elsewhere
+    videoflip and videoscale do them on the decoder's YUV output, so the one colour conversion
+    runs on the small frame. size=None keeps the source size."""
+    if isinstance(source, int):
+        head = f"v4l2src device=/dev/video{source} ! decodebin"
+    else:
+        uri = source if is_stream(source) else 'file://' + os.path.abspath(source)
+        head = f"uridecodebin uri={uri}"
+    caps = f"width={size[0]},height={size[1]}," if size else ''
+    if has_gstreamer_element('nvvidconv'):
+        flip_method = NVVIDCONV_FLIP_METHODS.get(flip, 0)
+        convert = f"nvvidconv flip-method={flip_method} ! video/x-raw,{caps}format=BGRx ! videoconvert"
+    else:
+        convert = ''
+        if flip is not None:
+            convert += f"videoflip method={VIDEOFLIP_METHODS[flip]} ! "
+        if size:
+            convert += f"videoscale ! video/x-raw,{caps.rstrip(',')} ! "
+        convert += "videoconvert"
+    # Live sources keep only the newest frame; files are read as fast as they are consumed
+    sink = "appsink drop=true max-buffers=1 sync=false" if isinstance(source, int) or is_stream(source) \
+        else "appsink sync=false"
+    return f"{head} ! {convert} ! video/x-raw,format=BGR ! {sink}"
+
+
+class FrameSource:
+    """Frames from a camera index, video file, RTSP/HTTP stream or GStreamer pipeline, already
+    flipped (a cv2.flip code) and scaled down to target_width.
+
+    With an OpenCV build that has GStreamer, flipping and scaling happen in the decode pipeline
+    (see gstreamer_pipeline). A pipeline string is used as given. Otherwise OpenCV's own
+    backend (FFmpeg, V4L2) decodes, cameras are asked for target_width directly, and whatever
+    is left is done in one pass into a reused buffer: a resize, then the flip on the already
+    downscaled frame, since a fused warpAffine measured slower than both together.
+
+    Returned frames live in a ring of `buffers` arrays that are overwritten in turn, so it must
+    be larger than the number of frames the caller holds at once (a batch, pipeline queues).
+    """
+
+    def __init__(self, source, target_width=None, flip=None, buffers=2, backend=AUTO, metrics=None):
+        self.source = source
+        self.target_width = target_width
+        self.flip = flip
+        self.backend = backend
+        self.metrics = metrics
+        self.cap = None
+        self.mode = None  # Where frames are flipped/scaled: 'decoder', 'fused' or 'none'
+
+        # Properties of the source, then of the frames returned
+        self.fps = 30
+        self.frame_count = 0
+        self.source_size = None
+        self.size = None
+
+        self._ring = [None] * max(2, buffers)
+        self._next = 0
+        self._scratch = None  # Decoded frame when it still has to be transformed
+        self._pending_grab = None  # Seconds spent in a grab() not yet retrieved
+
+        # Counters
+        self.grabbed = 0
+        self.frames = 0
+        self.decode_seconds = 0.0
+        self.transform_seconds = 0.0
+        self.started = None
+
+    def _probe(self):
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            return None
+        info = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        cap.release()
+        return info
+
+    def open(self):
+        if is_pipeline(self.source):
+            self.cap = cv2.VideoCapture(self.source, cv2.CAP_GSTREAMER)
+            self.mode = 'decoder'
+        else:
+            info = self._probe()
+            if info is None:
+                logging.error(f"Failed to open video/camera: {self.source}")
+                return False
+            width, height, fps, frame_count = info
+            self.source_size = (width, height)
+            self.fps = fps or 30
+            self.frame_count = frame_count
+            size = scaled_size(width, height, self.target_width)
+            if self.backend != OPENCV and has_gstreamer() and (self.backend == GSTREAMER or self.wants_transform()):
+                pipeline = gstreamer_pipeline(self.source, size if size != (width, height) else None, self.flip)
+                self.cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+                if self.cap.isOpened():
+                    self.mode = 'decoder'
+                    self.size = size
+                else:
+                    logging.warning(f"GStreamer pipeline failed, decoding {self.source} with OpenCV: {pipeline}")
+            if self.mode is None:
+                self.cap = cv2.VideoCapture(self.source)
+                if isinstance(self.source, int) and size != (width, height):
+                    # Let the camera deliver the smaller mode itself if it has one
+                    self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+                    self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+                    self.source_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                        int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+                self.size = scaled_size(*self.source_size, self.target_width)
+        if not self.cap.isOpened():
+            logging.error(f"Failed to open video/camera: {self.source}")
+            self.cap = None
+            return False
+        if self.mode is None:
+            self.mode = 'fused' if self.wants_transform() else 'none'
+        if self.source_size is None:
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        logging.info(f"Capture {self.source}: {self.source_size or 'pipeline'} -> {self.size or 'pipeline'} "
+                     f"({self.mode}), {self.fps:.1f} fps")
+        return True
+
+    def wants_transform(self):
+        if self.flip is not None:
+            return True
+        return self.source_size is not None and scaled_size(*self.source_size, self.target_width) != self.source_size
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def grab(self):
+        start = time.perf_counter()
+        if self.started is None:
+            self.started = start
+        if self._pending_grab is not None:
+            self._observe('decode', self._pending_grab)
+        ok = self.cap.grab()
+        self._pending_grab = None
+        if ok:
+            self._pending_grab = time.perf_counter() - start
+            self.grabbed += 1
+        return ok
+
+    def retrieve(self):
+        start = time.perf_counter()
+        transform = self.mode == 'fused'
+        slot = self._next
+        ok, frame = self.cap.retrieve(self._scratch if transform else self._ring[slot])
+        decoded = time.perf_counter()
+        self._observe('decode', (self._pending_grab or 0.0) + decoded - start)
+        self._pending_grab = None
+        if not ok or frame is None:
+            return False, None
+        if transform:
+            self._scratch = frame
+            frame = self._transform(frame, slot)
+            self._observe('preprocess', time.perf_counter() - decoded, transform=True)
+        if self.size is None:
+            self.size = (frame.shape[1], frame.shape[0])
+        self._ring[slot] = frame
+        self._next = (slot + 1) % len(self._ring)
+        self.frames += 1
+        return True, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def _transform(self, frame, slot):
+        height, width = frame.shape[:2]
+        size = scaled_size(width, height, self.target_width)
+        out = self._ring[slot]
+        if out is None or (out.shape[1], out.shape[0]) != size or out.dtype != frame.dtype:
+            out = None
+        if size != (width, height):
+            out = cv2.resize(frame, size, dst=out)
+            if self.flip is not None:
+                cv2.flip(out, self.flip, dst=out)
+        else:
+            out = cv2.flip(frame, self.flip, dst=out)
+        return out
+
+    def _observe(self, stage, seconds, transform=False):
+        if transform:
+            self.transform_seconds += seconds
+        else:
+            self.decode_seconds += seconds
+        if self.metrics is not None:
+            self.metrics.observe(stage, seconds)
+
+    def set_position(self, frame_number):
+        """Seek to a frame; returns the position the backend actually reports"""
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+        return int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+        width, height = self.size or (0, 0)
+        return {
+            'mode': self.mode,
+            'width': width,
+            'height': height,
+            'frames': self.frames,
+            'decode_fps': round(self.grabbed / self.decode_seconds, 1) if self.decode_seconds else 0.0,
+            'fps': round(self.frames / elapsed, 1) if elapsed else 0.0,
+            'transform_ms': round(self.transform_seconds / self.frames * 1000, 3) if self.frames else 0.0,
+        }
@@ -0,0 +1,276 @@
+import atexit
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def make_mysql_connect(db_config, pool_size=2, pool_name='anpr_writer'):
+    """Return a connect() callable backed by a MariaDB/MySQL connection pool.
+
+    The pool is created on first use so a server that is down at startup does
+    not stop the detector from starting.
+    """
+    pool = None
+    lock = threading.Lock()
+
+    def connect():
+        nonlocal pool
+        with lock:
+            if pool is None:
+                from mysql.connector import pooling
+                pool = pooling.MySQLConnectionPool(pool_name=pool_name, pool_size=pool_size, **db_config)
+        # close() on a pooled connection hands it back to the pool
+        return pool.get_connection()
+
+    return connect
+
+
+class DetectionWriter:
+    """Collects detections and writes them to parking_entry as multi-row INSERTs.
+
+    submit() only appends to an in-memory buffer; a background thread flushes it
+    once batch_size rows are waiting or flush_interval seconds have passed, so the
+    detection loop never waits on the database. connect() must return a DB-API
+    connection (a pooled MariaDB one from make_mysql_connect, or sqlite3 for
+    local testing with paramstyle='?'). With a metrics.DetectorMetrics, each batch's
+    write time goes into its db_write histogram. With a spool.DetectionSpool, a batch that
+    fails to write is appended to it (for its replayer to retry) instead of being lost.
+    """
+
+    def __init__(self, connect, batch_size=50, flush_interval=1.0, paramstyle='%s', max_pending=10000,
+                 metrics=None, spool=None):
+        self.connect = connect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.placeholder = paramstyle
+        self.max_pending = max_pending
+        self.metrics = metrics
+        self.spool = spool
+        self.vehicle_type_ids = {}  # name -> vehicle_type.id
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closing = False
+
+        # Counters
+        self.batches_written = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.rows_spooled = 0
+        self.rows_rejected = 0
+        self.rows_dropped = 0
+        self.max_batch_size = 0
+        self.total_write_time = 0.0
+        self.max_write_time = 0.0
+        self.last_write_time = 0.0
+
+        # Started on the first submit(); callers that only use write_batch() never need it
+        self._thread = None
+        atexit.register(self.close)
+
+    def submit(self, detection):
+        with self._lock:
+            if self._closing:
+                logging.warning(f"DB writer closed, dropping detection: {detection['license_plate']}")
+                self.rows_dropped += 1
+                return
+            if len(self._pending) >= self.max_pending:
+                # Keep the newest reads if the server has been unreachable for a long time
+                self._pending.pop(0)
+                self.rows_dropped += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+            self._pending.append(detection)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.notify()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closing and len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                done = self._closing and not self._pending
+            if batch:
+                try:
+                    rejected = self.write_batch(batch)
+                except Exception as e:
+                    logging.error(f"Error inserting {len(batch)} detections into DB: {e}")
+                    self.spool_failed(batch)
+                else:
+                    self.reject(batch, rejected)
+            if done:
+                break
+
+    def spool_failed(self, batch):
+        """Hand a batch that could not be written to the spool; count what is lost without one"""
+        spooled = 0
+        if self.spool is not None:
+            try:
+                for detection in batch:
+                    self.spool.append(detection)
+                    spooled += 1
+            except Exception as e:
+                logging.error(f"Error spooling {len(batch) - spooled} failed detections: {e}")
+        with self._lock:
+            self.rows_spooled += spooled
+            self.rows_failed += len(batch) - spooled
+        if spooled:
+            logging.warning(f"Spooled {spooled} detections to retry later")
+
+    def reject(self, batch, rejected):
+        """Dead-letter the detections of a written batch that the server refused, by index"""
+        for index, error in rejected or ():
+            detection = batch[index]
+            logging.error(f"Server rejected detection {detection.get('license_plate')}: {error}")
+            if self.spool is not None:
+                try:
+                    self.spool.bury(detection, error)
+                except Exception as e:
+                    logging.error(f"Error dead-lettering rejected detection: {e}")
+            with self._lock:
+                self.rows_rejected += 1
+
+    def resolve_vehicle_type(self, cursor, name):
+        if name not in self.vehicle_type_ids:
+            p = self.placeholder
+            cursor.execute(f"SELECT id FROM vehicle_type WHERE name={p}", (name,))
+            result = cursor.fetchone()
+            if result:
+                self.vehicle_type_ids[name] = result[0]
+            else:
+                cursor.execute(f"INSERT INTO vehicle_type (name) VALUES ({p})", (name,))
+                self.vehicle_type_ids[name] = cursor.lastrowid
+        return self.vehicle_type_ids[name]
+
+    def write_batch(self, detections):
+        """Insert detections with one multi-row INSERT and a single commit; raises on failure.
+        Returns the (index, error) of detections refused one by one, never any here."""
+        start = time.perf_counter()
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            try:
+                rows = []
+                for detection in detections:
+                    rows.extend((
+                        detection['license_plate'],
+                        f"{detection['date']} {detection['time']}",
+                        detection.get('is_entry', True),  # From the camera's role; single-camera runs log entries
+                        self.resolve_vehicle_type(cursor, detection['vehicle_type']),
+                        detection['text_confidence'],
+                    ))
+                p = self.placeholder
+                values = ", ".join([f"({p}, {p}, {p}, {p}, {p})"] * len(detections))
+                cursor.execute(
+                    "INSERT INTO parking_entry (license_plate, timestamp, is_entry, vehicle_type_id, confidence) "
+                    f"VALUES {values}",
+                    rows
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                # Ids cached during a rolled back transaction may not exist
+                self.vehicle_type_ids.clear()
+                raise
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+
+        self.record_write(len(detections), time.perf_counter() - start)
+        logging.info(f"Inserted {len(detections)} detections into DB in {self.last_write_time * 1000:.1f} ms")
+        return []
+
+    def record_write(self, rows, elapsed):
+        self.batches_written += 1
+        self.rows_written += rows
+        self.max_batch_size = max(self.max_batch_size, rows)
+        self.total_write_time += elapsed
+        self.max_write_time = max(self.max_write_time, elapsed)
+        self.last_write_time = elapsed
+        if self.metrics is not None:
+            self.metrics.observe('db_write', elapsed)
+            self.metrics.count('rows_written', rows)
+
+    def close(self):
+        """Write everything still pending, then stop the writer thread"""
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+            self._wakeup.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        logging.info(f"DB writer closed: {self.stats()}")
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'batches': self.batches_written,
+            'rows_written': self.rows_written,
+            'rows_failed': self.rows_failed,
+            'rows_spooled': self.rows_spooled,
+            'rows_rejected': self.rows_rejected,
+            'rows_dropped': self.rows_dropped,
+            'avg_batch_size': round(self.rows_written / self.batches_written, 2) if self.batches_written else 0,
+            'max_batch_size': self.max_batch_size,
+            'avg_write_ms': round(self.total_write_time / self.batches_written * 1000, 2) if self.batches_written else 0,
+            'max_write_ms': round(self.max_write_time * 1000, 2),
+            'last_write_ms': round(self.last_write_time * 1000, 2),
+        }
+
+
+class HttpDetectionWriter(DetectionWriter):
+    """DetectionWriter that posts each batch to the Pi server's POST /api/detections instead of
+    inserting into MariaDB, so every detection goes through the server's occupancy count and
+    reaches the dashboards.
+
+    The server validates each item and reports per index. Items it refuses are returned from
+    write_batch() as (index, error), and are dead-lettered by the writer thread or the spool
+    replayer. Transport errors and server-side failures (5xx) raise, so the batch stays in the
+    spool to be retried.
+    """
+
+    def __init__(self, url, timeout=10.0, **kwargs):
+        super().__init__(connect=None, **kwargs)
+        self.url = url
+        self.timeout = timeout
+
+    def write_batch(self, detections):
+        start = time.perf_counter()
+        request = urllib.request.Request(self.url, data=json.dumps(detections).encode(), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.load(response)
+        except urllib.error.HTTPError as e:
+            # 400 with per-item results means every item was refused; anything else is not an answer
+            body = json.load(e) if e.code == 400 and e.headers.get_content_type() == 'application/json' else None
+            if not isinstance(body, dict) or 'results' not in body:
+                raise
+        except ValueError as e:
+            # Not the detections to blame (a proxy's error page, a cut-off body): retry the batch
+            raise ConnectionError(f"Unreadable response from {self.url}: {e}") from e
+        results = body.get('results') if isinstance(body, dict) else None
+        if not isinstance(results, list) or len(results) != len(detections):
+            raise ConnectionError(f"Unexpected response from {self.url}: {body}")
+        rejected = [(result['index'], result.get('error')) for result in results if result.get('status') != 'ok']
+
+        self.record_write(len(detections) - len(rejected), time.perf_counter() - start)
+        logging.info(f"Posted {len(detections)} detections to {self.url} in {self.last_write_time * 1000:.1f} ms"
+                     f"{f', {len(rejected)} rejected' if rejected else ''}")
+        return rejected
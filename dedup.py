@@ -0,0 +1,165 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+
+def edit_distance_within(a, b, max_distance):
+    """Levenshtein distance between a and b, or None if it exceeds max_distance"""
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+        if min(current) > max_distance:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= max_distance else None
+
+
+def deletion_keys(plate, max_distance):
+    """Every string reachable from plate by deleting up to max_distance characters.
+    Two plates within max_distance edits of each other always share one of these keys."""
+    keys = {plate}
+    for n in range(1, min(max_distance, len(plate) - 1) + 1):
+        for positions in itertools.combinations(range(len(plate)), n):
+            keys.add(''.join(c for i, c in enumerate(plate) if i not in positions))
+    return keys
+
+
+class _Entry:
+    __slots__ = ('plate', 'scope', 'first_seen', 'detection', 'keys')
+
+    def __init__(self, plate, scope, first_seen, detection, keys):
+        self.plate = plate
+        self.scope = scope
+        self.first_seen = first_seen
+        self.detection = detection
+        self.keys = keys
+
+
+class PlateDedupIndex:
+    """Recently persisted plates, so one vehicle produces one record.
+
+    observe() reports whether a read is a new plate or a repeat of one first seen less than
+    `window` seconds ago. A repeat may be an exact match or an OCR variant within
+    max_distance edits (ABC1234 vs A8C1234). Lookup goes through a deletion-neighbourhood
+    index, so its cost depends on plate length and not on how many plates are held. When a
+    repeat is more confident, a new kept detection is built from it; the dict handed out
+    before is never changed, as it may still be waiting in a writer's batch. Entries expire in first-seen order. Reads are only
+    compared with reads of the same direction (detection['is_entry']), so a car that
+    enters and leaves again within the window still produces both events.
+    """
+
+    def __init__(self, window=30, max_distance=1, min_fuzzy_length=5):
+        self.window = window
+        self.max_distance = max_distance
+        self.min_fuzzy_length = min_fuzzy_length
+        self._entries = OrderedDict()  # entry id -> _Entry, oldest first
+        self._by_key = {}  # deletion key -> set of entry ids
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.new_plates = 0
+        self.duplicates = 0
+        self.fuzzy_matches = 0
+        self.upgrades = 0
+        self.evictions = 0
+
+    def _keys(self, plate):
+        if len(plate) < self.min_fuzzy_length:
+            return {plate}
+        return deletion_keys(plate, self.max_distance)
+
+    def _evict(self, now):
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if now - entry.first_seen <= self.window:
+                break
+            self._entries.popitem(last=False)
+            self._unindex(entry_id, entry)
+            self.evictions += 1
+
+    def _unindex(self, entry_id, entry):
+        for key in entry.keys:
+            ids = self._by_key.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._by_key[key]
+
+    def _find(self, plate, scope, keys):
+        best = None
+        for key in keys:
+            for entry_id in self._by_key.get(key, ()):
+                entry = self._entries[entry_id]
+                if entry.scope != scope:
+                    continue
+                if entry.plate == plate:
+                    return entry_id, entry, 0
+                if len(plate) < self.min_fuzzy_length or len(entry.plate) < self.min_fuzzy_length:
+                    continue
+                distance = edit_distance_within(plate, entry.plate, self.max_distance)
+                if distance is not None and (best is None or distance < best[2]):
+                    best = (entry_id, entry, distance)
+        return best
+
+    def observe(self, detection, now=None):
+        """True if this detection is a new plate that should be persisted,
+        False if it repeats one already seen within the window"""
+        return self.resolve(detection, now)[0]
+
+    def resolve(self, detection, now=None):
+        """Like observe(), but returns (is_new, kept, replaced): kept is the detection dict held
+        for the plate (this one if new), and replaced is the spelling kept had before this
+        read upgraded it, or None if it did not"""
+        now = time.monotonic() if now is None else now
+        plate = detection['license_plate']
+        scope = detection.get('is_entry')
+        with self._lock:
+            self._evict(now)
+            keys = self._keys(plate)
+            match = self._find(plate, scope, keys)
+            if match is None:
+                entry_id = next(self._ids)
+                self._entries[entry_id] = _Entry(plate, scope, now, detection, keys)
+                for key in keys:
+                    self._by_key.setdefault(key, set()).add(entry_id)
+                self.new_plates += 1
+                return True, detection, None
+
+            entry_id, entry, distance = match
+            self.duplicates += 1
+            if distance:
+                self.fuzzy_matches += 1
+            replaced = None
+            if detection['text_confidence'] > entry.detection['text_confidence']:
+                replaced = entry.plate
+                entry.detection = dict(entry.detection, **detection)
+                self.upgrades += 1
+                if plate != entry.plate:
+                    # Re-key under the more confident spelling
+                    self._unindex(entry_id, entry)
+                    entry.plate = plate
+                    entry.keys = keys
+                    for key in keys:
+                        self._by_key.setdefault(key, set()).add(entry_id)
+            return False, entry.detection, replaced
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'new_plates': self.new_plates,
+                'duplicates': self.duplicates,
+                'fuzzy_matches': self.fuzzy_matches,
+                'upgrades': self.upgrades,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,101 @@
+import logging
+import time
+
+
+class AdaptiveFrameSkip:
+    """Adjusts frame_skip, and optionally YOLO's inference size, to keep processing in step
+    with the video source.
+
+    frame_processed() is called after every processed frame, or once per batch with the
+    number of frames in it, and given the seconds spent processing them (detection, OCR,
+    output) but not waiting on capture: a live camera delivering slower than its reported
+    FPS would otherwise look like load and push frame_skip up with nothing to shed.
+    Dividing that time (the wall time between calls if none is given) by frames *
+    frame_skip gives the cost per source frame. That is compared with the budget,
+    1/target_fps (the source fps unless configured) or latency_budget seconds:
+    above it the controller first shrinks the inference size (if adapt_resolution) and
+    then skips more frames; well below it, it undoes those steps in reverse order.
+    """
+
+    def __init__(self, source_fps, target_fps=None, latency_budget=None, max_skip=10,
+                 inference_sizes=(640, 512, 416, 320), adapt_resolution=False,
+                 smoothing=0.2, adjust_every=15, low_water=0.6, adaptive=True):
+        # adaptive=False only measures, for status reporting
+        self.adaptive = adaptive
+        self.source_fps = source_fps or 30
+        self.budget = latency_budget or 1.0 / (target_fps or self.source_fps)
+        self.max_skip = max_skip
+        self.inference_sizes = list(inference_sizes)
+        self.adapt_resolution = adapt_resolution
+        self.smoothing = smoothing
+        self.adjust_every = adjust_every
+        self.low_water = low_water
+
+        self.frame_skip = 1
+        self.size_index = 0
+        self.frame_time = None  # Smoothed seconds per source frame
+        self.processed_fps = 0.0  # Smoothed processed frames per second
+        self._last = None
+        self._since_adjust = 0
+
+    @property
+    def inference_size(self):
+        return self.inference_sizes[self.size_index]
+
+    def frame_processed(self, frames=1, busy=None):
+        """Record `frames` processed frames that took `busy` seconds of processing;
+        returns True if frame_skip or inference_size changed"""
+        now = time.monotonic()
+        if self._last is None:
+            self._last = now
+            return False
+        interval = now - self._last
+        self._last = now
+        per_frame = (interval if busy is None else busy) / (frames * self.frame_skip)
+        if self.frame_time is None:
+            self.frame_time = per_frame
+        else:
+            self.frame_time += self.smoothing * (per_frame - self.frame_time)
+        if interval > 0:
+            fps = frames / interval
+            if self.processed_fps:
+                self.processed_fps += self.smoothing * (fps - self.processed_fps)
+            else:
+                self.processed_fps = fps
+
+        self._since_adjust += frames
+        if not self.adaptive or self._since_adjust < self.adjust_every:
+            return False
+        self._since_adjust = 0
+        return self._adjust()
+
+    def _adjust(self):
+        old_skip, old_size = self.frame_skip, self.inference_size
+        if self.frame_time > self.budget:
+            if self.adapt_resolution and self.size_index < len(self.inference_sizes) - 1:
+                self.size_index += 1
+            elif self.frame_skip < self.max_skip:
+                self.frame_skip += 1
+        elif self.frame_time < self.budget * self.low_water:
+            if self.frame_skip > 1:
+                self.frame_skip -= 1
+            elif self.size_index > 0:
+                self.size_index -= 1
+
+        if (self.frame_skip, self.inference_size) == (old_skip, old_size):
+            return False
+        logging.info(f"Frame skip controller: {self.frame_time * 1000:.1f} ms per source frame "
+                     f"(budget {self.budget * 1000:.1f} ms) -> frame_skip {old_skip}->{self.frame_skip}, "
+                     f"inference size {old_size}->{self.inference_size}")
+        # The next interval straddles the change, start measuring afresh
+        self._last = None
+        return True
+
+    def status(self):
+        return {
+            'fps': round(self.processed_fps, 2),
+            'frame_skip': self.frame_skip,
+            'inference_size': self.inference_size,
+            'frame_time_ms': round(self.frame_time * 1000, 2) if self.frame_time is not None else None,
+            'budget_ms': round(self.budget * 1000, 2),
+        }
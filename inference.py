@@ -0,0 +1,132 @@
+import importlib.util
+import logging
+import os
+import shutil
+from pathlib import Path
+
+VEHICLE_WEIGHTS = 'yolo11n.pt'
+
+PYTORCH = 'pytorch'
+ONNX = 'onnx'
+OPENVINO = 'openvino'
+AUTO = 'auto'
+BACKENDS = (PYTORCH, ONNX, OPENVINO)
+
+# Exported models are kept here, keyed by weights, backend, input size and precision
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', 'models')
+
+
+def has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def cuda_available():
+    if not has_module('torch'):
+        return False
+    import torch
+    return torch.cuda.is_available()
+
+
+def available_backends():
+    return [PYTORCH] + [backend for backend, module in ((ONNX, 'onnxruntime'), (OPENVINO, 'openvino'))
+                        if has_module(module)]
+
+
+def fastest_backend():
+    """PyTorch when there is a CUDA device (the Jetson), otherwise the fastest installed CPU
+    runtime: OpenVINO, then ONNX Runtime, then PyTorch on the CPU"""
+    if cuda_available():
+        return PYTORCH
+    available = available_backends()
+    for backend in (OPENVINO, ONNX):
+        if backend in available:
+            return backend
+    return PYTORCH
+
+
+def artifact_path(weights, backend, imgsz=640, int8=False, cache_dir=MODEL_CACHE_DIR):
+    name = f"{Path(weights).stem}_{imgsz}{'_int8' if int8 else ''}"
+    # Ultralytics recognises an OpenVINO model by its directory suffix
+    return Path(cache_dir) / (f"{name}.onnx" if backend == ONNX else f"{name}_openvino_model")
+
+
+def _is_fresh(artifact, weights):
+    if not artifact.exists():
+        return False
+    weights = Path(weights)
+    return not weights.exists() or artifact.stat().st_mtime >= weights.stat().st_mtime
+
+
+def _quantize_onnx(source, target):
+    """Dynamic INT8 quantization of the weights; activations stay float, so no calibration set"""
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(str(source), str(target), weight_type=QuantType.QUInt8)
+    # Ultralytics reads class names, stride and input size from the model's metadata
+    metadata = {prop.key: prop.value for prop in onnx.load(str(source)).metadata_props}
+    quantized = onnx.load(str(target))
+    onnx.helper.set_model_props(quantized, metadata)
+    onnx.save(quantized, str(target))
+
+
+def export_model(weights, backend, imgsz=640, int8=False, cache_dir=MODEL_CACHE_DIR, calibration_data=None):
+    """Export `weights` for an ONNX Runtime or OpenVINO backend once and return the cached artifact.
+
+    Exports have a dynamic batch and input size, so batched calls and the adaptive inference
+    size keep working. An artifact older than the weights file is exported again.
+    OpenVINO INT8 is calibrated by Ultralytics/NNCF on `calibration_data` (a dataset YAML,
+    coco8.yaml by default); ONNX INT8 is quantized dynamically with ONNX Runtime.
+    """
+    if backend not in (ONNX, OPENVINO):
+        raise ValueError(f"Nothing to export for backend {backend!r}")
+    artifact = artifact_path(weights, backend, imgsz, int8, cache_dir)
+    if _is_fresh(artifact, weights):
+        return artifact
+
+    from ultralytics import YOLO
+    artifact.parent.mkdir(exist_ok=True, parents=True)
+    logging.info(f"Exporting {weights} to {backend}{' INT8' if int8 else ''} at imgsz {imgsz}, "
+                 f"caching it as {artifact}")
+    model = YOLO(weights)
+    if backend == ONNX:
+        exported = Path(model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True))
+        tmp = artifact.with_name(artifact.name + '.tmp')
+        if int8:
+            _quantize_onnx(exported, tmp)
+            exported.unlink()
+        else:
+            shutil.move(exported, tmp)
+        os.replace(tmp, artifact)
+    else:
+        options = {'int8': int8}
+        if int8 and calibration_data:
+            options['data'] = calibration_data
+        exported = Path(model.export(format='openvino', imgsz=imgsz, dynamic=True, **options))
+        if artifact.exists():
+            shutil.rmtree(artifact)
+        shutil.move(exported, artifact)
+    return artifact
+
+
+def load_vehicle_model(weights=VEHICLE_WEIGHTS, backend=PYTORCH, int8=False, imgsz=640,
+                       cache_dir=MODEL_CACHE_DIR, calibration_data=None):
+    """YOLO model for vehicle detection on the given backend (AUTO: fastest_backend()).
+
+    Every backend is loaded through Ultralytics, so predictions come back as the same Results
+    objects (boxes.xyxy, boxes.cls, boxes.conf) whatever runs underneath. ultralytics, and
+    torch behind it, is only imported here, so --help, the chunk/OCR worker bootstrap and
+    stubbed benchmarks never pay for it.
+    """
+    from ultralytics import YOLO
+    if backend == AUTO:
+        backend = fastest_backend()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS + (AUTO,)}")
+    if backend == PYTORCH:
+        if int8:
+            logging.warning("INT8 needs the onnx or openvino backend; loading the PyTorch model as is")
+        logging.info(f"Vehicle model: {weights} on PyTorch")
+        return YOLO(weights)
+    artifact = export_model(weights, backend, imgsz, int8, cache_dir, calibration_data)
+    logging.info(f"Vehicle model: {artifact} on {backend}")
+    return YOLO(str(artifact), task='detect')
@@ -0,0 +1,54 @@
+LEFT = 'left'
+RIGHT = 'right'
+
+
+def parse_line(text):
+    """Parse 'x1,y1;x2,y2' into two (x, y) points"""
+    points = [tuple(int(v) for v in point.split(',')) for point in text.split(';') if point.strip()]
+    if len(points) != 2 or points[0] == points[1]:
+        raise ValueError(f"Counting line needs two distinct points, got {text!r}")
+    return points
+
+
+class CountingLine:
+    """A virtual line across the lane that decides entry vs exit from a track's direction of travel.
+
+    Sides are taken facing from the line's first point to its second, in image coordinates.
+    A vehicle moving onto entry_side is entering, one moving off it is exiting. A centroid
+    only counts as being on a side once it is more than `margin` pixels from the line, so a
+    car idling on the line cannot flip back and forth. Crossings beyond the ends of the
+    segment are ignored.
+    """
+
+    def __init__(self, start, end, entry_side=RIGHT, margin=10):
+        if entry_side not in (LEFT, RIGHT):
+            raise ValueError(f"entry_side must be '{LEFT}' or '{RIGHT}', got {entry_side!r}")
+        self.start = start
+        self.end = end
+        self.entry_side = entry_side
+        self.margin = margin
+        self._dx = end[0] - start[0]
+        self._dy = end[1] - start[1]
+        self._length = (self._dx ** 2 + self._dy ** 2) ** 0.5
+
+    def side(self, point):
+        """+1 right of the line, -1 left of it, 0 within margin of it or beyond its ends"""
+        px, py = point[0] - self.start[0], point[1] - self.start[1]
+        along = (px * self._dx + py * self._dy) / self._length ** 2
+        if not 0.0 <= along <= 1.0:
+            return 0
+        distance = (self._dx * py - self._dy * px) / self._length
+        if abs(distance) <= self.margin:
+            return 0
+        return 1 if distance > 0 else -1
+
+    def crossing(self, previous_side, point):
+        """Returns (side, is_entry), where side is the settled side to remember for this track and
+        is_entry is None unless the point completes a crossing from previous_side"""
+        side = self.side(point)
+        if side == 0:
+            return previous_side, None
+        if not previous_side or side == previous_side:
+            return side, None
+        entered = RIGHT if side > 0 else LEFT
+        return side, entered == self.entry_side
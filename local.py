@@ -1,16 +1,31 @@
+import argparse
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from startup import ReadinessSignal
 import cv2
 import numpy as np
-from ultralytics import YOLO
-import pandas as pd
 import os
 import logging
 from pathlib import Path
 import time
 from datetime import datetime, timedelta
 import pytz
-import mysql.connector
-from openalpr import Alpr
 from dotenv import load_dotenv
+from db_writer import DetectionWriter, HttpDetectionWriter, make_mysql_connect
+from spool import DetectionSpool, SpoolReplayer
+from tracker import VehicleTracker
+from line_crossing import CountingLine, parse_line, LEFT, RIGHT
+from dedup import PlateDedupIndex
+from results_sink import PlateResultSink
+from ocr import AlprPool, PlateReader, load_alpr
+from inference import load_vehicle_model, BACKENDS, AUTO
+from motion_gate import MotionGate, offset_vehicles, parse_polygon
+from frame_skip import AdaptiveFrameSkip
+from status import StatusReporter
+from metrics import DetectorMetrics, MetricsServer
+from pipeline import StagedPipeline, DROP_OLDEST, BLOCK
+from capture import FrameSource, AUTO as CAPTURE_AUTO, GSTREAMER, OPENCV
 
 # Load environment variables from .env
 load_dotenv()
@@ -35,35 +50,125 @@ DB_CONFIG = {
 }
 
 class VehicleAndPlateDetector:
-    def __init__(self):
-        # Initialize YOLO model for vehicle detection
-        self.vehicle_model = YOLO('yolo11n.pt')
+    def __init__(self, backend=None, int8=None):
+        # Initialize YOLO model for vehicle detection on INFERENCE_BACKEND (pytorch, onnx,
+        # openvino or auto for the fastest available), as an INT8 export if INFERENCE_INT8=1
+        self.inference_backend = backend or os.getenv('INFERENCE_BACKEND', AUTO)
+        self.inference_int8 = int8 if int8 is not None else os.getenv('INFERENCE_INT8') == '1'
+        self.vehicle_model = load_vehicle_model(backend=self.inference_backend, int8=self.inference_int8)
 
         # Initialize OpenALPR
-        self.alpr = Alpr("us",
-                         "/etc/openalpr/openalpr.conf",
-                         "/usr/local/share/openalpr/runtime_data")
+        self.alpr = load_alpr()
         if not self.alpr.is_loaded():
             logging.error("Error loading OpenALPR")
             raise RuntimeError("OpenALPR failed to load")
 
+        # Pass crops to OpenALPR as raw BGR pixels instead of re-encoding them as JPEG
+        self.plate_reader = PlateReader(self.alpr, raw_pixels=True)
+        # Optional pool of OpenALPR worker processes (see enable_ocr_pool)
+        self.ocr_pool = None
+
         # Vehicle classes in COCO dataset
         self.vehicle_classes = [2, 3, 5, 7]
         self.vehicle_names = {2: 'car', 3: 'motorcycle', 5: 'bus', 7: 'truck'}
 
-        # Initialize results storage (only plates now)
-        self.plate_detections = []
-        self.plate_tracker = {}  # To track plates and their first appearance time
+        # Vehicle tracking: one OCR schedule and one plate result per tracked vehicle
+        self.tracker = VehicleTracker()
 
         # Create output directory
         self.output_dir = Path('output')
         self.output_dir.mkdir(exist_ok=True, parents=True)
 
         # Performance parameters
-        self.target_width = 1280
+        self.target_width = 1280  # Frames are scaled down to this width, in the decoder where possible
+        self.capture_backend = CAPTURE_AUTO
         self.frame_skip = 1
+        self.batch_size = 1  # Frames per YOLO call in process_video
         self.min_plate_confidence = 0.7  # Minimum confidence for CSV registration
+        # Plate results stream to NDJSON as they are found (best read per plate across the
+        # whole run); save_results() appends them to plate_detections.csv
+        self.results_sink = PlateResultSink(self.output_dir / 'plate_detections.ndjson',
+                                            min_confidence=self.min_plate_confidence)
         self.duplicate_window = 30  # Seconds to consider as duplicate plate
+        # Plates persisted within duplicate_window, matched exactly or within one OCR misread
+        self.plate_index = PlateDedupIndex(window=self.duplicate_window)
+
+        # Adaptive frame skip: hold processing to target_fps source frames per second
+        # (the source's own fps when None), optionally by lowering YOLO's input size too
+        self.inference_size = 640
+        self.adaptive_frame_skip = False
+        self.adapt_resolution = False
+        self.target_fps = None
+
+        # detector_status pushed to the Pi server's Socket.IO endpoint, if configured
+        self.status_reporter = StatusReporter(os.getenv('PI_SERVER_URL'))
+
+        # Set once the models are warmed up and capture is about to start (see warm_up and
+        # mark_ready); READY_FILE, if set, is where the readiness file is written
+        self.readiness = ReadinessSignal(os.getenv('READY_FILE'))
+        self.warmup_seconds = None
+        self.warmup_enabled = True  # Also applies to the chunk workers of process_video_parallel
+
+        # Per-stage timings and counters, pushed with detector_status and, when METRICS_PORT
+        # is set, served in Prometheus text format on METRICS_HOST (localhost by default)
+        self.metrics = DetectorMetrics()
+        self.status_reporter.add_source('metrics', self.metrics.summary)
+        self.metrics.add_collector('startup', lambda: {'ready': int(self.readiness.is_set()),
+                                                       'warmup_seconds': self.warmup_seconds})
+        self.metrics_server = None
+        if os.getenv('METRICS_PORT'):
+            self.enable_metrics_server(int(os.getenv('METRICS_PORT')), os.getenv('METRICS_HOST', '127.0.0.1'))
+
+        # Headless mode: no window, and frames are only annotated for an output video
+        # or a debug snapshot every snapshot_interval processed frames (0 disables)
+        self.headless = False
+        self.snapshot_interval = 0
+        self.snapshot_dir = Path(os.getenv('SNAPSHOT_DIR', 'output/snapshots'))
+
+        # Optional motion/ROI gate in front of YOLO (see enable_motion_gate)
+        self.motion_gate = None
+
+        # Pipelined mode: frames buffered between stages, and what to do when full
+        self.pipeline_queue_size = 8
+        self.pipeline_drop_policy = BLOCK  # or DROP_OLDEST to favour latency over completeness
+
+        # Detections are posted in batches, off the detection thread, to the Pi server's
+        # /api/detections (DETECTIONS_URL; defaults to PI_SERVER_URL's), which also keeps the
+        # occupancy and pushes them to the dashboards. With no server URL they are inserted
+        # into MariaDB directly.
+        pi_server_url = os.getenv('PI_SERVER_URL')
+        detections_url = os.getenv('DETECTIONS_URL',
+                                   f"{pi_server_url.rstrip('/')}/api/detections" if pi_server_url else '')
+        writer_options = {
+            'batch_size': int(os.getenv('DB_BATCH_SIZE', 50)),
+            'flush_interval': float(os.getenv('DB_FLUSH_INTERVAL', 1.0)),
+            'metrics': self.metrics,
+        }
+        if detections_url:
+            self.db_writer = HttpDetectionWriter(detections_url, **writer_options)
+        else:
+            self.db_writer = DetectionWriter(make_mysql_connect(DB_CONFIG), **writer_options)
+        self.metrics.add_collector('db_writer', self.db_writer.stats)
+
+        # Unless disabled with an empty SPOOL_PATH, detections land in a local spool first
+        # and are replayed to the server in order, surviving outages of the Pi. Without it they
+        # go straight to the writer, and only batches it fails to write are spooled, at
+        # FAILED_SPOOL_PATH (empty: not at all)
+        self.spool = None
+        self.spool_replayer = None
+        spool_path = os.getenv('SPOOL_PATH', 'spool/detections.db')
+        self.spool_first = bool(spool_path)
+        if not self.spool_first:
+            spool_path = os.getenv('FAILED_SPOOL_PATH', 'spool/failed.db')
+        if spool_path:
+            self.spool = DetectionSpool(spool_path, max_rows=int(os.getenv('SPOOL_MAX_ROWS', 200000)))
+            if not self.spool_first:
+                self.db_writer.spool = self.spool
+            self.spool_replayer = SpoolReplayer(self.spool, self.db_writer.write_batch,
+                                                batch_size=self.db_writer.batch_size,
+                                                max_attempts=int(os.getenv('SPOOL_MAX_ATTEMPTS', 5)))
+            self.spool_replayer.start()
+            self.metrics.add_collector('spool', self.spool_replayer.stats)
 
         # Timezone setup
         self.cdt_timezone = pytz.timezone('America/Chicago')
@@ -80,117 +185,163 @@ class VehicleAndPlateDetector:
         return relative_size > 0.03
 
     def insert_detection_to_db(self, detection):
-        try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            # Ensure vehicle type exists
-            cursor.execute("SELECT id FROM vehicle_type WHERE name=%s", (detection['vehicle_type'],))
-            result = cursor.fetchone()
-            if result:
-                vehicle_type_id = result[0]
-            else:
-                cursor.execute("INSERT INTO vehicle_type (name) VALUES (%s)", (detection['vehicle_type'],))
-                conn.commit()
-                vehicle_type_id = cursor.lastrowid
-            # Insert parking entry
-            cursor.execute(
-                "INSERT INTO parking_entry (license_plate, timestamp, is_entry, vehicle_type_id, confidence) VALUES (%s, %s, %s, %s, %s)",
-                (
-                    detection['license_plate'],
-                    f"{detection['date']} {detection['time']}",
-                    True,  # or your logic for entry/exit
-                    vehicle_type_id,
-                    detection['text_confidence']
-                )
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            logging.info(f"Inserted detection into DB: {detection}")
-        except Exception as e:
-            logging.error(f"Error inserting detection into DB: {e}")
+        if self.spool_first:
+            self.spool.append(detection)
+        else:
+            # Queued for the background writer; pooled connection, multi-row INSERTs
+            self.db_writer.submit(detection)
 
-    def process_frame(self, frame, frame_number, fps):
-        vehicle_results = self.vehicle_model(frame, classes=self.vehicle_classes, conf=0.5)
-        vis_frame = frame.copy()
-        timestamp = frame_number / fps
-        vehicle_counts = {name: 0 for name in self.vehicle_names.values()}
+    def detect_vehicles(self, frame):
+        return self.detect_vehicles_batch([frame])[0]
 
-        for result in vehicle_results:
-            boxes = result.boxes
-            for box in boxes:
+    def detect_vehicles_batch(self, frames):
+        batch_vehicles = [[] for _ in frames]
+        # Frames the motion gate rejects never reach YOLO; the rest are cropped to the ROI
+        to_detect = []  # (index in batch, frame or ROI crop, x offset, y offset)
+        for i, frame in enumerate(frames):
+            if self.motion_gate is None:
+                to_detect.append((i, frame, 0, 0))
+                continue
+            start = time.perf_counter()
+            box = self.motion_gate.check(frame)
+            self.metrics.observe('motion_gate', time.perf_counter() - start)
+            if box is None:
+                self.metrics.count('frames_gated')
+            else:
+                x1, y1, x2, y2 = box
+                to_detect.append((i, frame[y1:y2, x1:x2], x1, y1))
+        if not to_detect:
+            return batch_vehicles
+
+        # One Results object per input frame, returned in input order
+        start = time.perf_counter()
+        vehicle_results = self.vehicle_model([crop for _, crop, _, _ in to_detect],
+                                             classes=self.vehicle_classes, conf=0.5,
+                                             imgsz=self.inference_size)
+        self.metrics.observe('yolo', time.perf_counter() - start)
+        for (i, _, x_offset, y_offset), result in zip(to_detect, vehicle_results):
+            vehicles = []
+            for box in result.boxes:
                 x1, y1, x2, y2 = map(int, box.xyxy[0])
-                confidence = float(box.conf[0])
                 class_id = int(box.cls[0])
-                vehicle_name = self.vehicle_names.get(class_id, 'unknown')
-                vehicle_counts[vehicle_name] += 1
-
-                cv2.rectangle(vis_frame, (x1, y1), (x2, y2), (0, 255, 0), 1)
-                cv2.putText(vis_frame, f'{vehicle_name}: {confidence:.2f}', (x1, y1-10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-
-                if self.is_optimal_for_plate_detection((x1, y1, x2-x1, y2-y1), frame.shape):
-                    try:
-                        vehicle_region = frame[y1:y2, x1:x2]
-                        ret, jpeg_bytes = cv2.imencode('.jpg', vehicle_region)
-                        if not ret:
-                            continue
-                        results = self.alpr.recognize_array(jpeg_bytes.tobytes())
-                        for plate in results['results']:
-                            plate_text = plate['plate']
-                            text_confidence = plate['confidence'] / 100.0
-                            if (text_confidence >= self.min_plate_confidence and
-                                len(plate_text) > 6 and  # Only plates with >6 characters
-                                any(c.isalpha() for c in plate_text) and
-                                any(c.isdigit() for c in plate_text)):
-                                # Draw plate polygon
-                                for coord in plate['coordinates']:
-                                    x = x1 + coord['x']
-                                    y = y1 + coord['y']
-                                    cv2.circle(vis_frame, (x, y), 3, (0, 0, 255), -1)
-                                cv2.putText(vis_frame, f'Plate: {plate_text}', (x1, y2+20),
-                                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
-                                current_date, current_time = self.get_current_cdt_datetime()
-                                current_datetime = datetime.strptime(f"{current_date} {current_time}", "%Y-%m-%d %H:%M:%S")
-                                if plate_text in self.plate_tracker:
-                                    first_seen_time, best_confidence = self.plate_tracker[plate_text]
-                                    time_diff = (current_datetime - first_seen_time).total_seconds()
-                                    if time_diff <= self.duplicate_window:
-                                        if text_confidence > best_confidence:
-                                            self.plate_tracker[plate_text] = (first_seen_time, text_confidence)
-                                            for detection in self.plate_detections:
-                                                if detection['license_plate'] == plate_text:
-                                                    detection.update({
-                                                        'date': current_date,
-                                                        'time': current_time,
-                                                        'text_confidence': round(text_confidence, 2),
-                                                        'vehicle_type': vehicle_name,
-                                                        'vehicle_confidence': round(confidence, 2),
-                                                        'frame_number': frame_number,
-                                                        'timestamp': round(timestamp, 2)
-                                                    })
-                                                    break
-                                        continue
-                                    else:
-                                        self.plate_tracker[plate_text] = (current_datetime, text_confidence)
-                                else:
-                                    self.plate_tracker[plate_text] = (current_datetime, text_confidence)
-                                detection = {
-                                    'date': current_date,
-                                    'time': current_time,
-                                    'license_plate': plate_text,
-                                    'text_confidence': round(text_confidence, 2),
-                                    'vehicle_type': vehicle_name,
-                                    'vehicle_confidence': round(confidence, 2),
-                                    'frame_number': frame_number,
-                                    'timestamp': round(timestamp, 2)
-                                }
-                                self.plate_detections.append(detection)
-                                self.insert_detection_to_db(detection)
-                                logging.info(f"Detected plate: {plate_text} (confidence: {text_confidence:.2f})")
-                    except Exception as e:
-                        logging.warning(f"Plate detection error: {str(e)}")
-                        continue
+                vehicles.append({
+                    'bbox': (x1, y1, x2, y2),
+                    'confidence': float(box.conf[0]),
+                    'vehicle_type': self.vehicle_names.get(class_id, 'unknown'),
+                })
+            batch_vehicles[i] = offset_vehicles(vehicles, x_offset, y_offset)
+        return batch_vehicles
+
+    def recognize_crops(self, crops):
+        """OCR vehicle crops, in parallel when the OCR pool is enabled; results keep crop order"""
+        if self.ocr_pool is not None:
+            return self.ocr_pool.recognize_many(crops)
+        results = []
+        for crop in crops:
+            try:
+                results.append(self.plate_reader.recognize(crop))
+            except Exception as e:
+                logging.warning(f"Plate detection error: {str(e)}")
+                results.append({'results': []})
+        return results
+
+    def read_plates(self, frame, vehicles, frame_number, fps):
+        timestamp = frame_number / fps
+        candidates = []
+        for vehicle in vehicles:
+            x1, y1, x2, y2 = vehicle['bbox']
+            if not self.is_optimal_for_plate_detection((x1, y1, x2-x1, y2-y1), frame.shape):
+                continue
+            # Only a few OCR samples per tracked vehicle, none once its plate is locked in
+            if not self.tracker.schedule_ocr(vehicle['track_id'], frame_number):
+                continue
+            candidates.append(vehicle)
+
+        if not candidates:
+            return []
+        start = time.perf_counter()
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in (vehicle['bbox'] for vehicle in candidates)]
+        crops_done = time.perf_counter()
+        # OCR time includes preparing the crops for OpenALPR (contiguous copy or JPEG encode)
+        ocr_results = self.recognize_crops(crops)
+        self.metrics.observe('crop', crops_done - start)
+        self.metrics.observe('ocr', time.perf_counter() - crops_done)
+        self.metrics.count('ocr_crops', len(crops))
+        plates = []
+        for vehicle, results in zip(candidates, ocr_results):
+            x1, y1, x2, y2 = vehicle['bbox']
+            try:
+                for plate in results['results']:
+                    plate_text = plate['plate']
+                    text_confidence = plate['confidence'] / 100.0
+                    if (text_confidence >= self.min_plate_confidence and
+                        len(plate_text) > 6 and  # Only plates with >6 characters
+                        any(c.isalpha() for c in plate_text) and
+                        any(c.isdigit() for c in plate_text)):
+                        current_date, current_time = self.get_current_cdt_datetime()
+                        detection = {
+                            'date': current_date,
+                            'time': current_time,
+                            'license_plate': plate_text,
+                            'text_confidence': round(text_confidence, 2),
+                            'vehicle_type': vehicle['vehicle_type'],
+                            'vehicle_confidence': round(vehicle['confidence'], 2),
+                            'frame_number': frame_number,
+                            'timestamp': round(timestamp, 2),
+                            'track_id': vehicle['track_id']
+                        }
+                        # Plate corners in full-frame coordinates, for drawing
+                        points = [(x1 + c['x'], y1 + c['y']) for c in plate['coordinates']]
+                        plates.append({'detection': detection, 'points': points, 'bbox': vehicle['bbox']})
+            except Exception as e:
+                logging.warning(f"Plate detection error: {str(e)}")
+                continue
+        return plates
+
+    def record_detection(self, detection):
+        # One call per tracked vehicle: its locked read, or its best read once the track ends.
+        # A repeat of a recent plate only upgrades the kept read, if more confident.
+        start = time.perf_counter()
+        is_new, kept, replaced = self.plate_index.resolve(detection)
+        self.metrics.observe('dedup', time.perf_counter() - start)
+        if not is_new:
+            self.metrics.count('plates_duplicate')
+            if replaced is not None:
+                # The kept read took this one's spelling and confidence; it replaces the old spelling
+                self.results_sink.add(kept, replaces=replaced)
+            logging.debug(f"Duplicate plate {detection['license_plate']} (track {detection['track_id']})")
+            return
+        self.persist_detection(detection)
+
+    def persist_detection(self, detection):
+        self.metrics.count('plates_emitted')
+        self.results_sink.add(detection)
+        self.insert_detection_to_db(detection)
+        direction = {True: 'entry ', False: 'exit '}.get(detection.get('is_entry'), '')
+        logging.info(f"Detected {direction}plate: {detection['license_plate']} (confidence: {detection['text_confidence']:.2f}, "
+                     f"track {detection['track_id']})")
+
+    def flush_tracks(self):
+        # Vehicles still in view at the end never ended their track; keep their best reads
+        for detection in self.tracker.flush():
+            self.record_detection(detection)
+
+    def draw_detections(self, frame, vehicles, plates):
+        vis_frame = frame.copy()
+        vehicle_counts = {name: 0 for name in self.vehicle_names.values()}
+        for vehicle in vehicles:
+            x1, y1, x2, y2 = vehicle['bbox']
+            vehicle_counts[vehicle['vehicle_type']] += 1
+            cv2.rectangle(vis_frame, (x1, y1), (x2, y2), (0, 255, 0), 1)
+            cv2.putText(vis_frame, f"{vehicle['vehicle_type']} #{vehicle['track_id']}: {vehicle['confidence']:.2f}", (x1, y1-10),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        for plate in plates:
+            # Draw plate polygon
+            for x, y in plate['points']:
+                cv2.circle(vis_frame, (x, y), 3, (0, 0, 255), -1)
+            x1, _, _, y2 = plate['bbox']
+            cv2.putText(vis_frame, f"Plate: {plate['detection']['license_plate']}", (x1, y2+20),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
 
         count_text = ", ".join([f"{k}: {v}" for k, v in vehicle_counts.items() if v > 0])
         if count_text:
@@ -199,106 +350,553 @@ class VehicleAndPlateDetector:
 
         return vis_frame
 
-    def process_video(self, video_path, output_video_path=None):
+    def wants_annotation(self, frame_number, writing_video=False):
+        """Only draw when something will look at the result"""
+        return (not self.headless or writing_video or
+                bool(self.snapshot_interval and frame_number % self.snapshot_interval == 0))
+
+    def emit_frame(self, frame, vehicles, plates, frame_number, out=None):
+        """Annotate the frame for its consumers (window, output video, debug snapshots).
+        Returns False if the user asked to quit."""
+        if not self.wants_annotation(frame_number, out is not None):
+            return True
+        vis_frame = self.draw_detections(frame, vehicles, plates)
+        if out is not None:
+            out.write(vis_frame)
+        if self.snapshot_interval and frame_number % self.snapshot_interval == 0:
+            self.snapshot_dir.mkdir(exist_ok=True, parents=True)
+            cv2.imwrite(str(self.snapshot_dir / f'frame_{frame_number:08d}.jpg'), vis_frame)
+        if not self.headless:
+            cv2.imshow('Vehicle and License Plate Detection', vis_frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                return False
+        return True
+
+    def close_windows(self):
+        if not self.headless:
+            cv2.destroyAllWindows()
+
+    def process_frame(self, frame, frame_number, fps):
+        vehicles = self.detect_vehicles(frame)
+        ended = self.tracker.update(vehicles, frame_number)
+        plates = self.read_plates(frame, vehicles, frame_number, fps)
+        for detection in self.tracker.collect(plates, ended):
+            self.record_detection(detection)
+        return vehicles, plates
+
+    def open_video(self, video_path, buffers=2, backend=None):
+        """FrameSource delivering frames already scaled to target_width; `buffers` must exceed
+        the number of frames held at once"""
         if not os.path.exists(video_path):
             logging.error(f"Video file not found: {video_path}")
-            return
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
+            return None
+        cap = FrameSource(video_path, target_width=self.target_width, buffers=buffers,
+                          backend=backend or self.capture_backend, metrics=self.metrics)
+        if not cap.open():
             logging.error(f"Failed to open video: {video_path}")
+            return None
+        self.metrics.add_collector('capture', cap.stats)
+        return cap
+
+    def open_writer(self, output_video_path, fps, size):
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        return cv2.VideoWriter(output_video_path, fourcc, fps/self.frame_skip, size)
+
+    def skip_frame(self, cap):
+        """Take a frame the frame skip leaves out off the stream without converting or scaling it"""
+        if not cap.grab():
+            return False
+        self.metrics.count('frames_read')
+        self.metrics.count('frames_skipped')
+        return True
+
+    def process_video(self, video_path, output_video_path=None):
+        # A batch of frames plus the one being read
+        cap = self.open_video(video_path, buffers=self.batch_size + 1)
+        if cap is None:
             return
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        scale_factor = self.target_width / width
+        fps = cap.fps
+        total_frames = cap.frame_count
+        out = None
         if output_video_path:
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out_width = self.target_width if scale_factor < 1 else width
-            out_height = int(height * scale_factor) if scale_factor < 1 else height
-            out = cv2.VideoWriter(output_video_path, fourcc, fps/self.frame_skip, (out_width, out_height))
+            out = self.open_writer(output_video_path, fps, cap.size)
         frame_count = 0
         processed_count = 0
-        logging.info(f"Starting video processing. Total frames: {total_frames}")
+        batch = []  # (frame_number, frame) pairs waiting for one batched YOLO call
+        controller = self.create_frame_skip_controller(fps)
+        logging.info(f"Starting video processing. Total frames: {total_frames} (batch size {self.batch_size})")
         try:
             while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
                 if frame_count % 100 == 0:
                     time.sleep(0.05)
-                if scale_factor < 1:
-                    frame = cv2.resize(frame, (self.target_width, int(height * scale_factor)))
                 if frame_count % self.frame_skip == 0:
-                    processed_frame = self.process_frame(frame, frame_count, fps)
-                    processed_count += 1
-                    if output_video_path:
-                        out.write(processed_frame)
-                    cv2.imshow('Vehicle and License Plate Detection', processed_frame)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    self.metrics.count('frames_read')
+                    batch.append((frame_count, frame))
+                elif not self.skip_frame(cap):
+                    break
+                frame_count += 1
+                if len(batch) >= self.batch_size:
+                    processed, keep_going = self.process_batch(batch, fps, out, controller)
+                    processed_count += processed
+                    batch = []
+                    if not keep_going:
                         logging.info("User requested to quit processing. Saving results...")
                         break
+                if frame_count % 30 == 0:
+                    progress = (frame_count / total_frames) * 100
+                    logging.info(f"Progress: {progress:.1f}% ({frame_count}/{total_frames} frames)")
+            if batch:
+                processed, _ = self.process_batch(batch, fps, out, controller)
+                processed_count += processed
+        except Exception as e:
+            logging.error(f"Processing error: {str(e)}")
+        finally:
+            self.flush_tracks()
+            cap.release()
+            if out is not None:
+                out.release()
+            self.close_windows()
+            self.save_results()
+            logging.info(f"Processing completed. Processed {processed_count} of {frame_count} frames, "
+                         f"capture {cap.stats()}")
+            if self.motion_gate is not None:
+                logging.info(f"Motion gate: {self.motion_gate.stats()}")
+
+    def process_batch(self, batch, fps, out=None, controller=None):
+        """Run one YOLO call over a batch of (frame_number, frame) pairs, then the usual
+        plate/OCR logic frame by frame in order. Returns (frames processed, keep going)."""
+        start = time.perf_counter()
+        frames = [frame for _, frame in batch]
+        processed = 0
+        keep_going = True
+        for (frame_number, frame), vehicles in zip(batch, self.detect_vehicles_batch(frames)):
+            ended = self.tracker.update(vehicles, frame_number)
+            plates = self.read_plates(frame, vehicles, frame_number, fps)
+            for detection in self.tracker.collect(plates, ended):
+                self.record_detection(detection)
+            processed += 1
+            if not self.emit_frame(frame, vehicles, plates, frame_number, out):
+                keep_going = False
+                break
+        # Once per batch: the frames of a batch finish back to back, so per-frame
+        # timings would only measure the gaps between them
+        if controller is not None and processed:
+            self.frame_processed(controller, processed, busy=time.perf_counter() - start)
+        return processed, keep_going
+
+    def process_video_pipelined(self, video_path, output_video_path=None):
+        """Like process_video(), but decoding, detection, OCR and DB writes each get their
+        own worker so a slow stage no longer holds up the others"""
+        # Enough capture buffers for every frame the pipeline can hold
+        cap = self.open_video(video_path, buffers=StagedPipeline.max_in_flight(self.pipeline_queue_size))
+        if cap is None:
+            return
+        fps = cap.fps
+        total_frames = cap.frame_count
+        out = None
+        if output_video_path:
+            out = self.open_writer(output_video_path, fps, cap.size)
+        frame_count = 0
+        processed_count = 0
+        controller = self.create_frame_skip_controller(fps)
+        logging.info(f"Starting pipelined video processing. Total frames: {total_frames}")
+
+        def read_frame():
+            nonlocal frame_count
+            while cap.isOpened():
+                frame_number = frame_count
+                if frame_number % self.frame_skip == 0:
+                    ret, frame = cap.read()
+                    if not ret:
+                        return None
+                    self.metrics.count('frames_read')
+                elif not self.skip_frame(cap):
+                    return None
                 frame_count += 1
                 if frame_count % 30 == 0:
                     progress = (frame_count / total_frames) * 100
                     logging.info(f"Progress: {progress:.1f}% ({frame_count}/{total_frames} frames)")
-                    if frame_count % 300 == 0:
-                        self.save_results()
-                        self.plate_detections.clear()
+                if frame_number % self.frame_skip == 0:
+                    return frame_number, frame
+            return None
+
+        def detect(item):
+            frame_number, frame = item
+            vehicles = self.detect_vehicles(frame)
+            ended = self.tracker.update(vehicles, frame_number)
+            return frame_number, frame, vehicles, ended
+
+        def recognize(item):
+            frame_number, frame, vehicles, ended = item
+            return frame_number, frame, vehicles, ended, self.read_plates(frame, vehicles, frame_number, fps)
+
+        busy = 0.0
+
+        def persist(item):
+            nonlocal busy
+            _, _, _, ended, plates = item
+            for detection in self.tracker.collect(plates, ended):
+                self.record_detection(detection)
+            # Stages overlap, so a frame costs what the busiest one spends on it
+            previous, busy = busy, pipeline.busy_time()
+            self.frame_processed(controller, busy=busy - previous)
+            return item
+
+        # Offline files wait for slow stages instead of dropping frames, unless told otherwise
+        pipeline = StagedPipeline(read_frame, detect, recognize, persist,
+                                  queue_size=self.pipeline_queue_size,
+                                  drop_policy=self.pipeline_drop_policy,
+                                  output_drop_policy=BLOCK)
+        self.metrics.add_collector('pipeline', lambda: {f"{name}_{key}": value
+                                                        for name, stats in pipeline.stats().items()
+                                                        for key, value in stats.items()})
+        pipeline.start()
+        try:
+            for frame_number, frame, vehicles, _, plates in pipeline.results():
+                processed_count += 1
+                if not self.emit_frame(frame, vehicles, plates, frame_number, out):
+                    logging.info("User requested to quit processing. Saving results...")
+                    pipeline.stop()
         except Exception as e:
             logging.error(f"Processing error: {str(e)}")
         finally:
+            pipeline.close()
+            self.flush_tracks()
             cap.release()
-            if output_video_path:
+            if out is not None:
                 out.release()
-            cv2.destroyAllWindows()
+            self.close_windows()
             self.save_results()
             logging.info(f"Processing completed. Processed {processed_count} of {frame_count} frames")
+            if self.motion_gate is not None:
+                logging.info(f"Motion gate: {self.motion_gate.stats()}")
+
+    def chunk_settings(self):
+        """What a chunk worker needs to process frames the way this detector would"""
+        line = self.tracker.line
+        roi = self.motion_gate.roi if self.motion_gate is not None else None
+        return {
+            'batch_size': self.batch_size,
+            'frame_skip': self.frame_skip,
+            'inference_size': self.inference_size,
+            'target_width': self.target_width,
+            'min_plate_confidence': self.min_plate_confidence,
+            'motion_gate': self.motion_gate is not None,
+            'roi': roi.tolist() if roi is not None else None,
+            'line': (line.start, line.end, line.entry_side) if line is not None else None,
+            'warm_up': self.warmup_enabled,
+            'backend': self.inference_backend,
+            'int8': self.inference_int8,
+        }
+
+    def apply_chunk_settings(self, settings):
+        self.batch_size = settings['batch_size']
+        self.frame_skip = settings['frame_skip']
+        self.inference_size = settings['inference_size']
+        self.target_width = settings['target_width']
+        self.min_plate_confidence = settings['min_plate_confidence']
+        self.headless = True
+        if settings['motion_gate']:
+            self.enable_motion_gate(settings['roi'])
+        if settings['line']:
+            start, end, entry_side = settings['line']
+            self.enable_counting_line((start, end), entry_side)
+
+    def process_range(self, video_path, start, end):
+        """Plate detections for frames [start, end) of a video, one chunk of process_video_parallel.
+        Nothing is persisted or drawn; tracks and the motion gate start afresh at `start`."""
+        # OpenCV's own decoder: chunks depend on frame-accurate seeking
+        cap = self.open_video(video_path, buffers=self.batch_size + 1, backend=OPENCV)
+        if cap is None:
+            raise RuntimeError(f"Cannot open {video_path}")
+        position = cap.set_position(start)
+        if position != start:
+            # Some containers cannot seek frame-accurately; decode up to the start instead
+            logging.warning(f"Seek to frame {start} landed on {position}, decoding from the beginning")
+            cap.set_position(0)
+            for _ in range(start):
+                cap.grab()
+        fps = cap.fps
+
+        self.tracker = VehicleTracker(line=self.tracker.line)
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+        detections = []
+        batch = []
+
+        def run_batch():
+            frames = [frame for _, frame in batch]
+            for (frame_number, frame), vehicles in zip(batch, self.detect_vehicles_batch(frames)):
+                ended = self.tracker.update(vehicles, frame_number)
+                plates = self.read_plates(frame, vehicles, frame_number, fps)
+                detections.extend(self.tracker.collect(plates, ended))
+            batch.clear()
+
+        try:
+            for frame_number in range(start, end):
+                if frame_number % self.frame_skip != 0:
+                    if not cap.grab():
+                        break
+                    continue
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                batch.append((frame_number, frame))
+                if len(batch) >= self.batch_size:
+                    run_batch()
+            if batch:
+                run_batch()
+            detections.extend(self.tracker.flush())
+        finally:
+            cap.release()
+        return detections
+
+    def merge_chunk_detections(self, detections, fps):
+        """Order chunk results by frame and drop duplicates of a plate within duplicate_window
+        seconds of video time, keeping the most confident read (as save_results does) - this is
+        what joins up a vehicle whose track was cut at a chunk boundary"""
+        index = PlateDedupIndex(window=self.duplicate_window)
+        kept = []
+        for detection in sorted(detections, key=lambda d: d['frame_number']):
+            if index.observe(detection, now=detection['frame_number'] / fps):
+                kept.append(detection)
+        return kept
+
+    def process_video_parallel(self, video_path, workers, chunk_frames=None):
+        """Split the video into frame ranges and process them in `workers` processes, each
+        with its own YOLO and OpenALPR, then merge and persist the plates in frame order"""
+        cap = self.open_video(video_path, backend=OPENCV)
+        if cap is None:
+            return
+        fps = cap.fps
+        total_frames = cap.frame_count
+        cap.release()
+        # Several chunks per worker so one slow stretch of video does not hold up the end
+        chunk_frames = chunk_frames or max(300, math.ceil(total_frames / (workers * 4)))
+        ranges = [(start, min(start + chunk_frames, total_frames)) for start in range(0, total_frames, chunk_frames)]
+        logging.info(f"Processing {total_frames} frames in {len(ranges)} chunks of {chunk_frames} "
+                     f"on {workers} worker processes")
+
+        results = {}
+        started = time.monotonic()
+        # spawn, not fork: each worker initialises its own CUDA context and OpenALPR instance
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_chunk_worker, initargs=(self.chunk_settings(),)) as pool:
+            futures = {pool.submit(_process_chunk, video_path, start, end): (start, end) for start, end in ranges}
+            self.mark_ready()
+            for done, future in enumerate(as_completed(futures), 1):
+                start, end = futures[future]
+                try:
+                    results[start] = future.result()
+                except Exception as e:
+                    logging.error(f"Chunk {start}-{end} failed: {e}")
+                    continue
+                logging.info(f"Chunk {start}-{end} done ({done}/{len(ranges)}), {len(results[start])} plates, "
+                             f"{time.monotonic() - started:.1f}s elapsed")
+
+        detections = self.merge_chunk_detections([d for start in sorted(results) for d in results[start]], fps)
+        for detection in detections:
+            self.persist_detection(detection)
+        logging.info(f"Parallel processing completed: {len(detections)} plates from {len(results)}/{len(ranges)} "
+                     f"chunks in {time.monotonic() - started:.1f}s")
+        self.save_results()
 
     def save_results(self):
+        """Append the run's best read per plate (confidence >= min_plate_confidence, more than
+        6 characters) to plate_detections.csv; the NDJSON file is already up to date"""
         try:
-            if self.plate_detections:
-                high_confidence_plates = [plate for plate in self.plate_detections
-                                        if (plate['text_confidence'] >= self.min_plate_confidence and
-                                            len(plate['license_plate']) > 6)]  # Updated to match >6 characters
-                if high_confidence_plates:
-                    best_detections = {}
-                    for plate in high_confidence_plates:
-                        plate_text = plate['license_plate']
-                        if plate_text not in best_detections or plate['text_confidence'] > best_detections[plate_text]['text_confidence']:
-                            best_detections[plate_text] = plate
-                    unique_plates = list(best_detections.values())
-                    df_plates = pd.DataFrame(unique_plates)
-                    column_order = [
-                        'date',
-                        'time',
-                        'license_plate',
-                        'text_confidence',
-                        'vehicle_type',
-                        'vehicle_confidence',
-                        'frame_number',
-                        'timestamp'
-                    ]
-                    df_plates = df_plates[column_order]
-                    output_file = self.output_dir / 'plate_detections.csv'
-                    df_plates.to_csv(output_file, index=False, mode='a', header=not output_file.exists())
-                    logging.info(f"Saved {len(unique_plates)} unique high-confidence plate detections (>6 characters)")
-                else:
-                    logging.info("No plate detections met the confidence and length threshold")
+            self.results_sink.export_csv(self.output_dir / 'plate_detections.csv')
         except Exception as e:
             logging.error(f"Error saving results: {str(e)}")
 
+    def warm_up(self, batch=1, runs=2):
+        """Push blank frames through YOLO and OpenALPR before capture starts. The first calls
+        build the predictor, initialise CUDA/cuDNN and grow allocators; done here, that time
+        is not taken out of the first vehicles at the gate"""
+        start = time.perf_counter()
+        frame = np.zeros((self.target_width * 9 // 16, self.target_width, 3), dtype=np.uint8)
+        for _ in range(runs):
+            self.vehicle_model([frame] * batch, classes=self.vehicle_classes, conf=0.5, imgsz=self.inference_size)
+        crop = frame[:frame.shape[0] // 2, :frame.shape[1] // 4]
+        self.recognize_crops([crop] * (self.ocr_pool.size if self.ocr_pool is not None else 1))
+        self.warmup_seconds = time.perf_counter() - start
+        logging.info(f"Warm-up done in {self.warmup_seconds:.2f}s (batch {batch}, imgsz {self.inference_size})")
+
+    def mark_ready(self):
+        self.readiness.set(warmup_seconds=self.warmup_seconds)
+        self.status_reporter.update(ready=True)
+
+    def create_frame_skip_controller(self, fps):
+        controller = AdaptiveFrameSkip(fps, target_fps=self.target_fps, adaptive=self.adaptive_frame_skip,
+                                       adapt_resolution=self.adapt_resolution)
+        controller.frame_skip = self.frame_skip
+        self.status_reporter.update(running=True)
+        self.status_reporter.start()
+        # Every runner gets here once its source is open, right before reading frames
+        self.mark_ready()
+        return controller
+
+    def frame_processed(self, controller, frames=1, busy=None):
+        self.metrics.count('frames_processed', frames)
+        if controller.frame_processed(frames, busy):
+            self.frame_skip = controller.frame_skip
+            self.inference_size = controller.inference_size
+        self.status_reporter.update(**controller.status())
+
+    def enable_ocr_pool(self, size):
+        """OCR crops in `size` OpenALPR worker processes instead of self.alpr alone"""
+        self.ocr_pool = AlprPool(size, raw_pixels=self.plate_reader.raw_pixels)
+        self.metrics.add_collector('ocr_pool', self.ocr_pool.stats)
+
+    def enable_motion_gate(self, roi=None):
+        """Skip detection on frames where nothing moves inside the lane's ROI polygon
+        (points in processed-frame pixels), and crop to the ROI before running YOLO"""
+        self.motion_gate = MotionGate(roi=roi)
+        self.metrics.add_collector('motion_gate', self.motion_gate.stats)
+
+    def enable_metrics_server(self, port, host='127.0.0.1'):
+        self.metrics_server = MetricsServer(self.metrics, port, host, ready=self.readiness.is_set)
+        self.metrics_server.start()
+
+    def enable_counting_line(self, line, entry_side=RIGHT):
+        """Record a vehicle only when it crosses `line` (two points in processed-frame pixels),
+        as an entry if it moves onto entry_side and an exit otherwise"""
+        self.tracker = VehicleTracker(line=CountingLine(*line, entry_side=entry_side))
+
+    def close(self):
+        """Flush detections still waiting for the database"""
+        if hasattr(self, 'readiness'):
+            self.readiness.clear()
+        if hasattr(self, 'results_sink'):
+            self.results_sink.close()
+            logging.info(f"Plate results: {self.results_sink.stats()}")
+        if hasattr(self, 'plate_index'):
+            logging.info(f"Plate dedup: {self.plate_index.stats()}")
+        if hasattr(self, 'status_reporter'):
+            self.status_reporter.update(running=False, fps=0)
+            self.status_reporter.stop()
+        # The writer first: a batch it fails to write on the way out still goes to the spool
+        if hasattr(self, 'db_writer'):
+            self.db_writer.close()
+        if getattr(self, 'spool_replayer', None):
+            self.spool_replayer.stop()
+            self.spool.close()
+        if getattr(self, 'ocr_pool', None):
+            self.ocr_pool.close()
+            self.ocr_pool = None
+        if getattr(self, 'metrics_server', None):
+            self.metrics_server.stop()
+
     def __del__(self):
         if hasattr(self, 'alpr') and self.alpr:
             self.alpr.unload()
 
+# Chunk workers for process_video_parallel: one detector per process, reused across chunks
+_chunk_detector = None
+
+
+def _init_chunk_worker(settings):
+    global _chunk_detector
+    # Workers only return detections; the parent persists them and owns the spool and endpoints
+    os.environ['SPOOL_PATH'] = ''
+    os.environ['FAILED_SPOOL_PATH'] = ''
+    os.environ.pop('METRICS_PORT', None)
+    os.environ.pop('PI_SERVER_URL', None)
+    os.environ.pop('READY_FILE', None)
+    _chunk_detector = VehicleAndPlateDetector(backend=settings['backend'], int8=settings['int8'])
+    _chunk_detector.apply_chunk_settings(settings)
+    if settings['warm_up']:
+        _chunk_detector.warm_up(batch=_chunk_detector.batch_size)
+
+
+def _process_chunk(video_path, start, end):
+    return _chunk_detector.process_range(video_path, start, end)
+
+
 def main():
-    detector = VehicleAndPlateDetector()
-    video_path = 'Martin.mp4'
-    output_video_path = 'output/detected_vehicles_and_plates.mp4'
+    parser = argparse.ArgumentParser(description='Vehicle and license plate detection on a recorded video')
+    parser.add_argument('video_path', nargs='?', default='Martin.mp4')
+    parser.add_argument('--output', default='output/detected_vehicles_and_plates.mp4',
+                        help='Annotated output video path (empty to skip writing one)')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Decoded frames sent to YOLO in a single call')
+    parser.add_argument('--motion-gate', action='store_true',
+                        help='Skip YOLO on frames without motion inside the ROI')
+    parser.add_argument('--roi', type=parse_polygon,
+                        help='Lane polygon as "x1,y1;x2,y2;x3,y3;..." in processed-frame pixels')
+    parser.add_argument('--line', type=parse_line,
+                        help='Counting line as "x1,y1;x2,y2"; entry/exit comes from the direction vehicles cross it')
+    parser.add_argument('--entry-side', choices=[LEFT, RIGHT], default=RIGHT,
+                        help='Side of the line (facing from its first point to its second) that is inside the lot')
+    parser.add_argument('--adaptive-skip', action='store_true',
+                        help='Raise/lower frame skip to keep up with the source (or --target-fps)')
+    parser.add_argument('--adapt-resolution', action='store_true',
+                        help='Let the adaptive controller also lower YOLO inference size')
+    parser.add_argument('--target-fps', type=float, help='Source frames per second to keep up with')
+    parser.add_argument('--headless', action='store_true',
+                        help='No preview window; only annotate frames that are written somewhere')
+    parser.add_argument('--snapshot-every', type=int, default=0,
+                        help='Save an annotated debug snapshot every N processed frames')
+    parser.add_argument('--ocr-workers', type=int, default=0,
+                        help='OCR crops in this many OpenALPR worker processes (0: in-process)')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Serve Prometheus metrics on this local port (also METRICS_PORT)')
+    parser.add_argument('--backend', choices=BACKENDS + (AUTO,),
+                        help='Vehicle model runtime (also INFERENCE_BACKEND; default auto)')
+    parser.add_argument('--int8', action='store_true',
+                        help='Use an INT8 export with onnx/openvino (also INFERENCE_INT8=1)')
+    parser.add_argument('--ready-file', help='Write this file once ready to process frames (also READY_FILE)')
+    parser.add_argument('--no-warmup', action='store_true',
+                        help='Skip the warm-up pass; the first frames then pay for model initialisation')
+    parser.add_argument('--capture-backend', choices=[CAPTURE_AUTO, GSTREAMER, OPENCV], default=CAPTURE_AUTO,
+                        help='Decode through a GStreamer pipeline that scales, or OpenCV plus one resize pass')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='Run decoding, detection, OCR and DB writes as separate workers')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Split the video into chunks processed by this many processes (no output video)')
+    parser.add_argument('--chunk-frames', type=int, help='Frames per chunk with --workers')
+    parser.add_argument('--queue-size', type=int, default=8, help='Frames buffered between pipeline stages')
+    parser.add_argument('--drop-policy', choices=[DROP_OLDEST, BLOCK], default=BLOCK,
+                        help='What the pipeline does when detection falls behind decoding')
+    args = parser.parse_args()
+
+    detector = VehicleAndPlateDetector(backend=args.backend, int8=args.int8 or None)
+    detector.batch_size = max(1, args.batch_size)
+    if args.motion_gate or args.roi:
+        detector.enable_motion_gate(args.roi)
+    if args.line:
+        detector.enable_counting_line(args.line, args.entry_side)
+    detector.adaptive_frame_skip = args.adaptive_skip or args.adapt_resolution
+    detector.adapt_resolution = args.adapt_resolution
+    detector.target_fps = args.target_fps
+    detector.headless = args.headless
+    detector.snapshot_interval = args.snapshot_every
+    if args.ocr_workers > 0:
+        detector.enable_ocr_pool(args.ocr_workers)
+    detector.pipeline_queue_size = args.queue_size
+    if args.metrics_port and detector.metrics_server is None:
+        detector.enable_metrics_server(args.metrics_port)
+    detector.pipeline_drop_policy = args.drop_policy
+    detector.capture_backend = args.capture_backend
+    if args.ready_file:
+        detector.readiness.path = Path(args.ready_file)
+    detector.warmup_enabled = not args.no_warmup
+    # With --workers the chunk processes warm up their own models
+    if detector.warmup_enabled and args.workers <= 0:
+        detector.warm_up(batch=detector.batch_size)
+    video_path = args.video_path
+    output_video_path = args.output
     logging.info(f"Starting video processing: {video_path}")
-    detector.process_video(video_path, output_video_path)
-    detector.save_results()
+    if args.workers > 0:
+        detector.process_video_parallel(video_path, args.workers, args.chunk_frames)
+    elif args.pipelined:
+        detector.process_video_pipelined(video_path, output_video_path)
+    else:
+        detector.process_video(video_path, output_video_path)
+    detector.close()
     logging.info("Processing completed successfully")
 
 if __name__ == "__main__":
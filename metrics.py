@@ -0,0 +1,192 @@
+import bisect
+import logging
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds; wide enough for a sub-millisecond dedup lookup and a multi-second DB stall
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Characters Prometheus allows in a metric name
+INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_:]')
+
+
+def metric_name(name):
+    return INVALID_NAME_CHARS.sub('_', name)
+
+
+def label_set(labels):
+    """{camera="north-in"} for a tuple of (name, value) pairs, '' for none"""
+    if not labels:
+        return ''
+    values = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        values.append(f'{metric_name(key)}="{value}"')
+    return '{' + ','.join(values) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None past the last bucket)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+
+class DetectorMetrics:
+    """Per-stage timing histograms, event counters and on-demand gauges for the detector.
+
+    observe() and count() only bisect a short tuple and bump integers under a lock, cheap
+    enough to leave on for every frame. Gauges such as queue depth or spool backlog are not
+    recorded as they change; collectors are called when someone reads the metrics. A collector
+    registered with labels, e.g. one per camera, reports each gauge as a labelled sample of
+    the same metric (anpr_capture_width{camera="north-in"}) rather than a metric of its own.
+    """
+
+    def __init__(self, prefix='anpr', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.histograms = {}  # stage -> Histogram
+        self.counters = {}  # name -> int
+        self.collectors = {}  # (name, labels) -> callable returning {gauge name: number}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_collector(self, name, fn, labels=None):
+        self.collectors[(name, tuple(sorted(labels.items())) if labels else ())] = fn
+
+    def _gauges(self):
+        """{(metric name, label set): number} from every collector"""
+        gauges = {}
+        for (name, labels), fn in list(self.collectors.items()):
+            try:
+                values = fn()
+            except Exception as e:
+                logging.debug(f"Metrics collector {name} failed: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                gauges[(metric_name(f"{name}_{key}"), label_set(labels))] = value
+        return gauges
+
+    def render(self):
+        """Prometheus text exposition format"""
+        p = self.prefix
+        lines = [f"# TYPE {p}_stage_duration_seconds histogram"]
+        with self._lock:
+            histograms = [(stage, list(h.counts), h.count, h.sum) for stage, h in sorted(self.histograms.items())]
+            counters = sorted(self.counters.items())
+        for stage, counts, count, total in histograms:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{p}_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{p}_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{p}_stage_duration_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{p}_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+        for name, value in counters:
+            name = metric_name(name)
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines.append(f"{p}_{name}_total {value}")
+        typed = set()
+        for (name, labels), value in sorted(self._gauges().items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Compact form for the detector_status event"""
+        stages = {}
+        with self._lock:
+            for stage, h in self.histograms.items():
+                p95 = h.quantile(0.95)
+                stages[stage] = {
+                    'count': h.count,
+                    'avg_ms': round(h.sum / h.count * 1000, 2) if h.count else 0.0,
+                    'p95_ms': None if p95 is None else p95 * 1000,  # Bucket upper bound
+                }
+            counters = dict(self.counters)
+        gauges = {name + labels: value for (name, labels), value in self._gauges().items()}
+        return {'stages': stages, 'counters': counters, 'gauges': gauges}
+
+
+class MetricsServer:
+    """Serves DetectorMetrics.render() at http://host:port/metrics from a daemon thread, and
+    /ready (200 once ready() is true, 503 before) for startup and readiness probes"""
+
+    def __init__(self, metrics, port, host='127.0.0.1', ready=None):
+        self.metrics = metrics
+        self.ready = ready
+        self.port = port
+        self.host = host
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        metrics = self.metrics
+        ready = self.ready
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path == '/ready' and ready is not None:
+                    is_ready = ready()
+                    body = b'ready\n' if is_ready else b'starting\n'
+                    self.send_response(200 if is_ready else 503)
+                    self.send_header('Content-Type', 'text/plain')
+                elif path in ('/metrics', '/'):
+                    body = metrics.render().encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                else:
+                    self.send_error(404)
+                    return
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+        logging.info(f"Serving metrics at http://{self.host}:{self._server.server_address[1]}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+
+
+def parse_polygon(text):
+    """Parse 'x1,y1;x2,y2;x3,y3' into a list of (x, y) points"""
+    points = [tuple(int(v) for v in point.split(',')) for point in text.split(';') if point.strip()]
+    if len(points) < 3:
+        raise ValueError(f"ROI polygon needs at least 3 points, got {len(points)}")
+    return points
+
+
+def offset_vehicles(vehicles, dx, dy):
+    """Shift boxes detected in a crop back into full-frame coordinates"""
+    for vehicle in vehicles:
+        x1, y1, x2, y2 = vehicle['bbox']
+        vehicle['bbox'] = (x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+    return vehicles
+
+
+class MotionGate:
+    """Cheap pre-filter that decides whether a frame is worth running YOLO on.
+
+    Each frame is downscaled, greyed and compared against a running-average
+    background. If fewer than min_motion_fraction of the pixels inside the lane's
+    ROI polygon changed, the frame is skipped. Detection keeps running for
+    hold_frames after motion stops so a vehicle pausing at the barrier still gets
+    its OCR samples. check() returns the ROI's bounding box so the caller can
+    crop before inference.
+    """
+
+    def __init__(self, roi=None, scale=0.25, diff_threshold=25, min_motion_fraction=0.005,
+                 hold_frames=15, learning_rate=0.2):
+        self.roi = np.array(roi, np.int32) if roi else None
+        self.scale = scale
+        self.diff_threshold = diff_threshold
+        self.min_motion_fraction = min_motion_fraction
+        self.hold_frames = hold_frames
+        self.learning_rate = learning_rate
+
+        self._frame_shape = None
+        self._background = None
+        self._mask = None
+        self._mask_area = 0
+        self._box = None
+        self._hold = 0
+
+        # Counters
+        self.frames_checked = 0
+        self.frames_skipped = 0
+
+    def _setup(self, frame_shape, small_shape):
+        frame_height, frame_width = frame_shape[:2]
+        self._frame_shape = frame_shape
+        if self.roi is None:
+            self._box = (0, 0, frame_width, frame_height)
+            self._mask = None
+            self._mask_area = small_shape[0] * small_shape[1]
+            return
+        x, y, w, h = cv2.boundingRect(self.roi)
+        self._box = (max(0, x), max(0, y), min(frame_width, x + w), min(frame_height, y + h))
+        self._mask = np.zeros(small_shape[:2], np.uint8)
+        small_roi = np.round(self.roi * [small_shape[1] / frame_width, small_shape[0] / frame_height]).astype(np.int32)
+        cv2.fillPoly(self._mask, [small_roi], 255)
+        self._mask_area = max(1, cv2.countNonZero(self._mask))
+
+    def check(self, frame):
+        """Return the (x1, y1, x2, y2) region to run detection on, or None to skip this frame"""
+        self.frames_checked += 1
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self._background is None or frame.shape != self._frame_shape:
+            self._setup(frame.shape, gray.shape)
+            self._background = gray.astype(np.float32)
+            self._hold = self.hold_frames
+            return self._box
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        cv2.accumulateWeighted(gray, self._background, self.learning_rate)
+        _, moving = cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY)
+        if self._mask is not None:
+            moving = cv2.bitwise_and(moving, self._mask)
+
+        if cv2.countNonZero(moving) / self._mask_area >= self.min_motion_fraction:
+            self._hold = self.hold_frames
+        elif self._hold > 0:
+            self._hold -= 1
+        else:
+            self.frames_skipped += 1
+            return None
+        return self._box
+
+    def reset(self):
+        """Forget the background, e.g. after seeking; the next frame starts a fresh one"""
+        self._background = None
+
+    def stats(self):
+        return {
+            'frames_checked': self.frames_checked,
+            'frames_skipped': self.frames_skipped,
+            'skip_ratio': round(self.frames_skipped / self.frames_checked, 3) if self.frames_checked else 0.0,
+        }
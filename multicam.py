@@ -0,0 +1,191 @@
+import json
+import logging
+import time
+
+from capture import FrameSource, AUTO
+from dedup import PlateDedupIndex
+from line_crossing import CountingLine, parse_line, RIGHT
+from motion_gate import MotionGate, parse_polygon
+from tracker import VehicleTracker
+
+ENTRY = 'entry'
+EXIT = 'exit'
+
+
+class CameraLane:
+    """One gate camera and the state that must not be shared with the others:
+    its capture, vehicle tracks, motion gate and recent plates"""
+
+    def __init__(self, name, source, role=ENTRY, roi=None, flip=-1, motion_gate=False, duplicate_window=30,
+                 line=None, entry_side=RIGHT):
+        if role not in (ENTRY, EXIT):
+            raise ValueError(f"Camera {name}: role must be '{ENTRY}' or '{EXIT}', got {role!r}")
+        self.name = name
+        self.source = source
+        self.role = role
+        self.roi = roi
+        self.flip = flip  # cv2.flip code (-1 both axes, 0 vertical, 1 horizontal), None to leave as is
+
+        # With a counting line, is_entry comes from the direction of travel instead of the role
+        self.tracker = VehicleTracker(line=CountingLine(*line, entry_side=entry_side) if line else None)
+        # An entry read and the exit read of the same car are both real events, so
+        # duplicates are only suppressed within a lane
+        self.plate_index = PlateDedupIndex(window=duplicate_window)
+        self.motion_gate = MotionGate(roi=roi) if motion_gate or roi else None
+
+        self.cap = None
+        self.fps = 30
+        self.frame_count = 0
+
+    @property
+    def is_entry(self):
+        return self.role == ENTRY
+
+    def open(self, capture_width=None, backend=AUTO, metrics=None):
+        self.cap = FrameSource(self.source, target_width=capture_width, flip=self.flip, backend=backend,
+                               metrics=metrics)
+        if not self.cap.open():
+            logging.error(f"Camera {self.name}: failed to open {self.source}")
+            self.cap = None
+            return False
+        self.fps = self.cap.fps
+        if metrics is not None:
+            metrics.add_collector('capture', self.cap.stats, labels={'camera': self.name})
+        logging.info(f"Camera {self.name} ({self.role}): opened {self.source} at {self.fps:.1f} fps")
+        return True
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+def load_cameras(path, motion_gate=False, duplicate_window=30):
+    """Read camera lanes from a JSON list such as
+    [{"name": "north-in", "source": 0, "role": "entry", "roi": "x1,y1;x2,y2;x3,y3", "flip": -1}, ...]
+    roi may also be a list of [x, y] points; flip defaults to -1 like the single-camera loop.
+    A lane watching both directions can instead set "line": "x1,y1;x2,y2" and "entry_side"."""
+    with open(path) as f:
+        entries = json.load(f)
+    cameras = []
+    for i, entry in enumerate(entries):
+        roi = entry.get('roi')
+        if isinstance(roi, str):
+            roi = parse_polygon(roi)
+        elif roi:
+            roi = [tuple(point) for point in roi]
+        line = entry.get('line')
+        if isinstance(line, str):
+            line = parse_line(line)
+        elif line:
+            line = [tuple(point) for point in line]
+        source = entry['source']
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        cameras.append(CameraLane(entry.get('name', f'cam{i}'), source,
+                                  role=entry.get('role', ENTRY), roi=roi, flip=entry.get('flip', -1),
+                                  motion_gate=motion_gate, duplicate_window=duplicate_window,
+                                  line=line, entry_side=entry.get('entry_side', RIGHT)))
+    names = [camera.name for camera in cameras]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Camera names must be unique: {names}")
+    return cameras
+
+
+class MultiCameraRunner:
+    """Drives several gate cameras from one VehicleAndPlateDetector, so YOLO and OpenALPR
+    are loaded once, and the DB writer and spool are shared.
+
+    Every cycle grabs a frame from each open camera first and decodes them afterwards,
+    which keeps the lanes close in time. It then runs vehicle detection on all of them
+    in one batched YOLO call. Tracking, OCR scheduling and duplicate suppression stay
+    per camera. Each detection is tagged with its camera's name, and is_entry comes
+    from the camera's role.
+    """
+
+    def __init__(self, detector, cameras):
+        self.detector = detector
+        self.cameras = cameras
+        self.cycles = 0
+
+    def read_frames(self, decode=True):
+        """One frame per open camera as (camera, frame) pairs; cameras that stop delivering are closed.
+        Each camera's capture flips and scales its frame, in the decoder where it can. With
+        decode=False the frames are only taken off the streams and come back as None."""
+        live = [camera for camera in self.cameras if camera.cap is not None]
+        grabbed = [(camera, camera.cap.grab()) for camera in live]
+        frames = []
+        for camera, ok in grabbed:
+            if ok and not decode:
+                frames.append((camera, None))
+                continue
+            frame = camera.cap.retrieve()[1] if ok else None
+            if frame is None:
+                logging.warning(f"Camera {camera.name}: stream ended after {camera.frame_count} frames")
+                camera.release()
+                continue
+            frames.append((camera, frame))
+        self.detector.metrics.count('frames_read', len(frames))
+        return frames
+
+    def tag(self, camera, plates):
+        for plate in plates:
+            plate['detection']['camera'] = camera.name
+            plate['detection']['is_entry'] = camera.is_entry
+
+    def process_cycle(self, frames):
+        detector = self.detector
+        batch_vehicles = detector.detect_vehicles_batch([frame for _, frame in frames],
+                                                        [camera.motion_gate for camera, _ in frames])
+        results = []
+        for (camera, frame), vehicles in zip(frames, batch_vehicles):
+            frame_number = camera.frame_count
+            ended = camera.tracker.update(vehicles, frame_number)
+            plates = detector.read_plates(frame, vehicles, frame_number, camera.fps, tracker=camera.tracker)
+            self.tag(camera, plates)
+            for detection in camera.tracker.collect(plates, ended):
+                detector.save_detection(detection, plate_index=camera.plate_index)
+            results.append((camera, frame, vehicles, plates))
+        return results
+
+    def run(self):
+        detector = self.detector
+        opened = [camera for camera in self.cameras
+                  if camera.open(detector.capture_width, detector.capture_backend, detector.metrics)]
+        if not opened:
+            logging.error("No camera could be opened")
+            return
+        controller = self.detector.create_frame_skip_controller(min(camera.fps for camera in opened))
+        logging.info(f"Starting multi-camera processing: {', '.join(f'{c.name} ({c.role})' for c in opened)}")
+
+        try:
+            while True:
+                process = self.cycles % self.detector.frame_skip == 0
+                frames = self.read_frames(decode=process)
+                if not frames:
+                    break
+                keep_going = True
+                if process:
+                    # The cameras' reads above may have waited on them; only count the processing
+                    start = time.perf_counter()
+                    for camera, frame, vehicles, plates in self.process_cycle(frames):
+                        if not self.detector.emit_frame(frame, vehicles, plates, camera.frame_count,
+                                                        camera=camera.name):
+                            keep_going = False
+                    self.detector.frame_processed(controller, busy=time.perf_counter() - start)
+                for camera, _ in frames:
+                    camera.frame_count += 1
+                self.cycles += 1
+                if not keep_going:
+                    break
+        except Exception as e:
+            logging.error(f"Processing error: {str(e)}")
+        finally:
+            for camera in self.cameras:
+                for detection in camera.tracker.flush():
+                    self.detector.save_detection(detection, plate_index=camera.plate_index)
+                camera.release()
+                logging.info(f"Camera {camera.name}: {camera.frame_count} frames, plates {camera.plate_index.stats()}"
+                             + (f", motion gate {camera.motion_gate.stats()}" if camera.motion_gate else ""))
+            self.detector.close_windows()
+            logging.info(f"Multi-camera processing completed after {self.cycles} cycles")
@@ -0,0 +1,195 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+
+# OpenALPR setup shared by the detectors and the OCR worker processes
+ALPR_COUNTRY = "us"
+ALPR_CONFIG = "/etc/openalpr/openalpr.conf"
+ALPR_RUNTIME_DATA = "/usr/local/share/openalpr/runtime_data"
+
+
+def load_alpr(country=ALPR_COUNTRY, config=ALPR_CONFIG, runtime_data=ALPR_RUNTIME_DATA):
+    """OpenALPR instance; the bindings are only imported when one is actually needed"""
+    from openalpr import Alpr
+    return Alpr(country, config, runtime_data)
+
+
+def encode_crop_jpeg(crop):
+    ret, jpeg_bytes = cv2.imencode('.jpg', crop)
+    return jpeg_bytes.tobytes() if ret else None
+
+
+class PlateReader:
+    """Runs OpenALPR on BGR vehicle crops.
+
+    With raw_pixels=True the crop's pixel buffer goes straight to OpenALPR's raw-image
+    entry point (recognize_ndarray): no JPEG encode on our side and no decode on its
+    side, and a crop sliced out of a frame only costs one contiguous copy. If the
+    bindings were built without raw support it falls back to the JPEG round trip.
+    """
+
+    def __init__(self, alpr, raw_pixels=True):
+        self.alpr = alpr
+        self.raw_pixels = raw_pixels and hasattr(alpr, 'recognize_ndarray')
+
+    def recognize(self, crop):
+        if self.raw_pixels:
+            try:
+                return self.alpr.recognize_ndarray(np.ascontiguousarray(crop))
+            except RuntimeError as e:
+                # Raised when the bindings were built without NumPy support
+                logging.warning(f"Raw-pixel OCR unavailable, falling back to JPEG: {e}")
+                self.raw_pixels = False
+        jpeg_bytes = encode_crop_jpeg(crop)
+        if jpeg_bytes is None:
+            return {'results': []}
+        return self.alpr.recognize_array(jpeg_bytes)
+
+
+def _pool_worker(worker_id, tasks, results, country, config, runtime_data, raw_pixels):
+    alpr = load_alpr(country, config, runtime_data)
+    if not alpr.is_loaded():
+        results.put(('failed', worker_id, "OpenALPR failed to load"))
+        return
+    reader = PlateReader(alpr, raw_pixels=raw_pixels)
+    results.put(('ready', worker_id, os.getpid()))
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, crop = task
+            try:
+                results.put(('result', task_id, reader.recognize(crop)))
+            except Exception as e:
+                results.put(('error', task_id, str(e)))
+    finally:
+        alpr.unload()
+
+
+class AlprPool:
+    """OpenALPR instances in separate processes, so several vehicle crops are OCR'd in parallel.
+
+    recognize_many() fans a list of crops out to the workers and returns their
+    results in the same order. A crop whose worker errors, dies or misses the
+    timeout gets an empty result. Dead workers are replaced on the next call.
+    """
+
+    def __init__(self, size, country=ALPR_COUNTRY, config=ALPR_CONFIG, runtime_data=ALPR_RUNTIME_DATA,
+                 raw_pixels=True, result_timeout=10.0, start_timeout=60.0):
+        # spawn, not fork: the parent already runs DB/spool threads and OpenCV state
+        self._ctx = multiprocessing.get_context('spawn')
+        self.size = size
+        self.worker_args = (country, config, runtime_data, raw_pixels)
+        self.result_timeout = result_timeout
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self.workers = {}
+
+        # Counters
+        self.in_flight = 0
+        self.completed = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+        for worker_id in range(size):
+            self._start_worker(worker_id)
+        self._wait_ready(set(self.workers), start_timeout)
+
+    def _start_worker(self, worker_id):
+        process = self._ctx.Process(target=_pool_worker, name=f'alpr-worker-{worker_id}', daemon=True,
+                                    args=(worker_id, self._tasks, self._results) + self.worker_args)
+        process.start()
+        self.workers[worker_id] = process
+
+    def _wait_ready(self, worker_ids, timeout):
+        deadline = time.monotonic() + timeout
+        pending = set(worker_ids)
+        while pending and time.monotonic() < deadline:
+            try:
+                kind, worker_id, info = self._results.get(timeout=0.5)
+            except queue.Empty:
+                # Stop waiting for workers that already exited
+                pending = {w for w in pending if self.workers[w].is_alive()}
+                continue
+            if kind == 'failed':
+                self.close()
+                raise RuntimeError(f"OCR worker {worker_id}: {info}")
+            if kind == 'ready':
+                pending.discard(worker_id)
+        if pending:
+            logging.warning(f"OCR workers {sorted(pending)} not ready after {timeout:.0f}s")
+        logging.info(f"OCR pool ready with {self.size - len(pending)} of {self.size} workers")
+
+    def _replace_dead_workers(self):
+        dead = [worker_id for worker_id, process in self.workers.items() if not process.is_alive()]
+        for worker_id in dead:
+            logging.warning(f"OCR worker {worker_id} died (exit code {self.workers[worker_id].exitcode}), restarting")
+            self.restarts += 1
+            self._start_worker(worker_id)
+        if dead:
+            self._wait_ready(dead, 60.0)
+
+    def recognize_many(self, crops):
+        if not crops:
+            return []
+        with self._lock:
+            self._replace_dead_workers()
+            order = {}
+            for i, crop in enumerate(crops):
+                task_id = next(self._task_ids)
+                order[task_id] = i
+                self._tasks.put((task_id, np.ascontiguousarray(crop)))
+            self.in_flight += len(crops)
+
+            results = [{'results': []} for _ in crops]
+            deadline = time.monotonic() + self.result_timeout
+            while order:
+                try:
+                    kind, task_id, payload = self._results.get(timeout=max(0.01, deadline - time.monotonic()))
+                except queue.Empty:
+                    self.timeouts += len(order)
+                    logging.warning(f"OCR pool timed out waiting for {len(order)} crops")
+                    break
+                if task_id not in order:
+                    continue  # Late answer for a crop that already timed out
+                i = order.pop(task_id)
+                self.in_flight -= 1
+                if kind == 'result':
+                    results[i] = payload
+                    self.completed += 1
+                else:
+                    self.errors += 1
+                    logging.warning(f"Plate detection error: {payload}")
+            # Timed out crops are no longer awaited
+            self.in_flight -= len(order)
+            return results
+
+    def stats(self):
+        return {
+            'workers': self.size,
+            'alive': sum(process.is_alive() for process in self.workers.values()),
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'restarts': self.restarts,
+        }
+
+    def close(self):
+        for _ in self.workers:
+            self._tasks.put(None)
+        for process in self.workers.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        logging.info(f"OCR pool closed: {self.stats()}")
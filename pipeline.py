@@ -0,0 +1,219 @@
+import logging
+import threading
+import time
+from collections import deque
+
+# Queue drop policies
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+
+# Marks the end of the stream as it travels down the stages
+STOP = object()
+
+
+class BoundedQueue:
+    """Fixed-size FIFO between two pipeline stages with a configurable drop policy"""
+
+    def __init__(self, name, maxsize, drop_policy=DROP_OLDEST):
+        if drop_policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.drop_policy = drop_policy
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+        # Stats
+        self.put_count = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item, force=False):
+        """Add an item; returns False if an older item had to be dropped to make room"""
+        with self._lock:
+            dropped = False
+            if not force:
+                if self.drop_policy == BLOCK:
+                    while len(self._items) >= self.maxsize:
+                        self._not_full.wait()
+                elif len(self._items) >= self.maxsize:
+                    # Never drop the end-of-stream marker
+                    for i, queued in enumerate(self._items):
+                        if queued is not STOP:
+                            del self._items[i]
+                            self.dropped += 1
+                            dropped = True
+                            break
+            self._items.append(item)
+            self.put_count += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._not_empty.notify()
+            return not dropped
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item, or raise TimeoutError"""
+        with self._lock:
+            if not self._not_empty.wait_for(lambda: self._items, timeout):
+                raise TimeoutError(f"Queue {self.name} is empty")
+            item = self._items.popleft()
+            self._not_full.notify()
+            return item
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'depth': len(self._items),
+                'max_depth': self.max_depth,
+                'maxsize': self.maxsize,
+                'put': self.put_count,
+                'dropped': self.dropped,
+            }
+
+
+class StageWorker(threading.Thread):
+    """Runs one pipeline stage: pull from the inbox, call fn, push the result to the outbox"""
+
+    def __init__(self, name, fn, inbox, outbox):
+        super().__init__(name=f'{name}-stage', daemon=True)
+        self.stage_name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.processed = 0
+        self.busy_time = 0.0
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            if item is STOP:
+                if self.outbox is not None:
+                    self.outbox.put(STOP, force=True)
+                break
+            start = time.perf_counter()
+            try:
+                result = self.fn(item)
+            except Exception as e:
+                logging.error(f"{self.stage_name} stage error: {str(e)}")
+                result = None
+            self.busy_time += time.perf_counter() - start
+            self.processed += 1
+            if result is not None and self.outbox is not None:
+                self.outbox.put(result)
+
+
+class StagedPipeline:
+    """Capture -> detect -> OCR -> persist workers joined by bounded queues.
+
+    read_frame() returns the next (frame_number, frame) or None at end of stream.
+    detect, recognize and persist each take the previous stage's item and return
+    the next one (None drops it). Whatever persist returns is exposed through
+    results() so the caller's thread can display or write it.
+    """
+
+    STAGES = ('detect', 'ocr', 'persist', 'output')
+
+    @staticmethod
+    def max_in_flight(queue_size):
+        """Most frames alive at once: every queue full, plus one in the capture thread, in each
+        worker and with the consumer of results()"""
+        return queue_size * 7 + 5
+
+    def __init__(self, read_frame, detect, recognize, persist,
+                 queue_size=8, drop_policy=DROP_OLDEST, output_drop_policy=DROP_OLDEST,
+                 stats_interval=10.0):
+        self.read_frame = read_frame
+        self.stats_interval = stats_interval
+        # Frames waiting for detection honour the configured policy; everything
+        # after that has already paid for inference, so it waits instead of dropping
+        self.queues = {
+            'detect': BoundedQueue('detect', queue_size, drop_policy),
+            'ocr': BoundedQueue('ocr', queue_size, BLOCK),
+            'persist': BoundedQueue('persist', queue_size * 4, BLOCK),
+            'output': BoundedQueue('output', queue_size, output_drop_policy),
+        }
+        self.workers = [
+            StageWorker('detect', detect, self.queues['detect'], self.queues['ocr']),
+            StageWorker('ocr', recognize, self.queues['ocr'], self.queues['persist']),
+            StageWorker('persist', persist, self.queues['persist'], self.queues['output']),
+        ]
+        self.capture_thread = threading.Thread(target=self._capture_loop, name='capture-stage', daemon=True)
+        self.captured = 0
+        self._stop_event = threading.Event()
+        self._drained = False
+
+    def _capture_loop(self):
+        last_stats = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                item = self.read_frame()
+                if item is None:
+                    break
+                self.captured += 1
+                self.queues['detect'].put(item)
+                if self.stats_interval and time.monotonic() - last_stats >= self.stats_interval:
+                    logging.info(f"Pipeline stats: {self.format_stats()}")
+                    last_stats = time.monotonic()
+        except Exception as e:
+            logging.error(f"capture stage error: {str(e)}")
+        finally:
+            self.queues['detect'].put(STOP, force=True)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self.capture_thread.start()
+        return self
+
+    def stop(self):
+        """Stop capturing; frames already queued still drain through every stage"""
+        self._stop_event.set()
+
+    def results(self):
+        """Yield persist-stage outputs in order until the stream ends"""
+        while True:
+            item = self.queues['output'].get()
+            if item is STOP:
+                self._drained = True
+                break
+            yield item
+
+    def join(self):
+        self.capture_thread.join()
+        for worker in self.workers:
+            worker.join()
+
+    def close(self):
+        """Stop capture, let queued work finish and wait for every stage to exit"""
+        self.stop()
+        if not self._drained:
+            for _ in self.results():
+                pass
+        self.join()
+        logging.info(f"Pipeline finished: {self.format_stats()}")
+
+    def busy_time(self):
+        """Seconds the busiest stage has spent working so far; that stage sets the throughput"""
+        return max(worker.busy_time for worker in self.workers)
+
+    def stats(self):
+        stats = {name: queue.stats() for name, queue in self.queues.items()}
+        for worker in self.workers:
+            stats[worker.stage_name].update({
+                'processed': worker.processed,
+                'busy_seconds': round(worker.busy_time, 3),
+            })
+        stats['capture'] = {'captured': self.captured}
+        return stats
+
+    def format_stats(self):
+        parts = [f"captured={self.captured}"]
+        for name in self.STAGES:
+            s = self.queues[name].stats()
+            parts.append(f"{name}: depth={s['depth']}/{s['maxsize']} max={s['max_depth']} dropped={s['dropped']}")
+        return ", ".join(parts)
@@ -0,0 +1,161 @@
+import argparse
+import csv
+import json
+import logging
+import threading
+from pathlib import Path
+
+# Columns of plate_detections.csv, in order, with the type each record field is written as
+CSV_COLUMNS = [
+    ('date', str),
+    ('time', str),
+    ('license_plate', str),
+    ('text_confidence', float),
+    ('vehicle_type', str),
+    ('vehicle_confidence', float),
+    ('frame_number', int),
+    ('timestamp', float),
+    ('track_id', int),
+]
+# Written to NDJSON when present, not part of the CSV layout
+OPTIONAL_FIELDS = [('is_entry', bool), ('camera', str), ('replaces', str)]
+
+
+def to_record(detection):
+    record = {}
+    for name, kind in CSV_COLUMNS + OPTIONAL_FIELDS:
+        value = detection.get(name)
+        record[name] = kind(value) if value is not None else None
+    return record
+
+
+def best_per_plate(records):
+    """Highest-confidence record per plate text, in order of each plate's first appearance"""
+    best = {}
+    for record in records:
+        # A better read of the same vehicle under another spelling supersedes the old one
+        replaced = best.get(record.get('replaces'))
+        if replaced is not None and replaced['text_confidence'] < record['text_confidence']:
+            del best[record['replaces']]
+        current = best.get(record['license_plate'])
+        if current is None or record['text_confidence'] > current['text_confidence']:
+            best[record['license_plate']] = record
+    return best
+
+
+def write_csv(records, path, append=False):
+    """Write records in the CSV layout. With append, add them to an existing file under
+    that file's own header (files from before track_id have one column fewer)."""
+    path = Path(path)
+    fieldnames = [name for name, _ in CSV_COLUMNS]
+    append = append and path.exists() and path.stat().st_size > 0
+    if append:
+        with open(path, newline='') as f:
+            fieldnames = next(csv.reader(f), None) or fieldnames
+    with open(path, 'a' if append else 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        if not append:
+            writer.writeheader()
+        writer.writerows(records)
+
+
+def read_ndjson(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class PlateResultSink:
+    """Streams plate results to an NDJSON file as they are produced, one typed record per line.
+
+    Only reads passing the confidence and length thresholds are kept, and only when they are
+    a plate's first read of the run or beat its best so far, so the last line for a plate is
+    its best read. A read passed with replaces=<old spelling> is a fuzzy duplicate that
+    upgraded the kept read, and takes the old spelling's place.
+
+    The file is opened in append mode and line-buffered: each record costs one small write,
+    nothing is rebuilt, and a crash loses at most the line being written. export_csv()
+    appends the run's best read per plate to a CSV in the plate_detections.csv layout, so
+    the file keeps every run as it always has.
+    """
+
+    def __init__(self, path, min_confidence=0.7, min_length=7):
+        self.path = Path(path)
+        self.min_confidence = min_confidence
+        self.min_length = min_length
+        self.best = {}  # plate text -> best record this run
+        self._exported = {}  # plate text -> record last appended by export_csv()
+        self._file = None
+        self._lock = threading.Lock()
+
+        # Counters
+        self.records_written = 0
+        self.rejected = 0
+
+    def add(self, detection, replaces=None):
+        """Offer a read; returns True if it was written"""
+        if (detection['text_confidence'] < self.min_confidence or
+                len(detection['license_plate']) < self.min_length):
+            self.rejected += 1
+            return False
+        if replaces == detection['license_plate']:
+            replaces = None
+        record = to_record(dict(detection, replaces=replaces))
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            current = self.best.get(record['license_plate'])
+            if current is not None and record['text_confidence'] <= current['text_confidence']:
+                return False
+            if self._file is None:
+                self.path.parent.mkdir(exist_ok=True, parents=True)
+                self._file = open(self.path, 'a', buffering=1)
+            self._file.write(line)
+            replaced = self.best.get(replaces)
+            if replaced is not None and replaced['text_confidence'] < record['text_confidence']:
+                del self.best[replaces]
+            self.best[record['license_plate']] = record
+            self.records_written += 1
+        return True
+
+    def export_csv(self, path):
+        """Append this run's best read per plate to a CSV, writing the header if the file is new.
+        A record already appended by an earlier call is not written again."""
+        with self._lock:
+            records = [record for plate, record in self.best.items() if self._exported.get(plate) is not record]
+        if not records:
+            logging.info("No new plate detections met the confidence and length threshold")
+            return 0
+        write_csv(records, path, append=True)
+        with self._lock:
+            self._exported.update((record['license_plate'], record) for record in records)
+        logging.info(f"Appended {len(records)} unique high-confidence plate detections to {path}")
+        return len(records)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'plates': len(self.best),
+                'records_written': self.records_written,
+                'rejected': self.rejected,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export plate results from NDJSON to CSV, best read per plate')
+    parser.add_argument('ndjson', help='e.g. output/plate_detections.ndjson')
+    parser.add_argument('csv', help='CSV file to write')
+    args = parser.parse_args()
+    records = list(best_per_plate(read_ndjson(args.ndjson)).values())
+    write_csv(records, args.csv)
+    print(f"Wrote {len(records)} plates to {args.csv}")
+
+
+if __name__ == '__main__':
+    main()
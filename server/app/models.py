@@ -10,6 +10,14 @@ class VehicleType(db.Model):
         return f'<VehicleType {self.name}>'
 
 class ParkingEntry(db.Model):
+    __table_args__ = (
+        # Time-range filters and ORDER BY timestamp DESC; the primary key is implicitly the
+        # last column, so (timestamp, id) keyset pages come straight off this index
+        db.Index('ix_parking_entry_timestamp', 'timestamp'),
+        # A plate's history in time order, and plain license_plate lookups via the prefix
+        db.Index('ix_parking_entry_license_plate_timestamp', 'license_plate', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     license_plate = db.Column(db.String(20), nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
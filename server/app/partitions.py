@@ -0,0 +1,66 @@
+from datetime import date
+import logging
+import os
+
+from sqlalchemy import text
+
+# Set to "monthly" before `flask db upgrade` to range-partition parking_entry by month (MariaDB/MySQL)
+PARTITIONING = os.getenv('PARKING_ENTRY_PARTITIONS', '')
+# Empty monthly partitions kept ready beyond the current month
+MONTHS_AHEAD = int(os.getenv('PARKING_ENTRY_MONTHS_AHEAD', 3))
+
+TABLE = 'parking_entry'
+OVERFLOW = 'pmax'
+
+
+def supports_partitioning(connection):
+    return connection.dialect.name in ('mysql', 'mariadb')
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def month_bounds(first, last):
+    """(partition name, exclusive upper bound) for every month from first to last"""
+    month = date(first.year, first.month, 1)
+    bounds = []
+    while month <= last:
+        bounds.append((f"p{month:%Y%m}", add_months(month, 1)))
+        month = add_months(month, 1)
+    return bounds
+
+
+def partition_clause(bounds):
+    partitions = [f"PARTITION {name} VALUES LESS THAN ('{upper:%Y-%m-%d}')" for name, upper in bounds]
+    partitions.append(f"PARTITION {OVERFLOW} VALUES LESS THAN (MAXVALUE)")
+    return ',\n    '.join(partitions)
+
+
+def monthly_partitions(connection):
+    """Names of the table's monthly partitions, oldest first; empty if it is not partitioned"""
+    if not supports_partitioning(connection):
+        return []
+    rows = connection.execute(text(
+        "SELECT partition_name FROM information_schema.partitions "
+        "WHERE table_schema = DATABASE() AND table_name = :table AND partition_name IS NOT NULL "
+        "ORDER BY partition_ordinal_position"), {'table': TABLE}).scalars().all()
+    return [name for name in rows if name != OVERFLOW]
+
+
+def ensure_monthly_partitions(connection, months_ahead=MONTHS_AHEAD, today=None):
+    """Split the overflow partition so every month up to months_ahead has its own partition.
+    Does nothing if the table is not partitioned. Returns the partitions added."""
+    existing = monthly_partitions(connection)
+    if not existing:
+        return []
+    last = date(int(existing[-1][1:5]), int(existing[-1][5:7]), 1)
+    bounds = month_bounds(add_months(last, 1), add_months(today or date.today(), months_ahead))
+    if not bounds:
+        return []
+    connection.execute(text(f"ALTER TABLE {TABLE} REORGANIZE PARTITION {OVERFLOW} INTO (\n    "
+                            f"{partition_clause(bounds)})"))
+    added = [name for name, _ in bounds]
+    logging.info(f"Added {TABLE} partitions {', '.join(added)}")
+    return added
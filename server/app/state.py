@@ -0,0 +1,130 @@
+from contextlib import contextmanager
+from datetime import datetime
+import logging
+import threading
+
+from sqlalchemy import update
+
+from . import db
+from .models import VehicleType, ParkingOccupancy
+
+# Size of the car park when the database has no occupancy row yet
+DEFAULT_TOTAL_SPACES = 100
+
+
+class OccupancyConflict(Exception):
+    """The occupancy row no longer holds the count this process last wrote"""
+
+
+class VehicleTypeRegistry:
+    """Vehicle type ids by name, loaded once at startup so detections resolve without a query.
+
+    A name not seen before is inserted in its own short transaction, so the cached id stays
+    valid even if the detection that introduced it is rolled back.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            self._ids = {name: type_id for type_id, name in
+                         db.session.query(VehicleType.id, VehicleType.name).all()}
+        logging.info(f"Loaded {len(self._ids)} vehicle types")
+
+    def ids_for(self, names):
+        """Ids for a set of names, creating the missing types"""
+        missing = [name for name in names if name not in self._ids]
+        if missing:
+            with self._lock:
+                missing = [name for name in missing if name not in self._ids]
+                if missing:
+                    with db.engine.begin() as conn:
+                        for name in missing:
+                            result = conn.execute(VehicleType.__table__.insert().values(name=name))
+                            self._ids[name] = result.inserted_primary_key[0]
+                    logging.info(f"Created vehicle types: {', '.join(missing)}")
+        return {name: self._ids[name] for name in names}
+
+
+class OccupancyCounter:
+    """The parking occupancy count, kept in memory and written back once per batch.
+
+    load() reads the occupancy row at startup. update() applies a batch of entries/exits under
+    a lock and stages one conditional UPDATE of the row in the caller's transaction; the lock
+    is held until the caller has committed, so batches reach the row in the order they were
+    counted, and the in-memory count is put back if the caller's block raises. Because the
+    count is committed together with the parking entries it comes from, a restart picks up
+    exactly where the last committed batch left off.
+
+    The UPDATE only matches while the row still holds the count last written here, so an
+    outside change (a manual correction, a second server) raises OccupancyConflict instead of
+    being overwritten; load() again and retry.
+    """
+
+    def __init__(self, default_total=DEFAULT_TOTAL_SPACES):
+        self.default_total = default_total
+        self.row_id = None
+        self.total_spaces = default_total
+        self.occupied_spaces = 0
+        self._lock = threading.Lock()
+
+        # Counters
+        self.batches = 0
+        self.conflicts = 0
+
+    def load(self):
+        with self._lock:
+            occupancy = ParkingOccupancy.query.order_by(ParkingOccupancy.last_updated.desc()).first()
+            if not occupancy:
+                occupancy = ParkingOccupancy(total_spaces=self.default_total, occupied_spaces=0)
+                db.session.add(occupancy)
+                db.session.flush()
+            self.row_id = occupancy.id
+            self.total_spaces = occupancy.total_spaces
+            self.occupied_spaces = occupancy.occupied_spaces
+            db.session.commit()
+        logging.info(f"Occupancy {self.occupied_spaces}/{self.total_spaces} (row {self.row_id})")
+
+    def snapshot(self):
+        return self.occupied_spaces, self.total_spaces
+
+    @contextmanager
+    def update(self, is_entry_flags):
+        """Apply entries/exits in order; yields (occupied, total) for the caller to commit under:
+
+            with occupancy.update(flags):
+                db.session.commit()
+        """
+        with self._lock:
+            if self.row_id is None:
+                raise RuntimeError('OccupancyCounter.load() has not been called')
+            previous = self.occupied_spaces
+            occupied = previous
+            for is_entry in is_entry_flags:
+                occupied = occupied + 1 if is_entry else max(0, occupied - 1)
+            table = ParkingOccupancy.__table__
+            result = db.session.execute(
+                update(table)
+                .where(table.c.id == self.row_id, table.c.occupied_spaces == previous)
+                .values(occupied_spaces=occupied, last_updated=datetime.utcnow())
+            )
+            if result.rowcount != 1:
+                self.conflicts += 1
+                raise OccupancyConflict(f'occupancy row {self.row_id} no longer holds {previous}')
+            self.occupied_spaces = occupied
+            try:
+                yield occupied, self.total_spaces
+            except BaseException:
+                self.occupied_spaces = previous
+                raise
+            self.batches += 1
+
+    def stats(self):
+        return {
+            'occupied_spaces': self.occupied_spaces,
+            'total_spaces': self.total_spaces,
+            'batches': self.batches,
+            'conflicts': self.conflicts,
+        }
@@ -0,0 +1,57 @@
+"""Initial schema: vehicle types, parking entries and occupancy
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00
+
+Databases created by the old db.create_all() already have these tables; only the missing
+ones are created, so `flask db upgrade` adopts an existing database as is.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'vehicle_type' not in existing:
+        op.create_table(
+            'vehicle_type',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=20), nullable=False),
+            sa.Column('description', sa.String(length=100), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+    if 'parking_entry' not in existing:
+        op.create_table(
+            'parking_entry',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('license_plate', sa.String(length=20), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=False),
+            sa.Column('is_entry', sa.Boolean(), nullable=False),
+            sa.Column('vehicle_type_id', sa.Integer(), nullable=True),
+            sa.Column('confidence', sa.Float(), nullable=True),
+            sa.ForeignKeyConstraint(['vehicle_type_id'], ['vehicle_type.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+    if 'parking_occupancy' not in existing:
+        op.create_table(
+            'parking_occupancy',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('total_spaces', sa.Integer(), nullable=False),
+            sa.Column('occupied_spaces', sa.Integer(), nullable=False),
+            sa.Column('last_updated', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+
+def downgrade():
+    op.drop_table('parking_occupancy')
+    op.drop_table('parking_entry')
+    op.drop_table('vehicle_type')
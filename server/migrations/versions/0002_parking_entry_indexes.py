@@ -0,0 +1,38 @@
+"""Index parking_entry by timestamp and by (license_plate, timestamp)
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:10:00
+
+The dashboard filters on a timestamp range and sorts by timestamp; plate lookups want a
+plate's rows in time order. A separate license_plate index would only duplicate the prefix
+of the composite one. Indexes that already exist (a database created from the current
+models) are left alone.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = {
+    'ix_parking_entry_timestamp': ['timestamp'],
+    'ix_parking_entry_license_plate_timestamp': ['license_plate', 'timestamp'],
+}
+
+
+def upgrade():
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('parking_entry')}
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, 'parking_entry', columns)
+
+
+def downgrade():
+    for name in reversed(list(INDEXES)):
+        op.drop_index(name, table_name='parking_entry')
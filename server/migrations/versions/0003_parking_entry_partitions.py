@@ -0,0 +1,59 @@
+"""Optionally range-partition parking_entry by month
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:20:00
+
+Only runs with PARKING_ENTRY_PARTITIONS=monthly on MariaDB/MySQL; otherwise it is recorded
+as applied without changing anything. To partition later, `flask db downgrade 0002` and
+upgrade again with the variable set.
+
+MariaDB requires the partitioning column in every unique key and does not allow foreign keys
+on partitioned tables, so the primary key becomes (id, timestamp) and the vehicle_type_id
+foreign key is dropped (its index stays). Partitions cover every month from the oldest row
+to PARKING_ENTRY_MONTHS_AHEAD months from now, plus an overflow partition that the server
+splits into new months at startup (app/partitions.py). Time-range queries then only touch
+the months they cover, and old months can be dropped with ALTER TABLE ... DROP PARTITION.
+"""
+from datetime import date
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.partitions import (MONTHS_AHEAD, PARTITIONING, TABLE, add_months, month_bounds, monthly_partitions,
+                            partition_clause, supports_partitioning)
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if PARTITIONING != 'monthly' or not supports_partitioning(bind):
+        logging.info(f"Leaving {TABLE} unpartitioned (PARKING_ENTRY_PARTITIONS={PARTITIONING!r}, "
+                     f"{bind.dialect.name})")
+        return
+    if monthly_partitions(bind):
+        return
+    oldest = bind.execute(sa.text(f"SELECT MIN(timestamp) FROM {TABLE}")).scalar()
+    today = date.today()
+    bounds = month_bounds(oldest.date() if oldest else today, add_months(today, MONTHS_AHEAD))
+
+    for foreign_key in sa.inspect(bind).get_foreign_keys(TABLE):
+        op.drop_constraint(foreign_key['name'], TABLE, type_='foreignkey')
+    op.execute(f"ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)")
+    op.execute(f"ALTER TABLE {TABLE} PARTITION BY RANGE COLUMNS(timestamp) (\n    {partition_clause(bounds)})")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if not monthly_partitions(bind):
+        return
+    op.execute(f"ALTER TABLE {TABLE} REMOVE PARTITIONING")
+    op.execute(f"ALTER TABLE {TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+    op.create_foreign_key(None, TABLE, 'vehicle_type', ['vehicle_type_id'], ['id'])
@@ -1,8 +1,12 @@
 from flask import Flask, request, jsonify
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, emit
+from flask_migrate import upgrade
 from app import db, create_app
-from app.models import ParkingEntry, VehicleType, ParkingOccupancy
+from app.models import ParkingEntry
+from app.partitions import ensure_monthly_partitions
+from app.state import OccupancyConflict, OccupancyCounter, VehicleTypeRegistry
 from datetime import datetime
+import json
 import logging
 import os
 from dotenv import load_dotenv
@@ -24,40 +28,141 @@ load_dotenv()
 app = create_app()
 socketio = SocketIO(app, cors_allowed_origins="*")
 
-# Cache for vehicle types
-vehicle_type_cache = {}
-
-def get_vehicle_type(type_name):
-    """Get or create vehicle type from database"""
-    # Only cache the id, not the object
-    if type_name not in vehicle_type_cache:
-        vehicle_type = VehicleType.query.filter_by(name=type_name).first()
-        if not vehicle_type:
-            vehicle_type = VehicleType(name=type_name)
-            db.session.add(vehicle_type)
-            db.session.commit()
-        vehicle_type_cache[type_name] = vehicle_type.id
-    # Always return a session-bound object
-    return VehicleType.query.get(vehicle_type_cache[type_name])
-
-def update_parking_occupancy(is_entry):
-    """Update parking occupancy count"""
-    occupancy = ParkingOccupancy.query.order_by(ParkingOccupancy.last_updated.desc()).first()
-    if not occupancy:
-        # Initialize with default values if no record exists
-        occupancy = ParkingOccupancy(total_spaces=100, occupied_spaces=0)
-        db.session.add(occupancy)
-    
-    # Update occupied spaces
-    if is_entry:
-        occupancy.occupied_spaces += 1
+# Vehicle types and the occupancy count live in memory; see app/state.py
+vehicle_types = VehicleTypeRegistry()
+occupancy = OccupancyCounter()
+with app.app_context():
+    # Bring the schema up to date (server/migrations) and keep monthly partitions ahead of time
+    upgrade()
+    with db.engine.begin() as conn:
+        ensure_monthly_partitions(conn)
+    vehicle_types.load()
+    occupancy.load()
+
+# Largest batch /api/detections accepts in one request
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 1000))
+
+# Socket.IO namespace the dashboards subscribe to; the Jetson stays on the default one
+DASHBOARD_NAMESPACE = '/dashboard'
+
+def parse_detection(detection):
+    """Validate one detection from the Jetson and return the parking_entry fields it maps to.
+    Raises ValueError describing the first problem found."""
+    if not isinstance(detection, dict):
+        raise ValueError('detection must be a JSON object')
+    license_plate = detection.get('license_plate')
+    if not isinstance(license_plate, str) or not 0 < len(license_plate) <= 20:
+        raise ValueError('license_plate must be a string of 1-20 characters')
+    vehicle_type_name = detection.get('vehicle_type')
+    if not isinstance(vehicle_type_name, str) or not 0 < len(vehicle_type_name) <= 20:
+        raise ValueError('vehicle_type must be a string of 1-20 characters')
+    confidence = detection.get('text_confidence', detection.get('confidence'))
+    if confidence is not None and (isinstance(confidence, bool) or not isinstance(confidence, (int, float))):
+        raise ValueError('text_confidence must be a number')
+    # Set by the detector's counting line or camera role; older detectors only report entries
+    is_entry = detection.get('is_entry', True)
+    if not isinstance(is_entry, bool):
+        raise ValueError('is_entry must be true or false')
+    # Compose datetime from date and time, or take an ISO timestamp
+    if detection.get('date') is not None or detection.get('time') is not None:
+        dt = datetime.strptime(f"{detection.get('date')} {detection.get('time')}", "%Y-%m-%d %H:%M:%S")
+    elif isinstance(detection.get('timestamp'), str):
+        dt = datetime.fromisoformat(detection['timestamp'])
     else:
-        occupancy.occupied_spaces = max(0, occupancy.occupied_spaces - 1)
-    
-    occupancy.last_updated = datetime.utcnow()
-    db.session.commit()
-    
-    return occupancy
+        raise ValueError('date and time (or an ISO timestamp) are required')
+    return {
+        'license_plate': license_plate,
+        'timestamp': dt,
+        'is_entry': is_entry,
+        'vehicle_type': vehicle_type_name,
+        'confidence': confidence,
+    }
+
+def occupancy_event(occupied, total):
+    return {
+        'occupied_spaces': occupied,
+        'total_spaces': total,
+        'percentage': int(occupied / total * 100) if total else 0,
+    }
+
+def publish_detections(rows, entry_ids, occupied, total):
+    """Push committed detections and the new occupancy to the dashboards.
+    Without the new rows' ids (no INSERT ... RETURNING) the dashboards are told to catch up."""
+    try:
+        if entry_ids is None:
+            entries = None
+        else:
+            entries = [
+                {
+                    'id': entry_id,
+                    'license_plate': row['license_plate'],
+                    'timestamp': row['timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
+                    'is_entry': row['is_entry'],
+                    'vehicle_type': row['vehicle_type'],
+                    'confidence': row['confidence'],
+                }
+                for row, entry_id in zip(rows, entry_ids)
+            ]
+        socketio.emit('parking_entries', {'entries': entries, 'count': len(rows)}, namespace=DASHBOARD_NAMESPACE)
+        socketio.emit('occupancy', occupancy_event(occupied, total), namespace=DASHBOARD_NAMESPACE)
+    except Exception as e:
+        # The detections are committed; a dashboard that missed them catches up on reconnect
+        logging.error(f"Failed to publish detections: {str(e)}")
+
+def commit_detections(rows):
+    """Insert parsed detections and apply them to the occupancy count in one transaction,
+    then publish them to the dashboards. Returns (occupied, total); the caller rolls back on errors."""
+    table = ParkingEntry.__table__
+    # The dashboards want the new ids; MariaDB 10.5+ and SQLite return them from the bulk insert
+    returning = db.engine.dialect.insert_executemany_returning_sort_by_parameter_order
+    for attempt in range(2):
+        type_ids = vehicle_types.ids_for({row['vehicle_type'] for row in rows})
+        insert = table.insert().returning(table.c.id, sort_by_parameter_order=True) if returning \
+            else table.insert()
+        result = db.session.execute(insert, [
+            {
+                'license_plate': row['license_plate'],
+                'timestamp': row['timestamp'],
+                'is_entry': row['is_entry'],
+                'vehicle_type_id': type_ids[row['vehicle_type']],
+                'confidence': row['confidence'],
+            }
+            for row in rows
+        ])
+        entry_ids = result.scalars().all() if returning else None
+        try:
+            with occupancy.update([row['is_entry'] for row in rows]) as counts:
+                db.session.commit()
+                # Still under the occupancy lock, so dashboards see the counts in order
+                publish_detections(rows, entry_ids, *counts)
+            return counts
+        except OccupancyConflict as e:
+            # The row was changed outside this process: start over from what it holds now
+            db.session.rollback()
+            if attempt:
+                raise
+            logging.warning(f"{str(e)}, reloading occupancy")
+            occupancy.load()
+
+def read_batch_body():
+    """Detections from a JSON array ({"detections": [...]} also works) or an NDJSON body.
+    Returns a list of (detection, parse error) pairs, one per item or line."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json-seq'):
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append((json.loads(line), None))
+            except ValueError as e:
+                items.append((None, f'invalid JSON: {e}'))
+        return items
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get('detections')
+    if not isinstance(body, list):
+        return None
+    return [(item, None) for item in body]
 
 @app.route('/api/detection', methods=['POST'])
 def api_detection():
@@ -66,32 +171,13 @@ def api_detection():
         if not detection:
             return jsonify({'error': 'No data received'}), 400
 
-        # Extract fields from detection
-        license_plate = detection.get('license_plate')
-        vehicle_type_name = detection.get('vehicle_type')
-        text_confidence = detection.get('text_confidence')
-        vehicle_confidence = detection.get('vehicle_confidence')
-        frame_number = detection.get('frame_number')
-        timestamp = detection.get('timestamp')
-        date = detection.get('date')
-        time_str = detection.get('time')
-
-        # Find or create vehicle type
-        vehicle_type = get_vehicle_type(vehicle_type_name)
-
-        # Compose datetime from date and time
-        dt = datetime.strptime(f"{date} {time_str}", "%Y-%m-%d %H:%M:%S")
-
-        # Create parking entry (assume entry for now)
-        entry = ParkingEntry(
-            license_plate=license_plate,
-            timestamp=dt,
-            is_entry=True,  # or add logic to determine entry/exit
-            vehicle_type_id=vehicle_type.id,
-            confidence=text_confidence  # or combine with vehicle_confidence if you want
-        )
-        db.session.add(entry)
-        db.session.commit()
+        try:
+            fields = parse_detection(detection)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Commits the entry together with the occupancy change
+        commit_detections([fields])
 
         return jsonify({'status': 'success'}), 200
 
@@ -99,10 +185,57 @@ def api_detection():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/detections', methods=['POST'])
+def api_detections():
+    """Batch ingestion: validate every detection, bulk-insert the valid ones and update occupancy
+    in a single transaction, and report per item. Invalid items do not block the rest."""
+    items = read_batch_body()
+    if items is None:
+        return jsonify({'error': 'Expected a JSON array of detections or an NDJSON body'}), 400
+    if not items:
+        return jsonify({'error': 'No data received'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {BATCH_MAX_ITEMS} detections per request'}), 413
+
+    results = []
+    rows = []
+    for index, (detection, error) in enumerate(items):
+        if error is None:
+            try:
+                rows.append((index, parse_detection(detection)))
+                results.append({'index': index, 'status': 'ok'})
+                continue
+            except (ValueError, TypeError) as e:
+                error = str(e)
+        results.append({'index': index, 'status': 'error', 'error': error})
+
+    if rows:
+        try:
+            occupied, total = commit_detections([row for _, row in rows])
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Batch of {len(rows)} detections failed: {str(e)}")
+            for index, _ in rows:
+                results[index] = {'index': index, 'status': 'error', 'error': 'database error'}
+            return jsonify({'status': 'error', 'error': str(e), 'inserted': 0,
+                            'failed': len(results), 'results': results}), 500
+        logging.info(f"Batch ingested {len(rows)}/{len(items)} detections, "
+                     f"occupancy {occupied}/{total}")
+
+    failed = len(items) - len(rows)
+    status = 'success' if not failed else ('partial' if rows else 'error')
+    return jsonify({'status': status, 'inserted': len(rows), 'failed': failed,
+                    'results': results}), 200 if rows else 400
+
 @socketio.on('connect')
 def handle_connect():
     logging.info('Jetson connected')
 
+@socketio.on('connect', namespace=DASHBOARD_NAMESPACE)
+def handle_dashboard_connect():
+    # Current occupancy straight from memory; entries are caught up through the dashboard's since_id API
+    emit('occupancy', occupancy_event(*occupancy.snapshot()))
+
 @socketio.on('disconnect')
 def handle_disconnect():
     logging.info('Jetson disconnected')
@@ -114,38 +247,29 @@ def handle_detection(data):
         detections = data.get('detections', [])
         fps = data.get('fps', 0)
         
+        rows = []
         for detection in detections:
             # Skip if we can't determine entry/exit
             if detection.get('is_entry') is None:
                 continue
-            
-            # Get vehicle type
-            vehicle_type = get_vehicle_type(detection['vehicle_type'])
-            
-            # Create parking entry
-            entry = ParkingEntry(
-                license_plate=detection['license_plate'],
-                timestamp=datetime.fromisoformat(detection['timestamp']),
-                is_entry=detection['is_entry'],
-                vehicle_type_id=vehicle_type.id,
-                confidence=detection['confidence']
-            )
-            
-            db.session.add(entry)
-            
-            # Update occupancy
-            occupancy = update_parking_occupancy(detection['is_entry'])
-            
+            try:
+                rows.append(parse_detection(detection))
+            except (ValueError, TypeError) as e:
+                logging.warning(f"Skipping invalid detection: {str(e)}")
+        if not rows:
+            return
+
+        # One transaction and one occupancy write for the whole event
+        occupied, total = commit_detections(rows)
+        for row in rows:
             logging.info(
-                f"Processed {'entry' if detection['is_entry'] else 'exit'}: "
-                f"Plate: {detection['license_plate']}, "
-                f"Type: {detection['vehicle_type']}, "
-                f"Confidence: {detection['confidence']:.2f}, "
-                f"Occupancy: {occupancy.occupied_spaces}/{occupancy.total_spaces}"
+                f"Processed {'entry' if row['is_entry'] else 'exit'}: "
+                f"Plate: {row['license_plate']}, "
+                f"Type: {row['vehicle_type']}, "
+                f"Confidence: {row['confidence'] or 0:.2f}"
             )
-        
-        db.session.commit()
-        
+        logging.info(f"Occupancy: {occupied}/{total}")
+
     except Exception as e:
         logging.error(f"Error processing detection: {str(e)}")
         db.session.rollback()
@@ -155,7 +279,10 @@ def handle_status(data):
     """Handle status updates from Jetson"""
     fps = data.get('fps', 0)
     running = data.get('running', False)
-    logging.info(f"Jetson status - FPS: {fps}, Running: {running}")
+    frame_skip = data.get('frame_skip', 1)
+    inference_size = data.get('inference_size')
+    logging.info(f"Jetson status - FPS: {fps}, Running: {running}, "
+                 f"Frame skip: {frame_skip}, Inference size: {inference_size}")
 
 if __name__ == '__main__':
     # Get port from environment variable or use default
@@ -0,0 +1,270 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class DetectionSpool:
+    """Append-only on-disk queue (SQLite in WAL mode) of detections waiting for the server.
+
+    append() is a single local INSERT, so the detection loop never waits on the
+    network. Rows are removed with ack() once the replayer has committed them on
+    the server. The spool holds at most max_rows; past that the oldest rows are
+    discarded and counted in `dropped`. Rows the server keeps rejecting are moved to a
+    dead_letter table (see SpoolReplayer) so they stop blocking the rows behind them.
+    """
+
+    def __init__(self, path, max_rows=200000):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        # Set whenever there is something to replay
+        self.has_data = threading.Event()
+
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA journal_size_limit=16777216")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "created REAL NOT NULL, "
+            "detection TEXT NOT NULL)"
+        )
+        # Spools written before rows had an attempt count
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(spool)")]
+        if 'attempts' not in columns:
+            self._conn.execute("ALTER TABLE spool ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            "id INTEGER PRIMARY KEY, "
+            "created REAL NOT NULL, "
+            "failed REAL NOT NULL, "
+            "attempts INTEGER NOT NULL, "
+            "error TEXT, "
+            "detection TEXT NOT NULL)"
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        if self._count:
+            logging.info(f"Spool {self.path} has {self._count} detections left from a previous run")
+            self.has_data.set()
+
+        # Counters
+        self.appended = 0
+        self.acked = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+
+    def append(self, detection):
+        payload = json.dumps(detection)
+        with self._lock:
+            self._conn.execute("INSERT INTO spool (created, detection) VALUES (?, ?)", (time.time(), payload))
+            self._count += 1
+            self.appended += 1
+            if self._count > self.max_rows:
+                excess = self._count - self.max_rows
+                self._conn.execute(
+                    "DELETE FROM spool WHERE id IN (SELECT id FROM spool ORDER BY id LIMIT ?)", (excess,))
+                self._count -= excess
+                self.dropped += excess
+                logging.warning(f"Spool full ({self.max_rows} rows), discarded {excess} oldest detections")
+        self.has_data.set()
+
+    def peek(self, limit):
+        """Return up to limit of the oldest (id, detection) pairs without removing them"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, detection FROM spool ORDER BY id LIMIT ?", (limit,)).fetchall()
+            if not rows:
+                self.has_data.clear()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def ack(self, last_id):
+        """Remove every row up to and including last_id"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM spool WHERE id <= ?", (last_id,))
+            self._count -= cursor.rowcount
+            self.acked += cursor.rowcount
+
+    def record_failure(self, row_id):
+        """Count a failed attempt at one row; returns its attempts so far"""
+        with self._lock:
+            self._conn.execute("UPDATE spool SET attempts = attempts + 1 WHERE id = ?", (row_id,))
+            row = self._conn.execute("SELECT attempts FROM spool WHERE id = ?", (row_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _move_to_dead_letter(self, row_id, error):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO dead_letter (id, created, failed, attempts, error, detection) "
+            "SELECT id, created, ?, attempts, ?, detection FROM spool WHERE id = ?",
+            (time.time(), str(error), row_id))
+        return self._conn.execute("DELETE FROM spool WHERE id = ?", (row_id,)).rowcount
+
+    def dead_letter(self, row_id, error):
+        """Move a row the server will not take out of the queue, keeping it for inspection"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            moved = self._move_to_dead_letter(row_id, error)
+            self._conn.execute("COMMIT")
+            self._count -= moved
+            self.dead_lettered += moved
+
+    def bury(self, detection, error):
+        """Put a detection the server refused, that was never spooled, straight into dead_letter.
+        It passes through the spool table to get an id no spooled row will reuse."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            cursor = self._conn.execute("INSERT INTO spool (created, attempts, detection) VALUES (?, 1, ?)",
+                                        (time.time(), json.dumps(detection)))
+            self.dead_lettered += self._move_to_dead_letter(cursor.lastrowid, error)
+            self._conn.execute("COMMIT")
+
+    def backlog(self):
+        with self._lock:
+            return self._count
+
+    def oldest_age(self):
+        """Seconds since the oldest unsent detection was spooled"""
+        with self._lock:
+            oldest = self._conn.execute("SELECT MIN(created) FROM spool").fetchone()[0]
+        return round(time.time() - oldest, 1) if oldest else 0.0
+
+    def stats(self):
+        return {
+            'backlog': self.backlog(),
+            'oldest_age_s': self.oldest_age(),
+            'appended': self.appended,
+            'acked': self.acked,
+            'dropped': self.dropped,
+            'dead_lettered': self.dead_lettered,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Errors that mean the server will never take the row as it is, as opposed to it being unreachable
+PERMANENT_ERRORS = ('DataError', 'IntegrityError')
+
+
+def is_permanent(error):
+    """A rejected or malformed row (DB-API DataError/IntegrityError, a detection missing fields)"""
+    return isinstance(error, (KeyError, TypeError, ValueError)) or type(error).__name__ in PERMANENT_ERRORS
+
+
+class SpoolReplayer(threading.Thread):
+    """Drains a DetectionSpool to the server in order, in batches, backing off while it is unreachable.
+
+    When a batch is rejected (is_permanent), its rows are retried one at a time to find the bad
+    ones. A row that has been rejected max_attempts times is moved to the spool's dead_letter
+    table and logged, so it does not hold up everything spooled after it. Rows write_batch()
+    reports as refused by index (the server's batch endpoint validates each item) are
+    dead-lettered at once. Connection errors are only retried with backoff; they never
+    dead-letter a row.
+    """
+
+    def __init__(self, spool, write_batch, batch_size=50, min_backoff=1.0, max_backoff=60.0, report_interval=30.0,
+                 max_attempts=5):
+        super().__init__(name='spool-replayer', daemon=True)
+        self.spool = spool
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.report_interval = report_interval
+        self.max_attempts = max_attempts
+        self._stop_event = threading.Event()
+
+        self.replayed = 0
+        self.failures = 0  # Consecutive failed attempts
+        self.backoff = 0.0
+
+    def replay_batch(self):
+        """Send the oldest batch; returns the number of detections sent (0 if the spool is empty)"""
+        batch = self.spool.peek(self.batch_size)
+        if not batch:
+            return 0
+        try:
+            rejected = self.write_batch([detection for _, detection in batch])
+        except Exception as e:
+            if not is_permanent(e):
+                raise
+            return self.replay_rows(batch)
+        for index, error in rejected or ():
+            self.reject(batch[index], error)
+        self.spool.ack(batch[-1][0])
+        self.replayed += len(batch) - len(rejected or ())
+        return len(batch)
+
+    def replay_rows(self, batch):
+        """Send a rejected batch row by row, in order, dead-lettering rows that keep failing"""
+        for row_id, detection in batch:
+            try:
+                rejected = self.write_batch([detection])
+            except Exception as e:
+                if not is_permanent(e) or self.spool.record_failure(row_id) < self.max_attempts:
+                    raise
+                self.reject((row_id, detection), e)
+                continue
+            if rejected:
+                self.reject((row_id, detection), rejected[0][1])
+                continue
+            self.spool.ack(row_id)
+            self.replayed += 1
+        return len(batch)
+
+    def reject(self, row, error):
+        row_id, detection = row
+        self.spool.dead_letter(row_id, error)
+        logging.error(f"Spooled detection {row_id} rejected, moved to dead_letter: "
+                      f"{detection.get('license_plate') if isinstance(detection, dict) else detection} ({error})")
+
+    def run(self):
+        last_report = time.monotonic()
+        while not self._stop_event.is_set():
+            if not self.spool.has_data.wait(0.5):
+                continue
+            try:
+                self.replay_batch()
+                if self.failures:
+                    logging.info(f"DB reachable again after {self.failures} failed attempts, "
+                                 f"backlog {self.spool.backlog()}")
+                self.failures = 0
+                self.backoff = 0.0
+            except Exception as e:
+                self.failures += 1
+                self.backoff = min(self.max_backoff, self.min_backoff * 2 ** (self.failures - 1))
+                logging.warning(f"Spool replay failed ({e}); backlog {self.spool.backlog()}, "
+                                f"retrying in {self.backoff:.1f}s")
+                self._stop_event.wait(self.backoff)
+            if time.monotonic() - last_report >= self.report_interval:
+                if self.spool.backlog():
+                    logging.info(f"Spool backlog: {self.spool.stats()}")
+                last_report = time.monotonic()
+
+    def stop(self, drain_timeout=5.0):
+        """Stop the thread, then make one last attempt to send what is left.
+        Anything that still cannot be sent stays in the spool for the next start."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        deadline = time.monotonic() + drain_timeout
+        try:
+            while time.monotonic() < deadline and self.replay_batch():
+                pass
+        except Exception as e:
+            logging.warning(f"Final spool drain failed: {e}")
+        logging.info(f"Spool replayer stopped: replayed {self.replayed}, backlog {self.spool.backlog()}")
+
+    def stats(self):
+        stats = self.spool.stats()
+        stats.update({
+            'replayed': self.replayed,
+            'consecutive_failures': self.failures,
+            'backoff_s': self.backoff,
+        })
+        return stats
@@ -0,0 +1,47 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+# Close to process start: the detector scripts import this before their other modules
+STARTED = time.monotonic()
+
+
+class ReadinessSignal:
+    """Tells orchestration that the detector is loaded, warmed up and about to read frames.
+
+    set() logs a "READY" line, publishes the state to whoever polls is_set() (the metrics
+    server's /ready endpoint) and, when a path is given, writes a small JSON file there
+    atomically so a startup probe can test for it. clear() removes the file again.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self._event = threading.Event()
+        self.info = {}
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def set(self, **info):
+        if self._event.is_set():
+            return
+        self.info = dict(info, pid=os.getpid(), seconds_since_start=round(time.monotonic() - STARTED, 3))
+        if self.path is not None:
+            self.path.parent.mkdir(exist_ok=True, parents=True)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.write_text(json.dumps(self.info))
+            os.replace(tmp, self.path)
+        self._event.set()
+        logging.info(f"READY {self.info['seconds_since_start']:.2f}s after start" +
+                     (f", signalled at {self.path}" if self.path else ""))
+
+    def clear(self):
+        self._event.clear()
+        if self.path is not None:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,75 @@
+import logging
+import threading
+
+
+class StatusReporter:
+    """Pushes a detector_status event to the Pi server's Socket.IO endpoint every interval seconds.
+
+    Disabled when no server URL is configured or python-socketio is not installed;
+    update() is always safe to call. Sources added with add_source() are called at send
+    time and their dicts merged in, for data too costly to refresh on every frame.
+    """
+
+    def __init__(self, server_url, interval=5.0):
+        self.server_url = server_url
+        self.interval = interval
+        self._status = {'running': False, 'fps': 0}
+        self._sources = {}  # key -> callable returning that key's value
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def update(self, **fields):
+        with self._lock:
+            self._status.update(fields)
+
+    def add_source(self, key, fn):
+        self._sources[key] = fn
+
+    def snapshot(self):
+        with self._lock:
+            status = dict(self._status)
+        for key, fn in list(self._sources.items()):
+            try:
+                status[key] = fn()
+            except Exception as e:
+                logging.debug(f"Status source {key} failed: {e}")
+        return status
+
+    def start(self):
+        if not self.server_url or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='status-reporter', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            import socketio
+        except ImportError:
+            logging.warning("python-socketio is not installed, detector_status reporting disabled")
+            return
+        client = socketio.Client(reconnection=False)
+        failing = False
+        while True:
+            stopping = self._stop_event.is_set()
+            try:
+                if not client.connected:
+                    client.connect(self.server_url, wait_timeout=5)
+                client.emit('detector_status', self.snapshot())
+                failing = False
+            except Exception as e:
+                if not failing:
+                    logging.warning(f"Could not send detector_status to {self.server_url}: {e}")
+                failing = True
+            if stopping:
+                break
+            self._stop_event.wait(self.interval)
+        if client.connected:
+            client.disconnect()
+
+    def stop(self):
+        """Send a final status and stop reporting"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
@@ -0,0 +1,225 @@
+import itertools
+import threading
+
+
+def iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+class Track:
+    def __init__(self, track_id, vehicle, frame_number):
+        self.track_id = track_id
+        self.bbox = vehicle['bbox']
+        self.vehicle_type = vehicle['vehicle_type']
+        self.first_seen = frame_number
+        self.last_seen = frame_number
+        self.hits = 1
+
+        # OCR scheduling
+        self.ocr_attempts = 0
+        self.last_ocr_frame = None
+        self.best = None  # Highest-confidence detection read for this vehicle so far
+        self.locked = False  # A confident read was found, stop running OCR
+        self.emitted = False  # best has been handed on for persistence
+
+        # Line crossing
+        self.side = None  # Last settled side of the counting line
+        self.crossings = []  # is_entry of each crossing not yet emitted
+
+    def centroid(self):
+        x1, y1, x2, y2 = self.bbox
+        return (x1 + x2) / 2, (y1 + y2) / 2
+
+
+class VehicleTracker:
+    """Gives each vehicle a stable track id across frames by greedy IoU matching of YOLO boxes,
+    and decides when a track's crop is worth sending to OCR.
+
+    A track is OCR'd on its first eligible frame and then every ocr_interval frames, at most
+    max_ocr_samples times. It locks as soon as a read reaches lock_confidence; the locked read
+    is emitted immediately. A track that never locks emits its best read when it ends, i.e.
+    after going unmatched for more than max_missed frames.
+
+    With a counting line (line_crossing.CountingLine) a read is only an event once its
+    vehicle crosses the line: each crossing emits one copy of the track's read with
+    is_entry from the direction of travel, as soon as the track is locked or has ended.
+    Vehicles that never cross, e.g. cars lingering in view, emit nothing.
+
+    An ended track stops being matched at once but stays readable until collect() is given it:
+    the pipelined runner calls update() a few frames ahead of collect(), so reads for a track
+    may still be in flight when it ends.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=30, ocr_interval=10, max_ocr_samples=5,
+                 lock_confidence=0.9, line=None):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.ocr_interval = ocr_interval
+        self.max_ocr_samples = max_ocr_samples
+        self.lock_confidence = lock_confidence
+        self.line = line
+        self.tracks = {}
+        self._ending = {}  # Ended tracks not yet passed to collect(), by id
+        self._crossed = set()  # Live track ids with crossings waiting for a read
+        self._ids = itertools.count(1)
+        # Stages of the pipelined runner touch the tracker from different threads
+        self._lock = threading.Lock()
+
+        # Counters
+        self.ocr_scheduled = 0
+        self.ocr_skipped = 0
+        self.crossings = 0
+        self.uncrossed = 0  # Tracks with a read that ended without crossing the line
+        self.unread_crossings = 0  # Crossings whose track ended without a plate read
+
+    def update(self, vehicles, frame_number):
+        """Match this frame's vehicles to tracks, setting vehicle['track_id'].
+        Returns the tracks that ended on this frame."""
+        with self._lock:
+            pairs = []
+            for track_id, track in self.tracks.items():
+                for i, vehicle in enumerate(vehicles):
+                    overlap = iou(track.bbox, vehicle['bbox'])
+                    if overlap >= self.iou_threshold:
+                        pairs.append((overlap, track_id, i))
+            pairs.sort(reverse=True)
+
+            matched_tracks = set()
+            matched_vehicles = set()
+            for _, track_id, i in pairs:
+                if track_id in matched_tracks or i in matched_vehicles:
+                    continue
+                track = self.tracks[track_id]
+                track.bbox = vehicles[i]['bbox']
+                track.vehicle_type = vehicles[i]['vehicle_type']
+                track.last_seen = frame_number
+                track.hits += 1
+                vehicles[i]['track_id'] = track_id
+                if self.line is not None:
+                    track.side, is_entry = self.line.crossing(track.side, track.centroid())
+                    if is_entry is not None:
+                        track.crossings.append(is_entry)
+                        self._crossed.add(track_id)
+                        self.crossings += 1
+                matched_tracks.add(track_id)
+                matched_vehicles.add(i)
+
+            for i, vehicle in enumerate(vehicles):
+                if i not in matched_vehicles:
+                    track = Track(next(self._ids), vehicle, frame_number)
+                    if self.line is not None:
+                        track.side = self.line.side(track.centroid()) or None
+                    self.tracks[track.track_id] = track
+                    vehicle['track_id'] = track.track_id
+
+            ended = [track for track in self.tracks.values()
+                     if frame_number - track.last_seen > self.max_missed]
+            for track in ended:
+                del self.tracks[track.track_id]
+                self._ending[track.track_id] = track
+                self._crossed.discard(track.track_id)
+            return ended
+
+    def _track(self, track_id):
+        """A live track, or one that ended but has not been collected yet"""
+        return self.tracks.get(track_id) or self._ending.get(track_id)
+
+    def schedule_ocr(self, track_id, frame_number):
+        """True if this track's crop should be OCR'd on this frame; counts the attempt"""
+        with self._lock:
+            track = self._track(track_id)
+            if (track is None or track.locked or track.ocr_attempts >= self.max_ocr_samples or
+                    (track.last_ocr_frame is not None and
+                     frame_number - track.last_ocr_frame < self.ocr_interval)):
+                self.ocr_skipped += 1
+                return False
+            track.ocr_attempts += 1
+            track.last_ocr_frame = frame_number
+            self.ocr_scheduled += 1
+            return True
+
+    def collect(self, plates, ended_tracks=()):
+        """Fold plate reads (dicts with a 'detection' carrying its track_id) into their tracks.
+        Returns the detections to persist: a track's read as soon as it locks, and the best
+        read of each ended track that never locked."""
+        if self.line is not None:
+            return self._collect_crossings(plates, ended_tracks)
+        ready = []
+        with self._lock:
+            for plate in plates:
+                detection = plate['detection']
+                track = self._track(detection.get('track_id'))
+                if track is None or track.emitted:
+                    continue
+                if track.best is None or detection['text_confidence'] > track.best['text_confidence']:
+                    track.best = detection
+                if detection['text_confidence'] >= self.lock_confidence:
+                    track.locked = True
+                    track.emitted = True
+                    ready.append(track.best)
+            for track in ended_tracks:
+                self._ending.pop(track.track_id, None)
+                if track.best is not None and not track.emitted:
+                    track.emitted = True
+                    ready.append(track.best)
+        return ready
+
+    def _collect_crossings(self, plates, ended_tracks):
+        ready = []
+        with self._lock:
+            for plate in plates:
+                detection = plate['detection']
+                track = self._track(detection.get('track_id'))
+                if track is None:
+                    continue
+                if track.best is None or detection['text_confidence'] > track.best['text_confidence']:
+                    track.best = detection
+                if detection['text_confidence'] >= self.lock_confidence:
+                    track.locked = True
+
+            live = [self.tracks[track_id] for track_id in self._crossed if self.tracks[track_id].locked]
+            for track in ended_tracks:
+                self._ending.pop(track.track_id, None)
+            for track in live + list(ended_tracks):
+                if not track.crossings:
+                    if track.best is not None and not track.emitted:
+                        self.uncrossed += 1
+                    continue
+                if track.best is None:
+                    self.unread_crossings += len(track.crossings)
+                    track.crossings.clear()
+                    continue
+                for is_entry in track.crossings:
+                    ready.append(dict(track.best, is_entry=is_entry))
+                track.crossings.clear()
+                track.emitted = True
+                self._crossed.discard(track.track_id)
+        return ready
+
+    def flush(self):
+        """End every live track (e.g. at end of video) and return their unemitted best reads"""
+        with self._lock:
+            ended = list(self._ending.values()) + list(self.tracks.values())
+            self.tracks.clear()
+            self._crossed.clear()
+        return self.collect([], ended)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active_tracks': len(self.tracks),
+                'ending_tracks': len(self._ending),
+                'ocr_scheduled': self.ocr_scheduled,
+                'ocr_skipped': self.ocr_skipped,
+                'crossings': self.crossings,
+                'uncrossed': self.uncrossed,
+                'unread_crossings': self.unread_crossings,
+            }
@@ -1,9 +1,24 @@
 from flask import Flask, render_template, jsonify, request
 import mysql.connector
 from datetime import datetime
+import os
 
 app = Flask(__name__)
 
+# Rows per page of /api/parking-data; clients may ask for fewer, never more than the cap
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 100))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 500))
+
+# The Pi server's Socket.IO endpoint, which pushes new entries and occupancy to the page
+PI_SERVER_URL = os.getenv('PI_SERVER_URL', 'http://10.60.35.183:5000')
+
+# Only what the table shows, with the vehicle type's name instead of its id
+PARKING_DATA_COLUMNS = """
+    SELECT e.id, e.license_plate, e.timestamp, e.is_entry, t.name AS vehicle_type, e.confidence
+    FROM parking_entry e
+    LEFT JOIN vehicle_type t ON t.id = e.vehicle_type_id
+"""
+
 def get_db_connection():
     return mysql.connector.connect(
         host="10.60.35.183",
@@ -15,48 +30,118 @@ def get_db_connection():
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', pi_server_url=PI_SERVER_URL)
+
+def parse_cursor(cursor):
+    """(timestamp, id) of the last row of the previous page, from its "timestamp|id" cursor"""
+    timestamp, _, entry_id = cursor.rpartition('|')
+    return datetime.fromisoformat(timestamp), int(entry_id)
+
+def make_cursor(entry):
+    return f"{entry['timestamp'].isoformat()}|{entry['id']}"
+
+def fetch_entries(query, params):
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query, params)
+        entries = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    return entries
+
+def serialize_entries(entries):
+    """Convert datetime objects to strings for JSON serialization"""
+    for entry in entries:
+        if isinstance(entry['timestamp'], datetime):
+            entry['timestamp'] = entry['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+        entry['is_entry'] = bool(entry['is_entry'])
+    return entries
 
 @app.route('/api/parking-data')
 def get_parking_data():
+    """One page of parking entries, newest first.
+
+    Pages are keyed on (timestamp, id): pass the previous response's next_cursor as `cursor`
+    to get the rows after it. Each page is an index range scan of `limit` rows however deep
+    it is, unlike OFFSET, and rows inserted meanwhile do not shift the pages.
+    """
     try:
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
-        
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Base query
-        query = "SELECT * FROM parking_entry"
+        try:
+            limit = min(max(int(request.args.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+            after = parse_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except ValueError:
+            return jsonify({
+                'status': 'error',
+                'message': 'limit must be an integer and cursor a next_cursor value'
+            }), 400
+
+        conditions = []
         params = []
-        
+
         # Add date filters if provided
-        if start_date and end_date:
-            query += " WHERE timestamp BETWEEN %s AND %s"
-            params.extend([start_date, end_date])
-        elif start_date:
-            query += " WHERE timestamp >= %s"
+        if start_date:
+            conditions.append("e.timestamp >= %s")
             params.append(start_date)
-        elif end_date:
-            query += " WHERE timestamp <= %s"
+        if end_date:
+            conditions.append("e.timestamp <= %s")
             params.append(end_date)
-            
-        query += " ORDER BY timestamp DESC"
-        
-        cursor.execute(query, params)
-        entries = cursor.fetchall()
-        
-        # Convert datetime objects to strings for JSON serialization
-        for entry in entries:
-            if isinstance(entry['timestamp'], datetime):
-                entry['timestamp'] = entry['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-        
-        cursor.close()
-        conn.close()
-        
+        if after:
+            # Written out rather than as a row comparison so MariaDB uses the timestamp index
+            conditions.append("e.timestamp <= %s AND (e.timestamp < %s OR e.id < %s)")
+            params.extend([after[0], after[0], after[1]])
+
+        query = PARKING_DATA_COLUMNS
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # One extra row tells whether there is another page
+        query += " ORDER BY e.timestamp DESC, e.id DESC LIMIT %s"
+        params.append(limit + 1)
+
+        entries = fetch_entries(query, params)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        next_cursor = make_cursor(entries[-1]) if has_more else None
+
+        return jsonify({
+            'status': 'success',
+            'data': serialize_entries(entries),
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/api/parking-data/since')
+def get_parking_data_since():
+    """Entries added after `since_id`, oldest first, for a dashboard catching up on what was
+    pushed while it was disconnected. Read by primary key, up to `limit` rows at a time."""
+    try:
+        try:
+            since_id = int(request.args['since_id'])
+            limit = min(max(int(request.args.get('limit', MAX_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except (KeyError, ValueError):
+            return jsonify({
+                'status': 'error',
+                'message': 'since_id must be an entry id and limit an integer'
+            }), 400
+
+        query = PARKING_DATA_COLUMNS + " WHERE e.id > %s ORDER BY e.id LIMIT %s"
+        entries = fetch_entries(query, [since_id, limit + 1])
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
         return jsonify({
             'status': 'success',
-            'data': entries
+            'data': serialize_entries(entries),
+            'last_id': entries[-1]['id'] if entries else since_id,
+            'has_more': has_more
         })
     except Exception as e:
         return jsonify({